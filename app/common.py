@@ -1,4 +1,5 @@
 """_summary_"""
+import importlib.util
 import typing
 from dataclasses import dataclass
 from enum import Enum
@@ -33,8 +34,20 @@ class Common:
     buffer_options = ["0", "1", "2", "3", "4", "5"]
 
     # Report variables
-    formats = ["CSV", "XLSX"]
+    # Parquet needs the optional pyarrow dependency
+    formats = ["CSV", "XLSX"] + (
+        ["PARQUET"] if importlib.util.find_spec("pyarrow") is not None else []
+    )
 
-    batch_size = ["8", "16", "32", "64", "128", "256"]
+    batch_size = ["Auto", "8", "16", "32", "64", "128", "256"]
+
+    encoder_profiles = ["archive", "review", "fast", "auto"]
+
+    # Lower case extensions of the videos processed from a folder
+    # TODO: test all these file types
+    video_extensions = (".mp4", ".m4a", ".avi", ".mkv", ".mov", ".wmv")
 
     weights_folder = Path(r"data/models")
+
+    # Folder for caches that can be safely deleted
+    cache_folder = Path(r"data/cache")
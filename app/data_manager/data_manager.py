@@ -1,40 +1,57 @@
 """Stores data about video and detections in local database"""
 import datetime
+import json
 import os
 import sqlite3
-import sys
-import traceback
+import threading
 import typing
+from contextlib import contextmanager
 from pathlib import Path
 from types import TracebackType
 from typing import Type
 
-import cv2
+import av
 
+from app.data_manager.video_summary import DetectionStatistics
 from app.logger import get_logger
+from app.video_processor.probe import probe_video
 
 logger = get_logger()
 
+# Numbered .sql scripts, applied in order to bring the database up to date
+MIGRATIONS_PATH = Path(__file__).parent / "migrations"
 
-class DataManager:
-    """Class for interacting with local sqlite database"""
+# How long a connection waits for a lock held by another connection, in milliseconds
+BUSY_TIMEOUT_MS = 30000
 
-    def __init__(self) -> None:
-        """establishes the connection with local sqlite database"""
 
-        try:
-            # Creates a connection with the db file
-            self.sqlite_connection = sqlite3.connect("database.db")
-            print("Successfully Connected to SQLite")
+class DataManager:
+    """Class for interacting with local sqlite database.
 
-            table_exists = self.tables_check()
+    Every thread gets its own connection to the database, and the database runs in
+    WAL mode, so detection, cutting and report threads can read while another thread writes.
+    """
 
-            if table_exists:
-                self.create_tables()
+    def __init__(
+        self, database_path: Path = Path("database.db"), journal_mode: str = "WAL"
+    ) -> None:
+        """establishes the connection with local sqlite database
+
+        Args:
+            database_path (Path): path to the database file
+            journal_mode (str): the SQLite journal mode, WAL needs all connections
+                                on one host, use DELETE for a database on a network share
+        """
+        self.database_path = database_path
+        self.journal_mode = journal_mode
+        self.__local = threading.local()
+        self.__connections: typing.List[sqlite3.Connection] = []
+        self.__connections_lock = threading.Lock()
 
+        try:
+            self.migrate()
         except sqlite3.Error as error:
-            # If error occurs log the error
-            print("Error while connecting to sqlite", error)
+            logger.error("Error while migrating the database", exc_info=error)
 
     def __enter__(self) -> "DataManager":
         """Returns the data manager object"""
@@ -46,9 +63,91 @@ class DataManager:
         exc_value: BaseException | None,  # pylint: disable=unused-argument
         trace_back: TracebackType | None,  # pylint: disable=unused-argument
     ) -> None:
-        """Closes the connection with the database"""
-        if self.sqlite_connection:
-            self.sqlite_connection.close()
+        """Closes the connections with the database"""
+        self.close()
+
+    @property
+    def sqlite_connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use"""
+        connection: sqlite3.Connection | None = getattr(
+            self.__local, "connection", None
+        )
+        if connection is None:
+            connection = sqlite3.connect(
+                self.database_path,
+                timeout=BUSY_TIMEOUT_MS / 1000,
+                # Transactions are managed explicitly by transaction()
+                isolation_level=None,
+                # Only used by the thread that opened it, but closed from close()
+                check_same_thread=False,
+            )
+            connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            # NORMAL is only safe against power loss with WAL
+            synchronous = "NORMAL" if self.journal_mode.upper() == "WAL" else "FULL"
+            connection.execute(f"PRAGMA synchronous={synchronous}")
+            connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self.__local.connection = connection
+            self.__local.transaction_depth = 0
+            with self.__connections_lock:
+                self.__connections.append(connection)
+            logger.debug(
+                "Opened connection to %s for thread %s",
+                self.database_path,
+                threading.current_thread().name,
+            )
+        return connection
+
+    def close(self) -> None:
+        """Closes the connections of all threads"""
+        with self.__connections_lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections.clear()
+        self.__local = threading.local()
+
+    def close_thread_connection(self) -> None:
+        """Closes the connection of the calling thread, for threads that are about to end"""
+        connection: sqlite3.Connection | None = getattr(
+            self.__local, "connection", None
+        )
+        if connection is None:
+            return
+        with self.__connections_lock:
+            if connection in self.__connections:
+                self.__connections.remove(connection)
+        connection.close()
+        self.__local.connection = None
+
+    @contextmanager
+    def transaction(self) -> typing.Iterator[sqlite3.Cursor]:
+        """Runs the block in a transaction, committed on success and rolled back on error.
+
+        Transactions can be nested, only the outermost one commits. The write lock is
+        taken when the transaction starts, so it can't fail halfway with a locked database.
+
+        Yields:
+            sqlite3.Cursor: a cursor for the calling thread's connection
+        """
+        connection = self.sqlite_connection
+        cursor = connection.cursor()
+        outermost = self.__local.transaction_depth == 0
+        if outermost:
+            cursor.execute("BEGIN IMMEDIATE")
+        self.__local.transaction_depth += 1
+        try:
+            yield cursor
+        except BaseException:
+            self.__local.transaction_depth -= 1
+            if outermost:
+                connection.rollback()
+            raise
+        else:
+            self.__local.transaction_depth -= 1
+            if outermost:
+                connection.commit()
+        finally:
+            cursor.close()
 
     def tables_check(self) -> bool:
         """Checking if tables aleady exist in the database
@@ -57,53 +156,56 @@ class DataManager:
             bool: Returns true if there is no tables in the database
         """
         try:
-            # creates a cursor
-            cursor = self.sqlite_connection.cursor()
-
-            # checks if there are tables in the database
-            list_of_tables = cursor.execute(
+            list_of_tables = self.sqlite_connection.execute(
                 """SELECT name FROM sqlite_master WHERE type='table'
-            AND name IN ('video', 'detection'); """
+                AND name IN ('video', 'detection')"""
             ).fetchall()
 
-            # returns true if there isnt any tables found in the database
-            if list_of_tables == []:
-                print("Tables not found!")
-                return True
-
-            print("Tables found!")
-            cursor.close()
-            return False
+            return len(list_of_tables) == 0
 
         except sqlite3.Error as error:
-            # Log error if anything fails in the process
-            print("Error while checking for sqlite table", error)
+            logger.error("Error while checking for sqlite table", exc_info=error)
             return False
 
-    def create_tables(self) -> None:
-        """creates tables in the database based on the sqlite_tables file"""
+    def get_schema_version(self) -> int:
+        """Returns the version of the schema, the number of the last applied migration"""
+        row = self.sqlite_connection.execute("PRAGMA user_version").fetchone()
+        return int(row[0])
 
-        try:
-            # creates a cursor
-            cursor = self.sqlite_connection.cursor()
+    def migrate(self) -> None:
+        """Applies the migrations in the migrations folder that are newer than the schema.
+
+        Each migration runs in its own transaction together with the version bump,
+        so a failed migration leaves the database at the previous version.
+        """
+        connection = self.sqlite_connection
+        self.__register_migration_functions(connection)
+
+        version = self.get_schema_version()
+        for migration_path in sorted(MIGRATIONS_PATH.glob("*.sql")):
+            migration_version = int(migration_path.name.split("_")[0])
+            if migration_version <= version:
+                continue
 
-            # opens the sql file with the tables that are going to be created
             with open(
-                "app/data_manager/sqlite_tables.sql",
-                "r",
-                encoding="ascii",
-                errors="ignore",
+                migration_path, "r", encoding="ascii", errors="ignore"
             ) as sqlite_file:
                 sql_script = sqlite_file.read()
 
-            # executes the sql script to create the tables
-            cursor.executescript(sql_script)
-            print("SQLite script executed successfully")
-            cursor.close()
-
-        except sqlite3.Error as error:
-            # Log error if anything fails in the process
-            print("Error while creating a sqlite table", error)
+            # Tables are rebuilt by migrations, which fails with foreign keys enabled
+            connection.execute("PRAGMA foreign_keys=OFF")
+            try:
+                with self.transaction():
+                    # Another process may have migrated while we waited for the lock
+                    if self.get_schema_version() >= migration_version:
+                        continue
+
+                    logger.info("Applying database migration %s", migration_path.name)
+                    for statement in self.__split_statements(sql_script):
+                        connection.execute(statement)
+                    connection.execute(f"PRAGMA user_version = {migration_version}")
+            finally:
+                connection.execute("PRAGMA foreign_keys=ON")
 
     def add_video_data(
         self, video_id: Path | None, title: str, output_video: Path | None
@@ -113,264 +215,254 @@ class DataManager:
         Args:
             video_id (Path | None): The path of the video
             title (str): Filename of video
-            output_video (Path | None): The path of the output video
+            output_video (Path | None): The path of the cut video, None if there is none
         """
+        if video_id is None:
+            return
 
         try:
-            # creates cursor
-            cursor = self.sqlite_connection.cursor()
-
-            if video_id is None:
-                return
-
-            if output_video is None:
-                return
-
-            video_notexist = self.video_check(str(video_id))
-            if video_notexist:
-                # sets up query and data that will be in the query
-                sqlite_insert_query = """INSERT INTO video
-                            (id, title, date, totaldetections, videolength, outputvideolength)
-                            VALUES  (?, ?, ?, ?, ?, ?)"""
-                # TODO: guard if file deleted
-                data = (
-                    str(video_id),
-                    title,
-                    datetime.datetime.fromtimestamp(
-                        os.path.getctime(video_id)
-                    ).strftime("%Y-%m-%d"),
-                    0,
-                    self.get_video_duration(video_id),
-                    self.get_video_duration(
-                        output_video / f"{video_id.stem}_processed.mp4"
-                    ),
-                )
-                #
-                # executes query to add the data into the table
-                cursor.execute(sqlite_insert_query, data)
-                self.sqlite_connection.commit()
-                logger.info(
-                    "Record inserted successfully into table at %s", cursor.rowcount
-                )
-            cursor.close()
+            row = self.get_video_row(video_id, title) + (
+                0 if output_video is None else self.get_video_duration_ms(output_video),
+            )
+            with self.transaction() as cursor:
+                self.upsert_video_row(cursor, row)
+            logger.info("Record inserted successfully into video table")
 
         except sqlite3.Error as error:
-            # If error occurs log the error
-            logger.error("Failed to insert data into sqlite table")
-            logger.error("Exception class is: %s", error.__class__)
-            logger.error("Exception is %s", error.args)
-            logger.error("Printing detailed SQLite exception traceback: ")
-            exc_type, exc_value, exc_tb = sys.exc_info()
-            logger.error(traceback.format_exception(exc_type, exc_value, exc_tb))
+            logger.error("Failed to insert data into sqlite table", exc_info=error)
+
+    def get_video_row(
+        self, video_id: Path, title: str
+    ) -> typing.Tuple[typing.Any, ...]:
+        """Reads the columns of a video row from the source video, all but the output length
+
+        Args:
+            video_id (Path): The path of the video
+            title (str): Filename of video
+
+        Returns:
+            Tuple[Any, ...]: id, title, folder, date, total detections, fps and length
+        """
+        # TODO: guard if file deleted
+        return (
+            str(video_id),
+            title,
+            str(video_id.parent),
+            datetime.datetime.fromtimestamp(os.path.getctime(video_id)).strftime(
+                "%Y-%m-%d"
+            ),
+            0,
+            self.get_framerate(video_id),
+            self.get_video_duration_ms(video_id),
+        )
+
+    def get_detection_video_row(self, video_id: Path) -> typing.Tuple[typing.Any, ...]:
+        """Reads the video row inserted with the detections of a video, if it isn't added
+        yet, so the detections never reference a missing video. The output length is set
+        when the video is added.
+
+        Args:
+            video_id (Path): The path of the video
+
+        Returns:
+            Tuple[Any, ...]: the video row, without an output length
+        """
+        return self.get_video_row(video_id, video_id.name) + (0,)
+
+    def insert_video_row(
+        self, cursor: sqlite3.Cursor, row: typing.Tuple[typing.Any, ...]
+    ) -> None:
+        """Inserts a video row unless the video already exists, within a transaction"""
+        cursor.execute(
+            """INSERT OR IGNORE INTO video
+            (id, title, folder, date, totaldetections, fps,
+            videolengthms, outputvideolengthms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            row,
+        )
+
+    def upsert_video_row(
+        self, cursor: sqlite3.Cursor, row: typing.Tuple[typing.Any, ...]
+    ) -> None:
+        """Inserts a video row, or sets the output length of an existing video, within a
+        transaction"""
+        cursor.execute(
+            """INSERT INTO video
+            (id, title, folder, date, totaldetections, fps,
+            videolengthms, outputvideolengthms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+            outputvideolengthms = excluded.outputvideolengthms""",
+            row,
+        )
 
     def video_check(self, video_id: str) -> bool:
-        """Checks if a video already exists within the database"""
-        try:
-            # creates a cursor
-            cursor = self.sqlite_connection.cursor()
+        """Checks if a video already exists within the database
 
-            # checks if there are tables in the database
-            video = cursor.execute(
-                """SELECT title FROM video WHERE id='""" + video_id + """'; """
-            ).fetchall()
+        Returns:
+            bool: Returns true if the video is not in the database
+        """
+        try:
+            video = self.sqlite_connection.execute(
+                "SELECT 1 FROM video WHERE id = ?", (video_id,)
+            ).fetchone()
 
-            # returns true if there isnt any tables found in the database
-            if video == []:
-                print("Video not found!")
+            if video is None:
                 return True
 
-            print("Video already exists in database!")
-            cursor.close()
+            logger.debug("Video %s already exists in database", video_id)
             return False
 
         except sqlite3.Error as error:
-            # Log error if anything fails in the process
-            print("Error while checking for sqlite table", error)
+            logger.error("Error while checking for video", exc_info=error)
             return False
 
-    def get_video_duration(self, path: Path) -> str:
-        """Get the duration of a video file as a string in the format HH:MM:SS.
+    def get_video_duration_ms(self, path: Path) -> int:
+        """Get the duration of a video file in milliseconds.
 
         Args:
             path (Path): path to the video file.
 
         Returns:
-            str: the duration of the video file in the format HH:MM:SS.
+            int: the duration of the video file in milliseconds, 0 if it can't be read.
         """
         try:
-            cap = cv2.VideoCapture(str(path))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration = frame_count / fps
-            return str(datetime.timedelta(seconds=duration))
-        except cv2.error as error:
+            return round(probe_video(path).duration * 1000)
+        except (OSError, av.error.FFmpegError) as error:
             logger.error("Error occurred: %s", error)
-            return "00:00:00"
+            return 0
 
     def add_detection_data(
-        self, video_id: Path, detections: typing.List[typing.Tuple[int, int]]
+        self,
+        video_id: Path,
+        detections: typing.List[typing.Tuple[int, int]],
+        statistics: DetectionStatistics | None = None,
     ) -> None:
-        """Adds data about detections for one video
+        """Adds data about detections for one video, replacing any previous detections,
+        and updates the summary of the video
 
         Args:
             video_id (int): Unique id of the video for foreign key
             detections (List[Tuple[str, str]]): list of fish detections represented as a
                                                 tuple with start frame and end frame
-
+            statistics (DetectionStatistics | None): class counts, confidence and
+                                                     throughput of the detection run
         """
+        # Computed before the transaction so the write lock isn't held while probing
+        timestamped_detections = self.get_timestamps(video_id, detections)
+        video_row = self.get_detection_video_row(video_id)
+
         try:
-            # create a cursor
-            cursor = self.sqlite_connection.cursor()
-
-            detections_exist = self.detection_check(str(video_id))
-            if detections_exist:
-                sqlite_remove_query = (
-                    """DELLETE FROM detection WHERE videoid ='"""
-                    + str(video_id)
-                    + """';"""
+            with self.transaction() as cursor:
+                self.insert_video_row(cursor, video_row)
+                self.replace_detections(
+                    cursor, video_id, detections, timestamped_detections, statistics
                 )
-                cursor.execute(sqlite_remove_query)
-                print("Deleted previous entries!")
-
-            # sets up query
-            sqlite_insert_query = """INSERT INTO detection
-                          (videoid, starttime, endtime)
-                          VALUES (?, ?, ?);"""
-
-            timestamped_detections = self.get_timestamps(video_id, detections)
-
-            # Setting up list of detections with video id and detection id
-            detections_list: typing.List[typing.Tuple[str, str, str]] = []
-            for detection in timestamped_detections:
-                detections_list.append((str(video_id),) + detection)
-
-            # execute query to add data to table
-            cursor.executemany(sqlite_insert_query, detections_list)
-            self.sqlite_connection.commit()
-            print(
-                "Total",
-                cursor.rowcount,
-                "Records inserted successfully into detection table",
+            logger.info(
+                "Inserted %s records into detection table", len(timestamped_detections)
             )
-            cursor.close()
 
         except sqlite3.Error as error:
-            # If error occurs log the error
-            print("Failed to insert multiple records into sqlite table", error)
+            logger.error(
+                "Failed to insert multiple records into sqlite table", exc_info=error
+            )
+
+    def replace_detections(  # pylint: disable=too-many-arguments
+        self,
+        cursor: sqlite3.Cursor,
+        video_id: Path,
+        detections: typing.List[typing.Tuple[int, int]],
+        timestamped_detections: typing.List[typing.Tuple[int, int]],
+        statistics: DetectionStatistics | None = None,
+    ) -> None:
+        """Replaces the detections of a video and updates its summary, within a transaction"""
+        cursor.execute("DELETE FROM detection WHERE videoid = ?", (str(video_id),))
+        cursor.executemany(
+            """INSERT INTO detection
+            (videoid, startframe, endframe, startms, endms)
+            VALUES (?, ?, ?, ?, ?)""",
+            [
+                (str(video_id), start, end, start_ms, end_ms)
+                for (start, end), (start_ms, end_ms) in zip(
+                    detections, timestamped_detections
+                )
+            ],
+        )
+
+        # Statistics that aren't given are kept from the previous run
+        cursor.execute(
+            """INSERT INTO videosummary
+            (videoid, rangecount, detectedms, classcounts, maxconfidence,
+            framecount, processingseconds, detectionseconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (videoid) DO UPDATE SET
+            rangecount = excluded.rangecount,
+            detectedms = excluded.detectedms,
+            classcounts = COALESCE(excluded.classcounts, classcounts),
+            maxconfidence = COALESCE(excluded.maxconfidence, maxconfidence),
+            framecount = COALESCE(excluded.framecount, framecount),
+            processingseconds = COALESCE(excluded.processingseconds, processingseconds),
+            detectionseconds = COALESCE(excluded.detectionseconds, detectionseconds)
+            """,
+            (
+                str(video_id),
+                len(timestamped_detections),
+                sum(end_ms - start_ms for start_ms, end_ms in timestamped_detections),
+            )
+            + (
+                (
+                    json.dumps(statistics.class_counts),
+                    statistics.max_confidence,
+                    statistics.frame_count,
+                    statistics.processing_seconds,
+                    statistics.detection_seconds,
+                )
+                if statistics is not None
+                else (None, None, None, None, None)
+            ),
+        )
 
     def detection_check(self, video_id: str) -> bool:
         """Checks if a detections for the video already exists within the database"""
         try:
-            # creates a cursor
-            cursor = self.sqlite_connection.cursor()
-
-            # checks if there are tables in the database
-            detections = cursor.execute(
-                """SELECT id FROM detection WHERE videoid='""" + video_id + """'; """
-            ).fetchall()
-
-            # returns true if there isnt any tables found in the database
-            if detections == []:
-                print("not detections for video found!")
-                return False
+            detection = self.sqlite_connection.execute(
+                "SELECT 1 FROM detection WHERE videoid = ? LIMIT 1", (video_id,)
+            ).fetchone()
 
-            print("Detections already exists in database!")
-            cursor.close()
-            return True
+            return detection is not None
 
         except sqlite3.Error as error:
-            # Log error if anything fails in the process
-            print("Error while checking for sqlite table", error)
+            logger.error("Error while checking for detections", exc_info=error)
             return False
 
-    def get_video_data(self, video_search: typing.List[str]) -> typing.List[typing.Any]:
-        """Returns data about the video
-
-        Returns:
-            typing.List[typing.Any]: The list of data from the video data table
-        """
-
-        try:
-            # creates cursor
-            cursor = self.sqlite_connection.cursor()
-
-            # setting up selection query
-            sqlite_select_query = """SELECT title, date, videolength,
-                                    outputvideolength FROM video
-                                    WHERE title """
-
-            # sets up the last part of the query based on the searches wanted
-            addition_query = """ """
-            if len(video_search) > 1:
-                addition_query = " IN " + (str(tuple(video_search)))
-            else:
-                addition_query = "='" + str(video_search[0]) + "'"
-
-            # executes selection query and saves the data in records
-            cursor.execute(sqlite_select_query + addition_query)
-            records = cursor.fetchall()
-            cursor.close()
-
-            # returns all data gained from the query
-            return records
-
-        except sqlite3.Error as error:
-            # If error occurs the error is logged and it returns an empty list
-            print("Failed to read data from sqlite table", error)
-            return []
-
-    def get_data(self, video_search: typing.List[str]) -> typing.List[typing.Any]:
-        """Returns all the data necessary to write a report
+    def get_framerate(self, video_path: Path) -> float:
+        """Get the FPS of a video."""
+        return probe_video(video_path).fps
 
-        Args:
-            video_search (List[str]): A list of videoIds which are used to find data about
-                                      detections the given videos
+    def get_processing_totals(self) -> typing.Tuple[int, float, int, int]:
+        """Returns totals over the processed videos, to estimate the cost of new ones
 
         Returns:
-            Typing.List[typing.Any]: A list of all selected elements from the database,
-                                     where an element consists of video title, detection id,
-                                     detection starttime and detection end time
+            Tuple[int, float, int, int]: frames detected, seconds spent detecting, and
+                                         milliseconds of source and of output video
         """
-
-        try:
-            # creates cursor
-            cursor = self.sqlite_connection.cursor()
-
-            # setting up selection query
-            sqlite_select_query = """SELECT video.title, detection.id,
-                                    detection.starttime, detection.endtime
-                                    FROM detection
-                                    RIGHT JOIN video ON video.id = detection.videoid
-                                    WHERE video.title"""
-
-            # sets up the last part of the query based on the searches wanted
-            addition_query = """ """
-            if len(video_search) > 1:
-                addition_query = " IN " + (str(tuple(video_search)))
-            else:
-                addition_query = "='" + str(video_search[0]) + "'"
-
-            # executes selection query and saves the data in records
-            cursor.execute(sqlite_select_query + addition_query)
-            records = cursor.fetchall()
-            cursor.close()
-
-            # returns all data gained from the query
-            return records
-
-        except sqlite3.Error as error:
-            # If error occurs the error is logged and it returns an empty list
-            print("Failed to read data from sqlite table", error)
-            return []
-
-    def get_framerate(self, video_path: Path) -> float:
-        """Get the FPS of a video."""
-        cap = cv2.VideoCapture(str(video_path))
-        return float(cap.get(cv2.CAP_PROP_FPS))
+        # Only the videos detected in one run tell the detection speed
+        frames, seconds = self.sqlite_connection.execute(
+            """SELECT COALESCE(SUM(framecount), 0), COALESCE(SUM(detectionseconds), 0)
+            FROM videosummary
+            WHERE framecount > 0 AND detectionseconds > 0"""
+        ).fetchone()
+        source_ms, output_ms = self.sqlite_connection.execute(
+            """SELECT COALESCE(SUM(videolengthms), 0),
+            COALESCE(SUM(outputvideolengthms), 0)
+            FROM video
+            WHERE videolengthms > 0"""
+        ).fetchone()
+        return int(frames), float(seconds), int(source_ms), int(output_ms)
 
     def get_timestamps(
         self, path: Path, ranges: typing.List[typing.Tuple[int, int]]
-    ) -> typing.List[typing.Tuple[str, str]]:
+    ) -> typing.List[typing.Tuple[int, int]]:
         """Gets the timestamps for when a frame occurs in the video
 
         Args:
@@ -380,26 +472,61 @@ class DataManager:
                                                           represented as ints
 
         Returns:
-            typing.List[typing.Tuple[str, str]]: list of frame ranges with fish converted into
-                                                 timestamps
+            typing.List[typing.Tuple[int, int]]: list of frame ranges with fish converted into
+                                                 timestamps in milliseconds
         """
         try:
             framerate = self.get_framerate(path)
 
-            # iterated through the frame ranges to convert into timestamps
-            timestamps: typing.List[typing.Tuple[str, str]] = []
-            for start, end in ranges:
-                start_stamp = start / framerate
-                end_stamp = end / framerate
-                timestamps.append(
-                    (
-                        str(datetime.timedelta(seconds=start_stamp)),
-                        str(datetime.timedelta(seconds=end_stamp)),
-                    )
-                )
-
-            return timestamps
+            return [
+                (round(start * 1000 / framerate), round(end * 1000 / framerate))
+                for start, end in ranges
+            ]
 
         except Exception as error:  # pylint: disable=broad-except
             logger.error("Error occured: %s", error)
             return []
+
+    @staticmethod
+    def __timedelta_ms(text: str | None) -> int | None:
+        """Parses a str(timedelta) as stored by the first schema into milliseconds"""
+        if text is None or text == "":
+            return None
+        days = 0
+        if "day" in text:
+            day_text, text = text.split(",")
+            days = int(day_text.split()[0])
+        hours, minutes, seconds = text.strip().split(":")
+        return round(
+            (days * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+            * 1000
+        )
+
+    @staticmethod
+    def __video_fps(video_id: str) -> float | None:
+        """Probes the frame rate of a video, if it still exists"""
+        try:
+            return probe_video(Path(video_id)).fps
+        except (OSError, av.error.FFmpegError):
+            return None
+
+    @staticmethod
+    def __split_statements(sql_script: str) -> typing.List[str]:
+        """Splits an sql script into statements, so it can run inside a transaction"""
+        statements = []
+        statement = ""
+        for line in sql_script.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                statements.append(statement.strip())
+                statement = ""
+        return statements
+
+    @staticmethod
+    def __register_migration_functions(connection: sqlite3.Connection) -> None:
+        """Registers the functions the migration scripts use to convert data"""
+        connection.create_function("timedelta_ms", 1, DataManager.__timedelta_ms)
+        connection.create_function("video_fps", 1, DataManager.__video_fps)
+        connection.create_function(
+            "parent_folder", 1, lambda video_id: str(Path(video_id).parent)
+        )
@@ -0,0 +1,267 @@
+"""Write-behind queue that writes to the database on a background thread.
+
+The detection worker submits its writes and continues with the next video right away.
+The writer thread reads the source and output videos for the rows, then writes the
+queued rows in batches, one transaction per batch.
+"""
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Type
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.frame_detection_store import FrameDetectionStore
+from app.data_manager.processing_manifest import upsert_processed_video
+from app.data_manager.video_summary import DetectionStatistics
+from app.logger import get_logger
+
+logger = get_logger()
+
+# Max number of queued writes committed in one transaction
+MAX_BATCH_SIZE = 64
+
+# Writes rows within a transaction of the writer thread
+Write = Callable[[sqlite3.Cursor], None]
+
+
+class DatabaseWriter:
+    """Writes video and detection data to the database on a background thread.
+
+    Writes are applied in the order they are submitted. A failed write is reported to
+    on_error and returned by flush, the other writes of its batch are still committed.
+    """
+
+    def __init__(
+        self,
+        data_manager: DataManager,
+        on_error: Callable[[str, Exception], None] | None = None,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ) -> None:
+        """Starts the writer thread
+
+        Args:
+            data_manager (DataManager): the database to write to
+            on_error (Callable[[str, Exception], None] | None): called from the writer
+                thread with a description of each failed write and its error
+            max_batch_size (int): max number of writes committed in one transaction
+        """
+        self.data_manager = data_manager
+        self.on_error = on_error
+        self.max_batch_size = max_batch_size
+
+        self.__queue: "queue.Queue[Tuple[str, Callable[[], Write]] | None]" = (
+            queue.Queue()
+        )
+        self.__errors: List[Tuple[str, Exception]] = []
+        self.__errors_lock = threading.Lock()
+        self.__thread = threading.Thread(
+            target=self.__run, name="DatabaseWriter", daemon=True
+        )
+        self.__thread.start()
+
+    def __enter__(self) -> "DatabaseWriter":
+        """Returns the writer"""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,  # pylint: disable=unused-argument
+        exc_value: BaseException | None,  # pylint: disable=unused-argument
+        trace_back: TracebackType | None,  # pylint: disable=unused-argument
+    ) -> None:
+        """Writes the queued data and stops the writer thread"""
+        self.close()
+
+    def add_video_data(
+        self, video_id: Path, title: str, output_video: Path | None
+    ) -> None:
+        """Queues adding a video into the video table.
+
+        The source video is read right away, since it may be deleted after processing.
+        The output video is read on the writer thread.
+
+        Args:
+            video_id (Path): The path of the video
+            title (str): Filename of video
+            output_video (Path | None): The path of the cut video, None if there is none
+        """
+        row = self.data_manager.get_video_row(video_id, title)
+
+        def prepare() -> Write:
+            output_row = row + (
+                0
+                if output_video is None
+                else self.data_manager.get_video_duration_ms(output_video),
+            )
+            return lambda cursor: self.data_manager.upsert_video_row(cursor, output_row)
+
+        self.__submit(f"video {video_id}", prepare)
+
+    def add_detection_data(
+        self,
+        video_id: Path,
+        detections: List[Tuple[int, int]],
+        statistics: DetectionStatistics | None = None,
+    ) -> None:
+        """Queues replacing the detections of a video and updating its summary.
+
+        Args:
+            video_id (Path): Unique id of the video for foreign key
+            detections (List[Tuple[int, int]]): list of fish detections represented as a
+                                                tuple with start frame and end frame
+            statistics (DetectionStatistics | None): class counts, confidence and
+                                                     throughput of the detection run
+        """
+        # Reads the source video, which may be deleted after processing
+        timestamped_detections = self.data_manager.get_timestamps(video_id, detections)
+        video_row = self.data_manager.get_detection_video_row(video_id)
+
+        def write(cursor: sqlite3.Cursor) -> None:
+            # The detections reference the video, which may not be added yet
+            self.data_manager.insert_video_row(cursor, video_row)
+            self.data_manager.replace_detections(
+                cursor, video_id, detections, timestamped_detections, statistics
+            )
+
+        def prepare() -> Write:
+            return write
+
+        self.__submit(f"detections of {video_id}", prepare)
+
+    def add_frame_detections(  # pylint: disable=too-many-arguments
+        self,
+        video_id: Path,
+        frame_ranges: List[Tuple[int, int]],
+        predictions: Sequence[Any],
+        video_size: Tuple[int, int],
+        class_names: Dict[int, str],
+    ) -> None:
+        """Queues replacing the per-frame detections of a video, encoded on the writer thread.
+
+        Args:
+            video_id (Path): Unique id of the video for foreign key
+            frame_ranges (List[Tuple[int, int]]): the frame ranges to store detections of
+            predictions (Sequence[Any]): the predictions of every frame in the video
+            video_size (Tuple[int, int]): the width and height of the video
+            class_names (Dict[int, str]): the name of each class id
+        """
+        video_row = self.data_manager.get_detection_video_row(video_id)
+        store = FrameDetectionStore(self.data_manager)
+
+        def prepare() -> Write:
+            rows = store.get_frame_detection_rows(
+                video_id, frame_ranges, predictions, video_size
+            )
+
+            def write(cursor: sqlite3.Cursor) -> None:
+                self.data_manager.insert_video_row(cursor, video_row)
+                store.replace_frame_detections(cursor, video_id, rows, class_names)
+
+            return write
+
+        self.__submit(f"frame detections of {video_id}", prepare)
+
+    def add_processed_video(self, row: Tuple[Any, ...]) -> None:
+        """Queues recording a processed video in the processing manifest.
+
+        Args:
+            row (Tuple[Any, ...]): the manifest row, see ProcessingManifest.row
+        """
+        self.__submit(
+            f"manifest of {row[0]}",
+            lambda: lambda cursor: upsert_processed_video(cursor, row),
+        )
+
+    def flush(self) -> List[Tuple[str, Exception]]:
+        """Waits until all queued data is written
+
+        Returns:
+            List[Tuple[str, Exception]]: the writes that failed since the last flush
+        """
+        self.__queue.join()
+        with self.__errors_lock:
+            errors = self.__errors
+            self.__errors = []
+        return errors
+
+    def close(self) -> List[Tuple[str, Exception]]:
+        """Writes the queued data and stops the writer thread
+
+        Returns:
+            List[Tuple[str, Exception]]: the writes that failed since the last flush
+        """
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+        return self.flush()
+
+    def __submit(self, description: str, prepare: Callable[[], Write]) -> None:
+        """Queues a write, prepare is called on the writer thread outside the transaction"""
+        if not self.__thread.is_alive():
+            raise RuntimeError("The database writer is closed")
+        self.__queue.put((description, prepare))
+
+    def __report(self, description: str, error: Exception) -> None:
+        """Logs a failed write and reports it back"""
+        logger.error("Failed to write %s", description, exc_info=error)
+        with self.__errors_lock:
+            self.__errors.append((description, error))
+        if self.on_error is not None:
+            try:
+                self.on_error(description, error)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("Database writer error callback failed", exc_info=err)
+
+    def __run(self) -> None:
+        """Writes queued batches until the writer is closed"""
+        closed = False
+        while not closed:
+            batch = [self.__queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                closed = True
+            try:
+                self.__write_batch([item for item in batch if item is not None])
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+        self.data_manager.close_thread_connection()
+
+    def __write_batch(self, batch: List[Tuple[str, Callable[[], Write]]]) -> None:
+        """Writes a batch in one transaction, retrying the writes one by one on failure"""
+        writes: List[Tuple[str, Write]] = []
+        for description, prepare in batch:
+            try:
+                writes.append((description, prepare()))
+            except Exception as err:  # pylint: disable=broad-except
+                self.__report(description, err)
+
+        if len(writes) == 0:
+            return
+
+        try:
+            with self.data_manager.transaction() as cursor:
+                for _, write in writes:
+                    write(cursor)
+            logger.debug("Wrote a batch of %s writes", len(writes))
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            if len(writes) == 1:
+                self.__report(writes[0][0], err)
+                return
+
+        # Find the failing writes so the others are still committed
+        for description, write in writes:
+            try:
+                with self.data_manager.transaction() as cursor:
+                    write(cursor)
+            except Exception as err:  # pylint: disable=broad-except
+                self.__report(description, err)
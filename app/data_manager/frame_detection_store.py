@@ -0,0 +1,294 @@
+"""Stores the per-frame detections of videos, with a spatial index of their boxes.
+
+The detections are stored in the compact encoding of frame_detections, one row per
+chunk of frames, and every box is also added to an R*Tree so detections in a region of
+the frame can be looked up without decoding the chunks.
+"""
+import sqlite3
+import sys
+import typing
+from pathlib import Path
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.frame_detections import (
+    BoxDetection,
+    FrameDetectionChunk,
+    dequantize_boxes,
+    encode_frame_detections,
+    quantize_region,
+)
+from app.logger import get_logger
+
+logger = get_logger()
+
+
+class FrameDetectionStore:
+    """The per-frame detections of a database."""
+
+    def __init__(self, data_manager: DataManager) -> None:
+        """Sets up the store
+
+        Args:
+            data_manager (DataManager): the database with the framedetection table
+        """
+        self.data_manager = data_manager
+
+    def add_frame_detections(  # pylint: disable=too-many-arguments
+        self,
+        video_id: Path,
+        frame_ranges: typing.List[typing.Tuple[int, int]],
+        predictions: typing.Sequence[typing.Any],
+        video_size: typing.Tuple[int, int],
+        class_names: typing.Dict[int, str],
+    ) -> None:
+        """Adds the per-frame detections within the frame ranges of a video,
+        replacing any previous per-frame detections of the video
+
+        Args:
+            video_id (Path): Unique id of the video for foreign key
+            frame_ranges (List[Tuple[int, int]]): the frame ranges to store detections of
+            predictions (Sequence[Any]): the predictions of every frame in the video
+            video_size (Tuple[int, int]): the width and height of the video
+            class_names (Dict[int, str]): the name of each class id
+        """
+        rows = self.get_frame_detection_rows(
+            video_id, frame_ranges, predictions, video_size
+        )
+        video_row = self.data_manager.get_detection_video_row(video_id)
+
+        try:
+            with self.data_manager.transaction() as cursor:
+                self.data_manager.insert_video_row(cursor, video_row)
+                self.replace_frame_detections(cursor, video_id, rows, class_names)
+            logger.info(
+                "Inserted %s detections in %s chunks into framedetection table",
+                sum(row[3] for row in rows),
+                len(rows),
+            )
+
+        except sqlite3.Error as error:
+            logger.error("Failed to insert frame detections", exc_info=error)
+
+    def get_frame_detection_rows(
+        self,
+        video_id: Path,
+        frame_ranges: typing.List[typing.Tuple[int, int]],
+        predictions: typing.Sequence[typing.Any],
+        video_size: typing.Tuple[int, int],
+    ) -> typing.List[typing.Tuple[typing.Any, ...]]:
+        """Encodes the per-frame detections within the frame ranges into framedetection rows"""
+        width, height = video_size
+        return [
+            (
+                str(video_id),
+                chunk.start_frame,
+                chunk.end_frame,
+                chunk.count,
+                chunk.width,
+                chunk.height,
+                chunk.data,
+            )
+            for chunk in encode_frame_detections(
+                frame_ranges, predictions, width, height
+            )
+        ]
+
+    def replace_frame_detections(
+        self,
+        cursor: sqlite3.Cursor,
+        video_id: Path,
+        rows: typing.List[typing.Tuple[typing.Any, ...]],
+        class_names: typing.Dict[int, str],
+    ) -> None:
+        """Replaces the per-frame detections and class names of a video, within a transaction"""
+        old_chunks = cursor.execute(
+            "SELECT id FROM framedetection WHERE videoid = ?", (str(video_id),)
+        ).fetchall()
+        cursor.executemany(
+            "DELETE FROM detectionbox WHERE minchunk >= ? AND maxchunk <= ?",
+            [(chunk_id, chunk_id) for (chunk_id,) in old_chunks],
+        )
+        cursor.execute("DELETE FROM framedetection WHERE videoid = ?", (str(video_id),))
+        cursor.execute("DELETE FROM detectionclass WHERE videoid = ?", (str(video_id),))
+
+        for row in rows:
+            cursor.execute(
+                """INSERT INTO framedetection
+                (videoid, startframe, endframe, count, width, height, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                row,
+            )
+            self.__index_chunk(cursor, cursor.lastrowid, FrameDetectionChunk(*row[1:]))
+
+        cursor.executemany(
+            "INSERT INTO detectionclass (videoid, classid, name) VALUES (?, ?, ?)",
+            [(str(video_id), class_id, name) for class_id, name in class_names.items()],
+        )
+
+    def __index_chunk(
+        self, cursor: sqlite3.Cursor, chunk_id: int | None, chunk: FrameDetectionChunk
+    ) -> None:
+        """Adds the detections of a chunk to the spatial index"""
+        cursor.executemany(
+            """INSERT INTO detectionbox
+            (minchunk, maxchunk, minframe, maxframe, minx, maxx, miny, maxy,
+            minclass, maxclass, confidence)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                (chunk_id, chunk_id, frame, frame, xmin, xmax, ymin, ymax)
+                + (class_id, class_id, confidence)
+                for frame, class_id, confidence, (xmin, ymin, xmax, ymax) in zip(
+                    chunk.frames.tolist(),
+                    chunk.class_ids.tolist(),
+                    chunk.confidences.tolist(),
+                    chunk.quantized_boxes.tolist(),
+                )
+            ),
+        )
+
+    def get_frame_detections(
+        self,
+        video_id: str,
+        start_frame: int | None = None,
+        end_frame: int | None = None,
+    ) -> typing.Iterator[FrameDetectionChunk]:
+        """Returns the stored per-frame detections of a video, decoded lazily
+
+        Args:
+            video_id (str): the id of the video
+            start_frame (int | None): only chunks ending at or after this frame
+            end_frame (int | None): only chunks starting at or before this frame
+
+        Returns:
+            Iterator[FrameDetectionChunk]: the chunks in frame order, the detections of a
+                                           chunk are decoded when its columns are accessed
+        """
+        cursor = self.data_manager.sqlite_connection.execute(
+            """SELECT startframe, endframe, count, width, height, data
+            FROM framedetection
+            WHERE videoid = ? AND endframe >= ? AND startframe <= ?
+            ORDER BY startframe""",
+            (
+                video_id,
+                start_frame if start_frame is not None else -1,
+                end_frame if end_frame is not None else sys.maxsize,
+            ),
+        )
+        return (FrameDetectionChunk(*row) for row in cursor)
+
+    def get_detections_in_region(  # pylint: disable=too-many-arguments
+        self,
+        region: typing.Tuple[float, float, float, float] = (0, 0, 1, 1),
+        video_id: str | None = None,
+        start_frame: int | None = None,
+        end_frame: int | None = None,
+        class_id: int | None = None,
+    ) -> typing.Iterator[BoxDetection]:
+        """Returns the stored detections whose box overlaps a region of the frame,
+        looked up in the spatial index
+
+        Args:
+            region (Tuple[float, float, float, float]): the (xmin, ymin, xmax, ymax) region
+                relative to the frame size, e.g. (0, 0, 1 / 3, 1) for the left third
+            video_id (str | None): only detections in this video
+            start_frame (int | None): only detections at or after this frame
+            end_frame (int | None): only detections at or before this frame
+            class_id (int | None): only detections of this class
+
+        Returns:
+            Iterator[BoxDetection]: the detections ordered by video and frame
+        """
+        where, parameters = self.__region_filter(
+            region, video_id, start_frame, end_frame, class_id
+        )
+        cursor = self.data_manager.sqlite_connection.execute(
+            f"""SELECT framedetection.videoid, detectionbox.minframe,
+            detectionbox.minclass, detectionbox.confidence,
+            detectionbox.minx, detectionbox.miny, detectionbox.maxx, detectionbox.maxy,
+            framedetection.width, framedetection.height
+            FROM detectionbox
+            JOIN framedetection ON framedetection.id = detectionbox.minchunk
+            WHERE {where}
+            ORDER BY framedetection.videoid, detectionbox.minframe""",
+            parameters,
+        )
+        for row in cursor:
+            box = dequantize_boxes(row[4:8], row[8], row[9])[0].tolist()
+            yield BoxDetection(row[0], row[1], row[2], row[3], *box)
+
+    def count_detections_in_region(  # pylint: disable=too-many-arguments
+        self,
+        region: typing.Tuple[float, float, float, float] = (0, 0, 1, 1),
+        video_id: str | None = None,
+        start_frame: int | None = None,
+        end_frame: int | None = None,
+        class_id: int | None = None,
+    ) -> int:
+        """Returns the number of stored detections whose box overlaps a region of the frame,
+        with the same filters as get_detections_in_region"""
+        where, parameters = self.__region_filter(
+            region, video_id, start_frame, end_frame, class_id
+        )
+        row = self.data_manager.sqlite_connection.execute(
+            f"""SELECT COUNT(*) FROM detectionbox
+            JOIN framedetection ON framedetection.id = detectionbox.minchunk
+            WHERE {where}""",
+            parameters,
+        ).fetchone()
+        return int(row[0])
+
+    def __region_filter(  # pylint: disable=too-many-arguments
+        self,
+        region: typing.Tuple[float, float, float, float],
+        video_id: str | None,
+        start_frame: int | None,
+        end_frame: int | None,
+        class_id: int | None,
+    ) -> typing.Tuple[str, typing.List[typing.Any]]:
+        """Builds the WHERE clause of a spatial index query, every condition on an
+        index dimension so SQLite only visits the matching branches of the tree"""
+        xmin, ymin, xmax, ymax = quantize_region(region)
+        conditions = [
+            "detectionbox.maxx >= ?",
+            "detectionbox.minx <= ?",
+            "detectionbox.maxy >= ?",
+            "detectionbox.miny <= ?",
+        ]
+        parameters: typing.List[typing.Any] = [xmin, xmax, ymin, ymax]
+
+        if video_id is not None:
+            # The chunks of a video are inserted together, so their ids are a range
+            first_chunk, last_chunk = self.data_manager.sqlite_connection.execute(
+                "SELECT MIN(id), MAX(id) FROM framedetection WHERE videoid = ?",
+                (video_id,),
+            ).fetchone()
+            conditions += [
+                "detectionbox.minchunk >= ?",
+                "detectionbox.maxchunk <= ?",
+                "framedetection.videoid = ?",
+            ]
+            parameters += [
+                first_chunk if first_chunk is not None else 0,
+                last_chunk if last_chunk is not None else -1,
+                video_id,
+            ]
+        if start_frame is not None:
+            conditions.append("detectionbox.maxframe >= ?")
+            parameters.append(start_frame)
+        if end_frame is not None:
+            conditions.append("detectionbox.minframe <= ?")
+            parameters.append(end_frame)
+        if class_id is not None:
+            conditions += ["detectionbox.minclass = ?", "detectionbox.maxclass = ?"]
+            parameters += [class_id, class_id]
+
+        return " AND ".join(conditions), parameters
+
+    def get_class_names(self, video_id: str) -> typing.Dict[int, str]:
+        """Returns the name of each class id stored with the frame detections of a video"""
+        return dict(
+            self.data_manager.sqlite_connection.execute(
+                "SELECT classid, name FROM detectionclass WHERE videoid = ?",
+                (video_id,),
+            ).fetchall()
+        )
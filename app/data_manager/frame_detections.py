@@ -0,0 +1,167 @@
+"""Compact binary encoding of per-frame detections.
+
+The detections of a frame range are stored as one blob of column chunks:
+frame offsets from the start of the range (uint16), class ids (uint8),
+confidences quantized to uint8 and boxes quantized to uint16 relative to the frame size,
+12 bytes per detection in total. Chunks are decoded lazily when a column is accessed.
+"""
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# Ranges longer than this are split into several chunks so the frame offsets fit in uint16
+MAX_CHUNK_FRAMES = np.iinfo(np.uint16).max + 1
+
+BOX_SCALE = np.iinfo(np.uint16).max
+CONF_SCALE = np.iinfo(np.uint8).max
+
+
+@dataclass
+class FrameDetectionChunk:
+    """The encoded detections of the frames from start_frame to end_frame."""
+
+    start_frame: int
+    end_frame: int
+    count: int
+    width: int
+    height: int
+    data: bytes
+
+    def __column(self, offset: int, dtype: Any, columns: int = 1) -> Any:
+        """Reads a column from the blob without copying it"""
+        return np.frombuffer(
+            self.data, dtype=dtype, count=self.count * columns, offset=offset
+        )
+
+    @cached_property
+    def frames(self) -> np.ndarray[Any, Any]:
+        """The frame number of each detection"""
+        offsets = self.__column(0, np.uint16)
+        return offsets.astype(np.int64) + self.start_frame
+
+    @cached_property
+    def class_ids(self) -> np.ndarray[Any, Any]:
+        """The class id of each detection"""
+        return self.__column(2 * self.count, np.uint8)
+
+    @cached_property
+    def confidences(self) -> np.ndarray[Any, Any]:
+        """The confidence of each detection, with a precision of 1/255"""
+        conf = self.__column(3 * self.count, np.uint8)
+        return conf.astype(np.float32) / CONF_SCALE
+
+    @cached_property
+    def quantized_boxes(self) -> np.ndarray[Any, Any]:
+        """The (xmin, ymin, xmax, ymax) box of each detection, from 0 to BOX_SCALE"""
+        return self.__column(4 * self.count, np.uint16, 4).reshape(-1, 4)
+
+    @cached_property
+    def boxes(self) -> np.ndarray[Any, Any]:
+        """The (xmin, ymin, xmax, ymax) box of each detection in pixels"""
+        return dequantize_boxes(self.quantized_boxes, self.width, self.height)
+
+
+@dataclass
+class BoxDetection:  # pylint: disable=too-many-instance-attributes
+    """A single stored detection, with its box in pixels."""
+
+    video_id: str
+    frame: int
+    class_id: int
+    confidence: float
+    xmin: float
+    ymin: float
+    xmax: float
+    ymax: float
+
+
+def quantize_region(region: Tuple[float, float, float, float]) -> Tuple[int, ...]:
+    """Quantizes an (xmin, ymin, xmax, ymax) region relative to the frame size, 0 to 1"""
+    return tuple(
+        int(np.clip(round(value * BOX_SCALE), 0, BOX_SCALE)) for value in region
+    )
+
+
+def dequantize_boxes(boxes: Any, width: int, height: int) -> np.ndarray[Any, Any]:
+    """Converts quantized (xmin, ymin, xmax, ymax) boxes to pixels"""
+    scale = np.asarray([width, height, width, height], dtype=np.float32)
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4) / BOX_SCALE * scale
+
+
+def prediction_boxes(
+    predictions: Iterable[Dict[str, Any]], dtype: Any
+) -> np.ndarray[Any, Any]:
+    """Gets the (xmin, ymin, xmax, ymax) box of each prediction, one row each"""
+    return np.asarray(
+        [
+            (
+                pred["bndbox"]["xmin"],
+                pred["bndbox"]["ymin"],
+                pred["bndbox"]["xmax"],
+                pred["bndbox"]["ymax"],
+            )
+            for pred in predictions
+        ],
+        dtype,
+    ).reshape(-1, 4)
+
+
+def __encode_chunk(
+    start_frame: int,
+    detections: List[Tuple[int, Dict[str, Any]]],
+    width: int,
+    height: int,
+) -> Tuple[int, bytes]:
+    """Encodes (frame, prediction) pairs into a blob"""
+    frames = np.asarray([frame - start_frame for frame, _ in detections], np.uint16)
+    class_ids = np.asarray([pred["class_id"] for _, pred in detections], np.uint8)
+    conf = np.asarray([pred["conf"] for _, pred in detections], np.float32)
+    boxes = prediction_boxes((pred for _, pred in detections), np.float32)
+
+    scale = np.asarray([width, height, width, height], dtype=np.float32)
+    quantized_boxes = np.clip(np.round(boxes / scale * BOX_SCALE), 0, BOX_SCALE)
+    quantized_conf = np.clip(np.round(conf * CONF_SCALE), 0, CONF_SCALE)
+
+    data = b"".join(
+        (
+            frames.tobytes(),
+            class_ids.tobytes(),
+            quantized_conf.astype(np.uint8).tobytes(),
+            quantized_boxes.astype(np.uint16).tobytes(),
+        )
+    )
+    return len(detections), data
+
+
+def encode_frame_detections(
+    frame_ranges: List[Tuple[int, int]],
+    predictions: Sequence[Sequence[Dict[str, Any]] | None],
+    width: int,
+    height: int,
+) -> Iterator[FrameDetectionChunk]:
+    """Encodes the predictions of the frames in each range.
+
+    Args:
+        frame_ranges: The (start, end) frame ranges to store the predictions of.
+        predictions: The predictions of every frame in the video, as returned by
+                     BatchYolov8.predict_batch.
+        width: The width of the video.
+        height: The height of the video.
+
+    Yields:
+        The encoded chunks, at least one per range.
+    """
+    for start, end in frame_ranges:
+        for chunk_start in range(start, end + 1, MAX_CHUNK_FRAMES):
+            chunk_end = min(end, chunk_start + MAX_CHUNK_FRAMES - 1)
+            detections = [
+                (frame, pred)
+                for frame in range(chunk_start, min(chunk_end + 1, len(predictions)))
+                for pred in predictions[frame] or []
+            ]
+            count, data = __encode_chunk(chunk_start, detections, width, height)
+            yield FrameDetectionChunk(
+                chunk_start, chunk_end, count, width, height, data
+            )
@@ -0,0 +1,263 @@
+"""A queue of videos shared by worker processes on one or more hosts.
+
+Workers claim a video by taking a lease on it and renew the lease with heartbeats
+while processing. If a worker dies, its lease expires and another worker claims the
+video again, so every video is processed by one worker at a time and none is lost.
+
+For workers on several hosts, the database must be on the shared storage and opened
+with DataManager(journal_mode="DELETE"), since WAL only works within one host. Leases
+compare the clocks of the hosts, so they should be kept in sync, and the lease must
+be much longer than the heartbeat interval plus the clock difference.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Dict, Iterable, Tuple, Type
+
+from app.data_manager.data_manager import DataManager
+from app.logger import get_logger
+
+logger = get_logger()
+
+# Seconds a claimed job stays leased without a heartbeat
+LEASE_SECONDS = 300.0
+
+# Jobs that failed this many times are not claimed again
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id() -> str:
+    """A worker id unique to this process, that shows which host it runs on"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclass(frozen=True)
+class Job:
+    """A video claimed by a worker."""
+
+    path: Path
+    worker: str
+    attempt: int
+
+
+class JobQueue:
+    """Claims, renews and finishes jobs in the job table of a database."""
+
+    def __init__(
+        self,
+        data_manager: DataManager,
+        worker_id: str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> None:
+        """Sets up the queue for one worker
+
+        Args:
+            data_manager (DataManager): the database with the job table
+            worker_id (str | None): the id of this worker, unique among the workers
+            lease_seconds (float): how long a job stays leased without a heartbeat
+            max_attempts (int): the number of failed attempts before a job is given up
+        """
+        self.data_manager = data_manager
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, paths: Iterable[Path]) -> int:
+        """Adds videos to the queue, videos already in it are left as they are
+
+        Args:
+            paths (Iterable[Path]): the videos to add, claimed in this order
+
+        Returns:
+            int: the number of videos added
+        """
+        now = time.time()
+        with self.data_manager.transaction() as cursor:
+            # The write lock is held, so no other worker enqueues in between
+            (last,) = cursor.execute(
+                "SELECT COALESCE(MAX(sequence), 0) FROM job"
+            ).fetchone()
+            cursor.executemany(
+                """INSERT OR IGNORE INTO job (path, enqueuedat, sequence)
+                VALUES (?, ?, ?)""",
+                [(str(path), now, last + i) for i, path in enumerate(paths, start=1)],
+            )
+            return max(0, cursor.rowcount)
+
+    def claim(self) -> Job | None:
+        """Claims the oldest pending job, or a running job whose lease expired
+
+        Returns:
+            Job | None: the claimed job, or None if there is nothing to claim
+        """
+        now = time.time()
+        # The write lock is taken before reading, so two workers can't claim the same job
+        with self.data_manager.transaction() as cursor:
+            # Give up on jobs whose workers kept dying
+            cursor.execute(
+                """UPDATE job SET status = ?, error = 'The lease expired'
+                WHERE status = ? AND leaseexpires < ? AND attempts >= ?""",
+                (FAILED, RUNNING, now, self.max_attempts),
+            )
+            row = cursor.execute(
+                """SELECT path, status, worker, attempts FROM job
+                WHERE (status = ? OR (status = ? AND leaseexpires < ?))
+                AND attempts < ?
+                ORDER BY sequence
+                LIMIT 1""",
+                (PENDING, RUNNING, now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+
+            path, status, previous_worker, attempts = row
+            if status == RUNNING:
+                logger.warning(
+                    "Reclaiming %s from %s, its lease expired", path, previous_worker
+                )
+            cursor.execute(
+                """UPDATE job SET status = ?, worker = ?, leaseexpires = ?,
+                attempts = attempts + 1, error = NULL
+                WHERE path = ?""",
+                (RUNNING, self.worker_id, now + self.lease_seconds, path),
+            )
+        return Job(Path(path), self.worker_id, attempts + 1)
+
+    def heartbeat(self, job: Job) -> bool:
+        """Renews the lease of a job
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        return self.__update_owned(
+            job,
+            "leaseexpires = ?",
+            (time.time() + self.lease_seconds,),
+        )
+
+    def complete(self, job: Job) -> bool:
+        """Marks a job as done
+
+        Returns:
+            bool: False if the lease was lost to another worker, which then owns the job
+        """
+        return self.__update_owned(
+            job,
+            "status = ?, leaseexpires = NULL, finishedat = ?",
+            (DONE, time.time()),
+        )
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Releases a failed job, to be retried unless it failed max_attempts times
+
+        Returns:
+            bool: False if the lease was lost to another worker, which then owns the job
+        """
+        status = FAILED if job.attempt >= self.max_attempts else PENDING
+        return self.__update_owned(
+            job,
+            "status = ?, leaseexpires = NULL, finishedat = ?, error = ?",
+            (status, time.time(), error),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of jobs with each status"""
+        return dict(
+            self.data_manager.sqlite_connection.execute(
+                "SELECT status, COUNT(*) FROM job GROUP BY status"
+            ).fetchall()
+        )
+
+    def lease(self, job: Job, interval: float | None = None) -> "Lease":
+        """Keeps the lease of a job with heartbeats from a background thread
+
+        Args:
+            job (Job): the claimed job
+            interval (float | None): the seconds between heartbeats, a third of the
+                                     lease by default
+        """
+        return Lease(self, job, interval or self.lease_seconds / 3)
+
+    def __update_owned(
+        self, job: Job, assignments: str, values: Tuple[Any, ...]
+    ) -> bool:
+        """Updates a job if this worker still holds the lease of this claim"""
+        with self.data_manager.transaction() as cursor:
+            # A worker that reclaims its own expired job holds a new lease
+            cursor.execute(
+                f"UPDATE job SET {assignments} "
+                "WHERE path = ? AND worker = ? AND status = ? AND attempts = ?",
+                values + (str(job.path), job.worker, RUNNING, job.attempt),
+            )
+            owned = cursor.rowcount == 1
+        if not owned:
+            logger.warning("Lost the lease of %s", job.path)
+        return owned
+
+
+class Lease:
+    """Renews the lease of a job until the block ends."""
+
+    def __init__(self, job_queue: JobQueue, job: Job, interval: float) -> None:
+        """Starts the heartbeat thread
+
+        Args:
+            job_queue (JobQueue): the queue the job was claimed from
+            job (Job): the claimed job
+            interval (float): the seconds between heartbeats
+        """
+        self.job_queue = job_queue
+        self.job = job
+        self.interval = interval
+        self.lost = threading.Event()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(
+            target=self.__run, name=f"Lease {job.path.name}", daemon=True
+        )
+        self.__thread.start()
+
+    def __enter__(self) -> "Lease":
+        """Returns the lease"""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,  # pylint: disable=unused-argument
+        exc_value: BaseException | None,  # pylint: disable=unused-argument
+        trace_back: TracebackType | None,  # pylint: disable=unused-argument
+    ) -> None:
+        """Stops the heartbeats"""
+        self.stop()
+
+    def stop(self) -> None:
+        """Stops the heartbeats, the lease then expires unless the job is finished"""
+        self.__stop.set()
+        self.__thread.join()
+
+    def __run(self) -> None:
+        """Sends heartbeats until stopped or the lease is lost"""
+        try:
+            while not self.__stop.wait(self.interval):
+                try:
+                    if not self.job_queue.heartbeat(self.job):
+                        self.lost.set()
+                        break
+                except sqlite3.Error as error:
+                    # Retried at the next interval, the lease outlasts a few misses
+                    logger.warning(
+                        "Heartbeat of %s failed", self.job.path, exc_info=error
+                    )
+        finally:
+            self.job_queue.data_manager.close_thread_connection()
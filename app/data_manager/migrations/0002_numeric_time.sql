@@ -0,0 +1,50 @@
+-- Store times as integer frames and milliseconds instead of timedelta strings.
+-- timedelta_ms, video_fps and parent_folder are functions registered by the DataManager.
+
+CREATE TABLE video_new (
+ id TEXT PRIMARY KEY,
+ title TEXT NOT NULL,
+ folder TEXT NOT NULL,
+ date DATETIME NOT NULL,
+ totaldetections INTEGER NOT NULL,
+ fps REAL,
+ videolengthms INTEGER NOT NULL,
+ outputvideolengthms INTEGER NOT NULL
+);
+
+INSERT INTO video_new
+ (id, title, folder, date, totaldetections, fps, videolengthms, outputvideolengthms)
+ SELECT id, title, parent_folder(id), date, totaldetections, video_fps(id),
+  timedelta_ms(videolength), timedelta_ms(outputvideolength)
+ FROM video;
+
+-- Frames are only known if the video could be probed for its frame rate
+CREATE TABLE detection_new (
+ id INTEGER PRIMARY KEY AUTOINCREMENT,
+ videoid TEXT NOT NULL,
+ startframe INTEGER,
+ endframe INTEGER,
+ startms INTEGER NOT NULL,
+ endms INTEGER NOT NULL,
+ FOREIGN KEY (videoid) REFERENCES video(id)
+);
+
+INSERT INTO detection_new (id, videoid, startframe, endframe, startms, endms)
+ SELECT detection.id, detection.videoid,
+  CAST(ROUND(timedelta_ms(detection.starttime) * video_new.fps / 1000.0) AS INTEGER),
+  CAST(ROUND(timedelta_ms(detection.endtime) * video_new.fps / 1000.0) AS INTEGER),
+  timedelta_ms(detection.starttime), timedelta_ms(detection.endtime)
+ FROM detection
+ LEFT JOIN video_new ON video_new.id = detection.videoid;
+
+DROP TABLE detection;
+DROP TABLE video;
+
+ALTER TABLE video_new RENAME TO video;
+ALTER TABLE detection_new RENAME TO detection;
+
+CREATE INDEX detection_videoid_index ON detection(videoid, startms);
+
+CREATE INDEX video_title_index ON video(title);
+
+CREATE INDEX video_folder_date_index ON video(folder, date);
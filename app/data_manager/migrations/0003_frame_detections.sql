@@ -0,0 +1,24 @@
+-- Optional per-frame detections, stored as one encoded blob per frame range.
+-- See app/data_manager/frame_detections.py for the layout of data.
+
+CREATE TABLE framedetection (
+ id INTEGER PRIMARY KEY AUTOINCREMENT,
+ videoid TEXT NOT NULL,
+ startframe INTEGER NOT NULL,
+ endframe INTEGER NOT NULL,
+ count INTEGER NOT NULL,
+ width INTEGER NOT NULL,
+ height INTEGER NOT NULL,
+ data BLOB NOT NULL,
+ FOREIGN KEY (videoid) REFERENCES video(id)
+);
+
+CREATE INDEX framedetection_videoid_index ON framedetection(videoid, startframe);
+
+CREATE TABLE detectionclass (
+ videoid TEXT NOT NULL,
+ classid INTEGER NOT NULL,
+ name TEXT NOT NULL,
+ PRIMARY KEY (videoid, classid),
+ FOREIGN KEY (videoid) REFERENCES video(id)
+);
@@ -0,0 +1,14 @@
+-- Spatial index over the per-frame detections, one entry per detection.
+-- Boxes are stored quantized relative to the frame size, 0 to 65535, so regions can be
+-- queried across videos of different sizes. chunk is the id of the framedetection row
+-- holding the detection, which also links the entry to its video.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS detectionbox USING rtree_i32(
+ id,
+ minchunk, maxchunk,
+ minframe, maxframe,
+ minx, maxx,
+ miny, maxy,
+ minclass, maxclass,
+ +confidence REAL
+);
@@ -0,0 +1,18 @@
+-- Per-video summary, updated together with the detections of the video so reports
+-- and dashboards read one row per video instead of scanning every detection.
+-- classcounts is a JSON object of class name to number of detected boxes.
+
+CREATE TABLE IF NOT EXISTS videosummary (
+ videoid TEXT PRIMARY KEY,
+ rangecount INTEGER NOT NULL,
+ detectedms INTEGER NOT NULL,
+ classcounts TEXT,
+ maxconfidence REAL,
+ framecount INTEGER,
+ processingseconds REAL
+);
+
+INSERT OR IGNORE INTO videosummary (videoid, rangecount, detectedms)
+ SELECT videoid, COUNT(*), SUM(endms - startms)
+ FROM detection
+ GROUP BY videoid;
@@ -0,0 +1,19 @@
+-- Manifest of processed videos, so folder runs skip videos whose outputs are current.
+-- A video is current if it was processed with the same content fingerprint, output
+-- settings hash and model hash, and its output still exists. outputpath is NULL when
+-- nothing was detected, so there is no output video. size and mtimens are the source
+-- file's when processed, so unchanged files are matched without reading them.
+
+CREATE TABLE IF NOT EXISTS processedvideo (
+ path TEXT PRIMARY KEY,
+ size INTEGER NOT NULL,
+ mtimens INTEGER NOT NULL,
+ fingerprint TEXT NOT NULL,
+ settingshash TEXT NOT NULL,
+ modelhash TEXT NOT NULL,
+ outputpath TEXT,
+ processedat TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS processedvideo_key
+ ON processedvideo (fingerprint, settingshash, modelhash);
@@ -0,0 +1,17 @@
+-- Queue of videos shared by workers on one or more hosts. A worker claims a job by
+-- taking a lease until leaseexpires, renews it with heartbeats while processing,
+-- and marks the job done or failed. A running job whose lease expired is claimed
+-- again by another worker. Times are unix timestamps in seconds.
+
+CREATE TABLE IF NOT EXISTS job (
+ path TEXT PRIMARY KEY,
+ status TEXT NOT NULL DEFAULT 'pending',
+ worker TEXT,
+ leaseexpires REAL,
+ attempts INTEGER NOT NULL DEFAULT 0,
+ enqueuedat REAL NOT NULL,
+ finishedat REAL,
+ error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS job_status_index ON job (status, leaseexpires);
@@ -0,0 +1,13 @@
+-- Orders the job queue by an integer sequence instead of the enqueue time, which
+-- can't tell apart jobs enqueued within the precision of a float timestamp. Jobs
+-- already queued keep their order.
+
+ALTER TABLE job ADD COLUMN sequence INTEGER NOT NULL DEFAULT 0;
+
+UPDATE job SET sequence = (
+ SELECT COUNT(*) FROM job AS earlier
+ WHERE earlier.enqueuedat < job.enqueuedat
+ OR (earlier.enqueuedat = job.enqueuedat AND earlier.path <= job.path)
+);
+
+CREATE INDEX IF NOT EXISTS job_sequence_index ON job (sequence);
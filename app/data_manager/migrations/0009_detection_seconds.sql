@@ -0,0 +1,6 @@
+-- Stores the seconds spent detecting in each video, which the throughput of new
+-- videos is estimated from. processingseconds also counts loading cached detections,
+-- probing and cutting. It's unknown for the videos processed before, and stays NULL
+-- for videos whose detections were cached or resumed from a checkpoint.
+
+ALTER TABLE videosummary ADD COLUMN detectionseconds REAL;
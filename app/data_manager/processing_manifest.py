@@ -0,0 +1,136 @@
+"""Decides which videos of a folder need processing, from the processing manifest.
+
+A video is skipped when its content was already processed with the same output
+settings and model, and the output still exists. Files that haven't changed since
+they were processed are matched by path, size and modification time without being
+read, so rerunning a folder only costs reading the new files.
+"""
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from app import settings
+from app.data_manager.data_manager import DataManager
+from app.video_processor.fingerprint import fingerprint_file, hash_file
+from app.video_processor.scan import ScannedVideo
+
+# Settings that change the outputs of a video, a change reprocesses every video
+OUTPUT_SETTINGS = (
+    "prediction_threshold",
+    "max_detections",
+    "frame_buffer_seconds",
+    "buffer_before",
+    "buffer_after",
+    "box_around_fish",
+    "video_crf",
+    "encoder_profile",
+    "store_frame_detections",
+)
+
+
+def output_settings_hash(output_folder: Path) -> str:
+    """Get a hash of the settings that change the outputs of a video.
+
+    Args:
+        output_folder: The folder the outputs are written to.
+
+    Returns:
+        The hash as a hex string.
+    """
+    identity = {name: getattr(settings, name) for name in OUTPUT_SETTINGS}
+    identity["output_folder"] = str(Path(output_folder).resolve())
+    return hashlib.sha256(
+        json.dumps(identity, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def upsert_processed_video(cursor: sqlite3.Cursor, row: Tuple[Any, ...]) -> None:
+    """Records a processed video in the manifest, within a transaction.
+
+    Args:
+        cursor: The cursor of the transaction.
+        row: The manifest row, see ProcessingManifest.row.
+    """
+    cursor.execute(
+        """INSERT OR REPLACE INTO processedvideo
+        (path, size, mtimens, fingerprint, settingshash, modelhash, outputpath,
+        processedat)
+        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+        row,
+    )
+
+
+class ProcessingManifest:
+    """The processing manifest of one run over a folder."""
+
+    def __init__(
+        self, data_manager: DataManager, output_folder: Path, weights_path: Path
+    ) -> None:
+        """Hashes the output settings and the model once for the run
+
+        Args:
+            data_manager (DataManager): the database with the manifest
+            output_folder (Path): the folder the outputs are written to
+            weights_path (Path): the weights of the model
+        """
+        self.data_manager = data_manager
+        self.settings_hash = output_settings_hash(output_folder)
+        self.model_hash = hash_file(weights_path)
+        self.__fingerprints: Dict[Path, str] = {}
+
+    def fingerprint(self, video: ScannedVideo) -> str:
+        """Gets the fingerprint of a video, from the manifest if the file is unchanged"""
+        if video.path not in self.__fingerprints:
+            row = self.data_manager.sqlite_connection.execute(
+                """SELECT fingerprint FROM processedvideo
+                WHERE path = ? AND size = ? AND mtimens = ?""",
+                (str(video.path), video.size, video.mtime_ns),
+            ).fetchone()
+            self.__fingerprints[video.path] = (
+                fingerprint_file(video.path) if row is None else str(row[0])
+            )
+        return self.__fingerprints[video.path]
+
+    def is_current(self, video: ScannedVideo) -> bool:
+        """Checks if a video was processed with the current settings and model and its
+        output still exists
+
+        Args:
+            video (ScannedVideo): the video to check
+
+        Returns:
+            bool: True if the video can be skipped
+        """
+        outputs: List[str | None] = [
+            row[0]
+            for row in self.data_manager.sqlite_connection.execute(
+                """SELECT outputpath FROM processedvideo
+                WHERE fingerprint = ? AND settingshash = ? AND modelhash = ?""",
+                (self.fingerprint(video), self.settings_hash, self.model_hash),
+            )
+        ]
+        return any(output is None or Path(output).exists() for output in outputs)
+
+    def row(self, video: ScannedVideo, output_path: Path | None) -> Tuple[Any, ...]:
+        """Get the manifest row of a processed video
+
+        Args:
+            video (ScannedVideo): the processed video
+            output_path (Path | None): the output video, None if nothing was detected
+
+        Returns:
+            Tuple[Any, ...]: the row, to write with DatabaseWriter.add_processed_video:
+                path, size, modification time, fingerprint, settings hash, model hash
+                and output path
+        """
+        return (
+            str(video.path),
+            video.size,
+            video.mtime_ns,
+            self.fingerprint(video),
+            self.settings_hash,
+            self.model_hash,
+            None if output_path is None else str(output_path),
+        )
@@ -0,0 +1,280 @@
+"""Reads the videos and detections of the database for the reports and exports."""
+import datetime
+import json
+import sqlite3
+import typing
+
+from app.data_manager.data_manager import DataManager
+from app.logger import get_logger
+
+logger = get_logger()
+
+
+class ReportQueries:
+    """The report and export queries of a database."""
+
+    def __init__(self, data_manager: DataManager) -> None:
+        """Sets up the queries
+
+        Args:
+            data_manager (DataManager): the database to read from
+        """
+        self.data_manager = data_manager
+
+    def get_video_data(self, video_search: typing.List[str]) -> typing.List[typing.Any]:
+        """Returns data about the video
+
+        Args:
+            video_search (List[str]): A list of video ids to get the data of
+
+        Returns:
+            typing.List[typing.Any]: The list of data from the video data table
+        """
+
+        try:
+            # The ids are passed as a single JSON array parameter,
+            # so the statement stays the same for any number of videos
+            records = self.data_manager.sqlite_connection.execute(
+                """SELECT title, date, videolengthms, outputvideolengthms FROM video
+                WHERE id IN (SELECT value FROM json_each(?))
+                ORDER BY title, id""",
+                (json.dumps(video_search),),
+            ).fetchall()
+
+            return [
+                (title, date, format_milliseconds(length), format_milliseconds(output))
+                for title, date, length, output in records
+            ]
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+            return []
+
+    def get_video_summaries(
+        self, video_search: typing.List[str]
+    ) -> typing.List[typing.Any]:
+        """Returns the summary of each video, read from one row per video
+
+        Args:
+            video_search (List[str]): A list of video ids to get the summaries of
+
+        Returns:
+            typing.List[typing.Any]: For each video the title, date, input and output
+                                     length, number of detections, detected time,
+                                     detected classes, max confidence and processing FPS
+        """
+
+        try:
+            records = self.data_manager.sqlite_connection.execute(
+                """SELECT video.title, video.date, video.videolengthms,
+                video.outputvideolengthms, videosummary.rangecount,
+                videosummary.detectedms, videosummary.classcounts,
+                videosummary.maxconfidence, videosummary.framecount,
+                videosummary.processingseconds
+                FROM video
+                LEFT JOIN videosummary ON videosummary.videoid = video.id
+                WHERE video.id IN (SELECT value FROM json_each(?))
+                ORDER BY video.title, video.id""",
+                (json.dumps(video_search),),
+            ).fetchall()
+
+            return [
+                (
+                    title,
+                    date,
+                    format_milliseconds(length),
+                    format_milliseconds(output),
+                    range_count or 0,
+                    format_milliseconds(detected_ms or 0),
+                    ", ".join(
+                        f"{name}: {count}"
+                        for name, count in json.loads(class_counts or "{}").items()
+                    ),
+                    f"{max_confidence:.2f}" if max_confidence is not None else "",
+                    f"{frame_count / processing_seconds:.1f}"
+                    if frame_count and processing_seconds
+                    else "",
+                )
+                for (
+                    title,
+                    date,
+                    length,
+                    output,
+                    range_count,
+                    detected_ms,
+                    class_counts,
+                    max_confidence,
+                    frame_count,
+                    processing_seconds,
+                ) in records
+            ]
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+            return []
+
+    def get_data(self, video_search: typing.List[str]) -> typing.List[typing.Any]:
+        """Returns all the data necessary to write a report
+
+        Args:
+            video_search (List[str]): A list of video ids which are used to find data about
+                                      detections the given videos
+
+        Returns:
+            Typing.List[typing.Any]: A list of all selected elements from the database,
+                                     where an element consists of video title, detection id,
+                                     detection starttime and detection end time
+        """
+        return list(self.iter_data(video_search))
+
+    def iter_data(self, video_search: typing.List[str]) -> typing.Iterator[typing.Any]:
+        """Returns the same data as get_data, read from the cursor as it is iterated,
+        so reports over many detections don't hold all of them in memory
+
+        Args:
+            video_search (List[str]): A list of video ids which are used to find data about
+                                      detections the given videos
+
+        Returns:
+            Typing.Iterator[typing.Any]: video title, detection id, detection starttime and
+                                         detection end time of each detection
+        """
+
+        try:
+            cursor = self.data_manager.sqlite_connection.execute(
+                """SELECT video.title, detection.id,
+                detection.startms, detection.endms
+                FROM video
+                LEFT JOIN detection ON video.id = detection.videoid
+                WHERE video.id IN (SELECT value FROM json_each(?))
+                ORDER BY video.title, video.id, detection.id""",
+                (json.dumps(video_search),),
+            )
+
+            for title, detection_id, start, end in cursor:
+                yield (
+                    title,
+                    detection_id,
+                    format_milliseconds(start),
+                    format_milliseconds(end),
+                )
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+
+    def iter_video_export(
+        self, video_search: typing.List[str]
+    ) -> typing.Iterator[typing.Tuple[typing.Any, ...]]:
+        """Returns the unformatted video and summary columns of each video, for exports
+
+        Args:
+            video_search (List[str]): A list of video ids to get the data of
+
+        Returns:
+            Iterator[Tuple[Any, ...]]: id, title, folder, date, fps, length and output
+                length in milliseconds, range count, detected milliseconds, class counts
+                as JSON, max confidence, frame count and processing seconds
+        """
+        try:
+            yield from self.data_manager.sqlite_connection.execute(
+                """SELECT video.id, video.title, video.folder, video.date, video.fps,
+                video.videolengthms, video.outputvideolengthms,
+                videosummary.rangecount, videosummary.detectedms,
+                videosummary.classcounts, videosummary.maxconfidence,
+                videosummary.framecount, videosummary.processingseconds
+                FROM video
+                LEFT JOIN videosummary ON videosummary.videoid = video.id
+                WHERE video.id IN (SELECT value FROM json_each(?))
+                ORDER BY video.title, video.id""",
+                (json.dumps(video_search),),
+            )
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+
+    def iter_detection_export(
+        self, video_search: typing.List[str]
+    ) -> typing.Iterator[typing.Tuple[typing.Any, ...]]:
+        """Returns the unformatted columns of each detection, for exports
+
+        Args:
+            video_search (List[str]): A list of video ids to get the detections of
+
+        Returns:
+            Iterator[Tuple[Any, ...]]: video id, video title, detection id, start and end
+                                       frame, start and end in milliseconds
+        """
+        try:
+            yield from self.data_manager.sqlite_connection.execute(
+                """SELECT detection.videoid, video.title, detection.id,
+                detection.startframe, detection.endframe,
+                detection.startms, detection.endms
+                FROM video
+                JOIN detection ON video.id = detection.videoid
+                WHERE video.id IN (SELECT value FROM json_each(?))
+                ORDER BY video.title, video.id, detection.id""",
+                (json.dumps(video_search),),
+            )
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+
+    def get_detection_frames(
+        self, video_search: typing.List[str]
+    ) -> typing.List[typing.Tuple[str, int, int]]:
+        """Returns the video id, detection id and start frame of each detection
+
+        Args:
+            video_search (List[str]): A list of video ids to get the detections of
+
+        Returns:
+            List[Tuple[str, int, int]]: the detections with a known start frame
+        """
+        try:
+            return self.data_manager.sqlite_connection.execute(
+                """SELECT detection.videoid, detection.id, detection.startframe
+                FROM video
+                JOIN detection ON video.id = detection.videoid
+                WHERE video.id IN (SELECT value FROM json_each(?))
+                AND detection.startframe IS NOT NULL""",
+                (json.dumps(video_search),),
+            ).fetchall()
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+            return []
+
+    def get_detection_time_by_month(self) -> typing.List[typing.Tuple[str, str, int]]:
+        """Returns the total time with detections per folder and month
+
+        Returns:
+            typing.List[typing.Tuple[str, str, int]]: list of folder, month as YYYY-MM and
+                                                      total detection time in milliseconds
+        """
+        try:
+            return self.data_manager.sqlite_connection.execute(
+                """SELECT video.folder, strftime('%Y-%m', video.date) AS month,
+                SUM(detection.endms - detection.startms)
+                FROM video
+                JOIN detection ON video.id = detection.videoid
+                GROUP BY video.folder, month
+                ORDER BY video.folder, month"""
+            ).fetchall()
+
+        except sqlite3.Error as error:
+            logger.error("Failed to read data from sqlite table", exc_info=error)
+            return []
+
+
+def format_milliseconds(milliseconds: int | None) -> str:
+    """Formats milliseconds for reports in the format H:MM:SS.ffffff
+
+    Args:
+        milliseconds (int | None): the time in milliseconds
+
+    Returns:
+        str: the formatted time, empty if there is no time
+    """
+    if milliseconds is None:
+        return ""
+    return str(datetime.timedelta(milliseconds=milliseconds))
@@ -0,0 +1,59 @@
+"""Statistics of a processed video, stored in the per-video summary."""
+from dataclasses import dataclass
+from typing import Any, Dict, Sequence
+
+
+@dataclass
+class DetectionStatistics:
+    """Statistics of the detection run on one video."""
+
+    class_counts: Dict[str, int]
+    max_confidence: float | None
+    frame_count: int
+    processing_seconds: float
+    # Seconds spent detecting in every frame, None if the detections were cached or
+    # resumed from a checkpoint
+    detection_seconds: float | None = None
+
+    @property
+    def frames_per_second(self) -> float:
+        """The processing throughput in frames per second"""
+        if self.processing_seconds <= 0:
+            return 0.0
+        return self.frame_count / self.processing_seconds
+
+
+def summarize_predictions(
+    predictions: Sequence[Sequence[Dict[str, Any]] | None],
+    processing_seconds: float,
+    detection_seconds: float | None = None,
+) -> DetectionStatistics:
+    """Counts the detected boxes per class and finds the highest confidence.
+
+    Args:
+        predictions: The predictions of every frame in the video, as returned by
+                     BatchYolov8.predict_batch.
+        processing_seconds: The time it took to process the video.
+        detection_seconds: The time spent detecting in every frame of the video,
+                           None if the predictions weren't all detected in this run.
+
+    Returns:
+        The statistics of the video.
+    """
+    class_counts: Dict[str, int] = {}
+    max_confidence: float | None = None
+    for frame_predictions in predictions:
+        for pred in frame_predictions or []:
+            name = str(pred["name"])
+            class_counts[name] = class_counts.get(name, 0) + 1
+            conf = float(pred["conf"])
+            if max_confidence is None or conf > max_confidence:
+                max_confidence = conf
+
+    return DetectionStatistics(
+        class_counts=class_counts,
+        max_confidence=max_confidence,
+        frame_count=len(predictions),
+        processing_seconds=processing_seconds,
+        detection_seconds=detection_seconds,
+    )
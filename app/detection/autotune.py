@@ -0,0 +1,386 @@
+"""Tunes the batch size, preprocessing threads and queue depth of the detection.
+
+The fastest settings depend on the GPU or CPU, the model and the resolution of the
+videos, so they are measured by detecting in the first seconds of a video with a few
+candidates, and cached per machine, device, model and resolution. Candidates whose
+memory use exceeds the limit are rejected.
+
+The parameters are tuned one at a time, each keeping the best value of the ones
+before it: the batch size with the default threads, then the threads, then the
+queue depth. A larger value is only kept if it is clearly faster, since it also uses
+more memory.
+"""
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass
+from multiprocessing import cpu_count
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import av
+import torch
+
+from app import settings
+from app.common import Common
+from app.detection.batch_yolov8 import BatchYolov8
+from app.detection.frame_grabber import ThreadedFrameGrabber
+from app.logger import get_logger
+from app.video_processor.fingerprint import hash_file
+from app.video_processor.probe import probe_video
+
+logger = get_logger()
+
+# Batch sizes tried, from the batch sizes the user can pick
+BATCH_SIZES = tuple(int(size) for size in Common.batch_size if size.isdigit())
+
+# Seconds of video each candidate detects in
+SAMPLE_SECONDS = 5.0
+
+# Max seconds a candidate is measured for, on slow machines
+MAX_MEASURE_SECONDS = 15.0
+
+# Min relative speedup for a larger value to be kept
+MIN_GAIN = 0.05
+
+CACHE_FILE = "autotune.json"
+
+
+@dataclass(frozen=True)
+class DetectionParameters:
+    """The batch size, preprocessing threads and queue depth of the detection."""
+
+    batch_size: int
+    # 0 uses the defaults of the frame grabber
+    grabber_workers: int = 0
+    queue_depth: int = 0
+    # Frames per second measured when tuning, 0 if not tuned
+    fps: float = 0.0
+
+
+# Used when nothing is tuned or tuning fails
+DEFAULT_PARAMETERS = DetectionParameters(batch_size=8)
+
+
+@dataclass(frozen=True)
+class Measurement:
+    """The speed and memory use of a candidate."""
+
+    fps: float
+    memory_bytes: int
+
+
+def __cache_key(model: BatchYolov8, width: int, height: int) -> str:
+    """The key of the tuning of a machine, device, model and resolution"""
+    return (
+        f"{platform.node()}|{model.device}|{hash_file(model.weights_path)}"
+        f"|{width}x{height}"
+    )
+
+
+def __load_tunings(cache_path: Path) -> Dict[str, Dict[str, float]]:
+    """Loads the cached tunings"""
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            tunings: Dict[str, Dict[str, float]] = json.load(file)
+            return tunings
+    except (OSError, ValueError) as err:
+        logger.warning("Failed to load detection tunings", exc_info=err)
+        return {}
+
+
+def __save_tuning(cache_path: Path, key: str, parameters: DetectionParameters) -> None:
+    """Adds a tuning to the cache"""
+    tunings = __load_tunings(cache_path)
+    tunings[key] = asdict(parameters)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(tunings, file)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.warning("Failed to cache detection tuning", exc_info=err)
+
+
+def cached_parameters(
+    model: BatchYolov8,
+    width: int,
+    height: int,
+    cache_folder: Path = Common.cache_folder,
+) -> DetectionParameters | None:
+    """Get the parameters tuned on this machine, without tuning.
+
+    Args:
+        model: The model the parameters were tuned for.
+        width: The width of the videos.
+        height: The height of the videos.
+        cache_folder: The folder the tunings are cached in.
+
+    Returns:
+        The parameters, or None if they weren't tuned for this model and resolution.
+    """
+    tuning = __load_tunings(cache_folder / CACHE_FILE).get(
+        __cache_key(model, width, height)
+    )
+    if tuning is None:
+        return None
+    try:
+        return DetectionParameters(
+            batch_size=int(tuning["batch_size"]),
+            grabber_workers=int(tuning["grabber_workers"]),
+            queue_depth=int(tuning["queue_depth"]),
+            fps=float(tuning["fps"]),
+        )
+    except (KeyError, TypeError, ValueError) as err:
+        logger.warning("Ignoring an invalid detection tuning", exc_info=err)
+        return None
+
+
+def __time_batches(
+    model: BatchYolov8,
+    frame_grabber: ThreadedFrameGrabber,
+    sample_frames: int,
+    max_seconds: float,
+) -> Tuple[int, float, int]:
+    """Detects in the batches of a frame grabber, timing all but the first
+
+    Returns:
+        The frames timed, the seconds they took, and the bytes of one frame and its
+        prepared image.
+    """
+    frames = 0
+    start_time = None
+    elapsed = 0.0
+    frame_bytes = 0
+    while not frame_grabber.is_done() and frames < sample_frames:
+        batch = frame_grabber.get_batch()
+        if batch is None:
+            continue
+        processed_batch, original_batch = batch
+        model.predict_batch(
+            original_batch, processed_batch, max_detections=settings.max_detections
+        )
+        if start_time is None:
+            start_time = time.perf_counter()
+            frame_bytes = original_batch[0].nbytes + (
+                processed_batch[0].numel() * processed_batch.element_size()
+            )
+            continue
+        frames += len(original_batch)
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= max_seconds:
+            break
+    return frames, elapsed, frame_bytes
+
+
+def measure(
+    model: BatchYolov8,
+    video_path: Path,
+    parameters: DetectionParameters,
+    sample_frames: int,
+    max_seconds: float = MAX_MEASURE_SECONDS,
+) -> Measurement:
+    """Detects in the first frames of a video and measures the speed and memory use.
+
+    The first batch warms up the model and the queues, so it isn't timed. On the GPU
+    the memory is the peak allocated by torch, on the CPU the frames and prepared
+    images that the queues can hold.
+
+    Args:
+        model: The model to detect with.
+        video_path: The video to detect in.
+        parameters: The candidate to measure.
+        sample_frames: The number of frames to time.
+        max_seconds: The max seconds to time for.
+
+    Returns:
+        The frames per second and memory use.
+    """
+    on_gpu = model.device.type == "cuda"
+    if on_gpu:
+        torch.cuda.reset_peak_memory_stats(model.device)
+
+    with ThreadedFrameGrabber(
+        batch_size=parameters.batch_size,
+        model=model,
+        video_path=video_path,
+        num_workers=parameters.grabber_workers,
+        queue_depth=parameters.queue_depth,
+    ) as frame_grabber:
+        queue_depth = frame_grabber.queue_depth
+        frames, elapsed, frame_bytes = __time_batches(
+            model, frame_grabber, sample_frames, max_seconds
+        )
+
+    if on_gpu:
+        memory_bytes = torch.cuda.max_memory_allocated(model.device)
+    else:
+        # Both queues full, and the batch being detected
+        memory_bytes = (2 * queue_depth + 1) * parameters.batch_size * frame_bytes
+    return Measurement(frames / elapsed if elapsed > 0 else 0.0, memory_bytes)
+
+
+def __worker_candidates(cpus: int) -> List[int]:
+    """Powers of two up to the number of CPUs, and half the CPUs"""
+    candidates = {max(1, cpus // 2)}
+    count = 1
+    while count <= cpus:
+        candidates.add(count)
+        count *= 2
+    return sorted(candidates)
+
+
+def tune(
+    model: BatchYolov8,
+    video_path: Path,
+    memory_limit_bytes: int,
+    sample_seconds: float = SAMPLE_SECONDS,
+) -> DetectionParameters:
+    """Finds the fastest parameters within a memory limit, without caching them.
+
+    Args:
+        model: The model to detect with.
+        video_path: The video to detect in, at least a few batches long.
+        memory_limit_bytes: The max memory a candidate may use.
+        sample_seconds: The seconds of video each candidate detects in.
+
+    Returns:
+        The fastest parameters, the defaults if no candidate could be measured.
+    """
+    video_info = probe_video(video_path)
+    sample_frames = max(1, int(video_info.fps * sample_seconds))
+    measurements: Dict[Tuple[int, int, int], Measurement] = {}
+
+    def is_faster(candidate: DetectionParameters, best: DetectionParameters) -> bool:
+        key = (candidate.batch_size, candidate.grabber_workers, candidate.queue_depth)
+        if key not in measurements:
+            try:
+                measurements[key] = measure(
+                    model,
+                    video_path,
+                    candidate,
+                    max(sample_frames, candidate.batch_size),
+                )
+            except torch.cuda.OutOfMemoryError:
+                logger.info("Batch size %s runs out of memory", candidate.batch_size)
+                measurements[key] = Measurement(0.0, memory_limit_bytes + 1)
+            logger.info("%s: %.2f FPS", candidate, measurements[key].fps)
+        measurement = measurements[key]
+        if measurement.fps <= 0 or measurement.memory_bytes > memory_limit_bytes:
+            return False
+        return measurement.fps > best.fps * (1 + MIN_GAIN)
+
+    def with_fps(candidate: DetectionParameters) -> DetectionParameters:
+        key = (candidate.batch_size, candidate.grabber_workers, candidate.queue_depth)
+        return DetectionParameters(*key, fps=measurements[key].fps)
+
+    workers = max(1, cpu_count() // 2)
+    best = DetectionParameters(0, workers, workers * 2)
+    for batch_size in BATCH_SIZES:
+        # Two batches are needed, the first one isn't timed
+        if 2 * batch_size > video_info.frame_count:
+            break
+        candidate = DetectionParameters(batch_size, workers, workers * 2)
+        if not is_faster(candidate, best):
+            break
+        best = with_fps(candidate)
+
+    if best.batch_size == 0:
+        logger.warning("Could not tune the detection on %s", video_path)
+        return DEFAULT_PARAMETERS
+
+    for workers in __worker_candidates(cpu_count()):
+        candidate = DetectionParameters(best.batch_size, workers, workers * 2)
+        if candidate.grabber_workers != best.grabber_workers and is_faster(
+            candidate, best
+        ):
+            best = with_fps(candidate)
+
+    for queue_depth in (best.grabber_workers, best.grabber_workers * 4):
+        candidate = DetectionParameters(
+            best.batch_size, best.grabber_workers, max(1, queue_depth)
+        )
+        if is_faster(candidate, best):
+            best = with_fps(candidate)
+
+    return best
+
+
+def memory_limit(model: BatchYolov8) -> int:
+    """The memory the detection may use, capped by the memory of the GPU"""
+    limit = settings.autotune_memory_mb * 1024 * 1024
+    if model.device.type == "cuda":
+        total = torch.cuda.get_device_properties(model.device).total_memory
+        limit = min(limit, int(total * 0.9))
+    return limit
+
+
+def autotune(
+    model: BatchYolov8,
+    video_path: Path,
+    cache_folder: Path = Common.cache_folder,
+    sample_seconds: float = SAMPLE_SECONDS,
+) -> DetectionParameters:
+    """Get the fastest parameters for a model and the resolution of a video.
+
+    The parameters are tuned on the first use on a machine and cached.
+
+    Args:
+        model: The model to detect with.
+        video_path: The video to tune on.
+        cache_folder: The folder to cache the tuning in.
+        sample_seconds: The seconds of video each candidate detects in.
+
+    Returns:
+        The tuned parameters.
+    """
+    video_info = probe_video(video_path)
+    parameters = cached_parameters(
+        model, video_info.width, video_info.height, cache_folder
+    )
+    if parameters is not None:
+        return parameters
+
+    parameters = tune(model, video_path, memory_limit(model), sample_seconds)
+    logger.info("Tuned the detection to %s", parameters)
+    if parameters.fps > 0:
+        __save_tuning(
+            cache_folder / CACHE_FILE,
+            __cache_key(model, video_info.width, video_info.height),
+            parameters,
+        )
+    return parameters
+
+
+def detection_parameters(
+    model: BatchYolov8, video_path: Path, allow_tuning: bool = True
+) -> DetectionParameters:
+    """Get the parameters to detect in a video with.
+
+    Args:
+        model: The model to detect with.
+        video_path: The video to detect in.
+        allow_tuning: Whether to tune if the batch size is auto and nothing is cached.
+                      Workers running side by side can't measure their own speed.
+
+    Returns:
+        The batch size from the settings, or the tuned parameters if it is auto.
+    """
+    if settings.batch_size > 0:
+        return DetectionParameters(settings.batch_size)
+
+    try:
+        if allow_tuning:
+            return autotune(model, video_path)
+        video_info = probe_video(video_path)
+        return (
+            cached_parameters(model, video_info.width, video_info.height)
+            or DEFAULT_PARAMETERS
+        )
+    except (OSError, RuntimeError, av.error.FFmpegError) as err:
+        logger.warning("Failed to tune the detection", exc_info=err)
+        return DEFAULT_PARAMETERS
@@ -39,6 +39,7 @@ class BatchYolov8:  # pylint: disable=too-many-instance-attributes
             logger.error("Failed to select device", exc_info=err)
             raise RuntimeError("Failed to select device", err) from err
 
+        self.weights_path = Path(weights_path)
         self.weights_name = os.path.split(weights_path)[-1]
 
         try:
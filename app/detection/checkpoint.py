@@ -0,0 +1,97 @@
+"""Checkpoints of the detections of a video while it is being processed.
+
+The predictions of the frames processed so far are saved periodically, so a long
+video that is stopped or crashes resumes from the last checkpoint instead of the
+first frame. Checkpoints are stored under the detection cache key of the video, so
+they are only resumed with the same video, model and inference parameters.
+"""
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.common import Common
+from app.detection.detection_cache import (
+    DetectionCacheKey,
+    Predictions,
+    arrays_to_predictions,
+    predictions_to_arrays,
+)
+from app.logger import get_logger
+
+logger = get_logger()
+
+CHECKPOINT_FOLDER = Common.cache_folder / "checkpoints"
+
+
+def checkpoint_path(
+    key: DetectionCacheKey, checkpoint_folder: Path = CHECKPOINT_FOLDER
+) -> Path:
+    """Get the path of the checkpoint of a video.
+
+    Args:
+        key: The cache key of the detections of the video.
+        checkpoint_folder: The folder of the checkpoints.
+
+    Returns:
+        The path of the checkpoint.
+    """
+    return checkpoint_folder / f"{key.digest}.npz"
+
+
+def save_checkpoint(
+    path: Path, predictions: Sequence[Sequence[Dict[str, Any]] | None]
+) -> None:
+    """Save the predictions of the frames processed so far.
+
+    Args:
+        path: The path of the checkpoint.
+        predictions: The predictions of every processed frame, from the first frame.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Replace the previous checkpoint atomically so a crash keeps one of them intact
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp_path, **predictions_to_arrays(predictions))
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logger.warning("Failed to save checkpoint %s", path, exc_info=err)
+
+
+def load_checkpoint(
+    path: Path,
+    names: Dict[int, str] | Sequence[str],
+    colors: List[Tuple[int, int, int]],
+) -> Predictions | None:
+    """Load the predictions saved in a checkpoint.
+
+    Args:
+        path: The path of the checkpoint.
+        names: The class names of the model.
+        colors: The class colors of the model.
+
+    Returns:
+        The predictions of every processed frame, or None if there is no checkpoint.
+    """
+    if not path.exists():
+        return None
+
+    try:
+        with np.load(path) as data:
+            return arrays_to_predictions(data, names, colors)
+    except (OSError, KeyError, ValueError) as err:
+        logger.warning("Failed to load checkpoint %s", path, exc_info=err)
+        return None
+
+
+def remove_checkpoint(path: Path) -> None:
+    """Remove the checkpoint of a video once its detections are complete.
+
+    Args:
+        path: The path of the checkpoint.
+    """
+    try:
+        path.unlink(missing_ok=True)
+    except OSError as err:
+        logger.warning("Failed to remove checkpoint %s", path, exc_info=err)
@@ -2,7 +2,7 @@
 import threading
 import time
 from pathlib import Path
-from typing import Any, Callable, List, Tuple
+from typing import Any, Callable, Dict, List, Sequence, Tuple
 
 import cv2
 import torch
@@ -11,6 +11,8 @@ from ultralytics.yolo.utils.plotting import Annotator
 
 from app import settings
 from app.logger import get_logger
+from app.video_processor import Detection
+from app.video_processor.probe import probe_video
 
 from .batch_yolov8 import BatchYolov8
 from .frame_grabber import ThreadedFrameGrabber
@@ -93,6 +95,39 @@ def __process_batch(
     return predictions, delta
 
 
+def __resume_from(
+    resume_predictions: List[Any] | None, output_path: Path | None
+) -> List[Any]:
+    """Get the predictions to continue from, a copy of the checkpointed ones.
+
+    Raises:
+        ValueError: If resuming a video that is being annotated.
+    """
+    predictions = list(resume_predictions or [])
+    if len(predictions) > 0 and output_path is not None:
+        raise ValueError("Can't resume a video that is being annotated")
+    if len(predictions) > 0:
+        logger.info("Resuming from frame %s", len(predictions))
+    return predictions
+
+
+def __checkpoint(
+    on_checkpoint: Callable[[List[Any]], None] | None,
+    predictions: List[Any],
+    last_checkpoint: float,
+    checkpoint_seconds: float,
+) -> float:
+    """Call on_checkpoint if checkpoint_seconds have passed since the last checkpoint.
+
+    Returns:
+        The time of the last checkpoint.
+    """
+    if on_checkpoint is None or time.time() - last_checkpoint < checkpoint_seconds:
+        return last_checkpoint
+    on_checkpoint(predictions)
+    return time.time()
+
+
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 def process_video(
@@ -103,16 +138,33 @@ def process_video(
     output_path: Path | None,
     stop_event: threading.Event,
     notify_progress: Callable[[int], None] | None = None,
+    resume_predictions: List[Any] | None = None,
+    on_checkpoint: Callable[[List[Any]], None] | None = None,
+    checkpoint_seconds: float = 60,
+    grabber_workers: int = 0,
+    queue_depth: int = 0,
 ) -> Tuple[List[int], List[torch.Tensor]]:
     """Runs inference on a video.
     And returns a list of frames containing fish and a list of predictions for each frame.
 
+    Long videos can be checkpointed and resumed: on_checkpoint is called with the
+    predictions so far every checkpoint_seconds and when stopped, and passing those
+    predictions as resume_predictions continues from the frame after them.
+
     Args:
         model: The Yolov8 batcher model.
         video_path: The path to the video to process.
         batch_size: The batch size.
         max_batches_to_queue: The maximum number of batches to queue.
         output_path: The path to save the output video to.
+        resume_predictions: The predictions of the frames processed before, from a
+                            checkpoint. Can't be combined with output_path.
+        on_checkpoint: Called with the predictions of every processed frame so far.
+        checkpoint_seconds: The seconds between checkpoints.
+        grabber_workers: The number of frame preprocessing threads, 0 uses half
+                         the CPUs.
+        queue_depth: The max batches waiting to be preprocessed and detected, 0 uses
+                     twice the number of preprocessing threads.
 
     Returns:
         A tuple containing:
@@ -120,33 +172,50 @@ def process_video(
         2. A list of predictions for each frame.
     """
 
+    predictions_per_frame: List[torch.Tensor] = __resume_from(
+        resume_predictions, output_path
+    )
+
     with ThreadedFrameGrabber(
         model=model,
         video_path=video_path,
         batch_size=batch_size,
+        start_frame=len(predictions_per_frame),
+        num_workers=grabber_workers,
+        queue_depth=queue_depth,
     ) as frame_grabber:
         if output_path is not None:
-            vid_cap = frame_grabber.capture
+            video_info = probe_video(video_path)
             video_writer = __create_video_writer(
                 save_path=output_path,
-                fps=vid_cap.get(cv2.CAP_PROP_FPS),
-                width=int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                height=int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                fps=video_info.fps,
+                width=video_info.width,
+                height=video_info.height,
             )
 
-        frames_with_fish = []
+        frames_with_fish = frames_with_detections(predictions_per_frame)
         fps_count = 0.0
-        frame_count = 0
-        processed_frames = 0
-
-        predictions_per_frame: List[torch.Tensor] = []
+        frame_count = len(predictions_per_frame)
+        processed_frames = frame_count
+        batches_processed = 0
+        last_checkpoint = time.time()
 
         with tqdm(
-            total=frame_grabber.frame_count, desc="Processing frames", leave=False
+            total=frame_grabber.frame_count,
+            initial=frame_count,
+            desc="Processing frames",
+            leave=False,
         ) as pbar:
             while not frame_grabber.is_done():
                 if stop_event.is_set():
                     logger.info("Stopping video processing")
+                    # Always due, the predictions so far are lost otherwise
+                    __checkpoint(
+                        on_checkpoint,
+                        predictions_per_frame,
+                        last_checkpoint=0,
+                        checkpoint_seconds=0,
+                    )
                     break
 
                 batch = frame_grabber.get_batch()
@@ -161,6 +230,7 @@ def process_video(
 
                 batch_fps = len(processed_batch) / delta
                 fps_count += batch_fps
+                batches_processed += 1
                 processed_frames += len(processed_batch)
                 pbar.update(len(processed_batch))
                 pbar.set_description(f"Processing frames (FPS: {batch_fps:.2f})")
@@ -184,6 +254,13 @@ def process_video(
                 # Update the frame count
                 frame_count += len(original_batch)
 
+                last_checkpoint = __checkpoint(
+                    on_checkpoint,
+                    predictions_per_frame,
+                    last_checkpoint,
+                    checkpoint_seconds,
+                )
+
                 if notify_progress is not None:
                     notify_progress(
                         int((processed_frames / frame_grabber.frame_count) * 100)
@@ -204,11 +281,8 @@ def process_video(
             )
 
         # Will be 0 if stop_event is set before any frames are processed
-        if processed_frames > 0:
-            logger.info(
-                "Average FPS: %s",
-                {fps_count / (processed_frames / frame_grabber.batch_size)},
-            )
+        if batches_processed > 0:
+            logger.info("Average FPS: %s", fps_count / batches_processed)
 
     return frames_with_fish, predictions_per_frame
 
@@ -247,3 +321,99 @@ def detected_frames_to_ranges(
     frame_ranges.append((start_frame, end_frame))
 
     return frame_ranges
+
+
+def add_buffer_to_ranges(
+    frame_ranges: List[Tuple[int, int]],
+    fps: float,
+    frame_count: int,
+    buffer_before: float,
+    buffer_after: float,
+) -> List[Tuple[int, int]]:
+    """Add buffer time before and after each frame range and merge overlapping ranges.
+
+    Args:
+        frame_ranges: The sorted frame ranges.
+        fps: The frame rate of the video.
+        frame_count: The number of frames in the video.
+        buffer_before: The seconds to add before each range.
+        buffer_after: The seconds to add after each range.
+
+    Returns:
+        The buffered and merged frame ranges.
+    """
+    # Add buffer time to each frame range
+    frame_ranges_with_buffer = [
+        (
+            max(0, start_frame - int(fps * buffer_before)),
+            min(frame_count, end_frame + int(fps * buffer_after)),
+        )
+        for (start_frame, end_frame) in frame_ranges
+    ]
+
+    # Merge overlapping frame ranges
+    merged_ranges: List[Tuple[int, int]] = []
+    for start_frame, end_frame in frame_ranges_with_buffer:
+        if not merged_ranges or start_frame > merged_ranges[-1][1]:
+            merged_ranges.append((start_frame, end_frame))
+        else:
+            merged_ranges[-1] = (
+                merged_ranges[-1][0],
+                max(merged_ranges[-1][1], end_frame),
+            )
+
+    return merged_ranges
+
+
+def filter_predictions(
+    predictions: Sequence[Sequence[Dict[str, Any]] | None], threshold: float
+) -> List[List[Dict[str, Any]]]:
+    """Keep only the predictions with a confidence of at least the threshold.
+
+    Predictions recorded at a low confidence floor can be filtered to any higher
+    threshold, giving the same detections as running the model at that threshold.
+
+    Args:
+        predictions: The predictions of every frame.
+        threshold: The confidence threshold, from 0 to 1.
+
+    Returns:
+        The predictions of every frame above the threshold.
+    """
+    return [
+        [pred for pred in frame_predictions or [] if pred["conf"] >= threshold]
+        for frame_predictions in predictions
+    ]
+
+
+def frames_with_detections(
+    predictions: Sequence[Sequence[Dict[str, Any]] | None]
+) -> List[int]:
+    """Get the frames with at least one prediction."""
+    return [
+        frame
+        for frame, frame_predictions in enumerate(predictions)
+        if frame_predictions is not None and len(frame_predictions) > 0
+    ]
+
+
+def predictions_to_detections(
+    predictions: Sequence[Sequence[Dict[str, Any]] | None]
+) -> Dict[int, List[Detection]]:
+    """Convert the predictions to a dictionary of frame number to detections."""
+    detections: Dict[int, List[Detection]] = {}
+    for frame, frame_predictions in enumerate(predictions):
+        detections[frame] = []
+        for pred in frame_predictions or []:
+            bndbox = pred["bndbox"]
+            detections[frame].append(
+                Detection(
+                    label=str(pred["name"]),
+                    confidence=float(pred["conf"]),
+                    xmin=int(bndbox["xmin"]),
+                    ymin=int(bndbox["ymin"]),
+                    xmax=int(bndbox["xmax"]),
+                    ymax=int(bndbox["ymax"]),
+                )
+            )
+    return detections
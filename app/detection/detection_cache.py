@@ -0,0 +1,254 @@
+"""Content-addressed cache of the per-frame detections of videos.
+
+Detection results only depend on the content of the video, the model weights and the
+inference parameters, so they are cached under a key made from those. Changing how the
+detections are turned into ranges and cut, like the buffers or the output folder, then
+reuses the detections instead of running the model again.
+
+The cache is bounded in size on disk, evicting the least recently used results first.
+"""
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app import settings
+from app.common import Common
+from app.data_manager.frame_detections import prediction_boxes
+from app.detection.batch_yolov8 import BatchYolov8
+from app.logger import get_logger
+from app.video_processor.fingerprint import fingerprint_file, hash_file
+
+logger = get_logger()
+
+# Bump when the layout of the cached detections changes
+CACHE_VERSION = 1
+
+Predictions = List[List[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class DetectionCacheKey:  # pylint: disable=too-many-instance-attributes
+    """Everything the detections of a video depend on."""
+
+    video: str
+    weights: str
+    imgsz: Any
+    conf_thres: float
+    iou_thres: float
+    max_detections: int
+    classes: Any
+    agnostic_nms: bool
+    augment: bool
+
+    @property
+    def digest(self) -> str:
+        """A hash of the key, used as the file name of the cached detections."""
+        identity = json.dumps([CACHE_VERSION, asdict(self)], sort_keys=True)
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def detection_cache_key(model: BatchYolov8, video_path: Path) -> DetectionCacheKey:
+    """Get the cache key of the detections of a video with a model.
+
+    Args:
+        model: The model with the inference parameters to detect with.
+        video_path: The video to detect in.
+
+    Returns:
+        The cache key.
+    """
+    return DetectionCacheKey(
+        video=fingerprint_file(video_path),
+        weights=hash_file(model.weights_path),
+        imgsz=model.imgsz,
+        conf_thres=float(model.conf_thres),
+        iou_thres=float(model.iou_thres),
+        max_detections=settings.max_detections,
+        classes=model.classes,
+        agnostic_nms=model.agnostic_nms,
+        augment=model.augment,
+    )
+
+
+def predictions_to_arrays(
+    predictions: Sequence[Sequence[Dict[str, Any]] | None]
+) -> Dict[str, np.ndarray[Any, Any]]:
+    """Converts the predictions of every frame to arrays with one row per detection.
+
+    Args:
+        predictions: The predictions of every frame, as returned by
+                     BatchYolov8.predict_batch.
+
+    Returns:
+        The frame count, and the frame, class id, confidence and box of each detection.
+    """
+    detections = [
+        (frame, pred)
+        for frame, frame_predictions in enumerate(predictions)
+        for pred in frame_predictions or []
+    ]
+    return {
+        "frame_count": np.asarray(len(predictions), dtype=np.int64),
+        "frame": np.asarray([frame for frame, _ in detections], dtype=np.int64),
+        "class_id": np.asarray(
+            [pred["class_id"] for _, pred in detections], dtype=np.int64
+        ),
+        "conf": np.asarray([pred["conf"] for _, pred in detections], dtype=np.float64),
+        "boxes": prediction_boxes((pred for _, pred in detections), np.int64),
+    }
+
+
+def arrays_to_predictions(
+    data: Any,
+    names: Dict[int, str] | Sequence[str],
+    colors: List[Tuple[int, int, int]],
+) -> Predictions:
+    """Converts arrays from predictions_to_arrays back to the predictions of every frame.
+
+    Args:
+        data: The arrays, by name.
+        names: The class names of the model.
+        colors: The class colors of the model.
+
+    Returns:
+        The predictions of every frame.
+    """
+    predictions: Predictions = [[] for _ in range(int(data["frame_count"]))]
+    for frame, class_id, conf, (xmin, ymin, xmax, ymax) in zip(
+        data["frame"].tolist(),
+        data["class_id"].tolist(),
+        data["conf"].tolist(),
+        data["boxes"].tolist(),
+    ):
+        predictions[frame].append(
+            {
+                "bndbox": {
+                    "xmin": xmin,
+                    "xmax": xmax,
+                    "ymin": ymin,
+                    "ymax": ymax,
+                    "width": xmax - xmin,
+                    "height": ymax - ymin,
+                },
+                "name": names[class_id],
+                "class_id": class_id,
+                "conf": conf,
+                "color": colors[class_id],
+            }
+        )
+    return predictions
+
+
+def load_detections(
+    key: DetectionCacheKey,
+    names: Dict[int, str] | Sequence[str],
+    colors: List[Tuple[int, int, int]],
+    cache_folder: Path = Common.cache_folder / "detections",
+) -> Predictions | None:
+    """Load the cached detections of a video.
+
+    Args:
+        key: The cache key of the detections.
+        names: The class names of the model.
+        colors: The class colors of the model.
+        cache_folder: The folder of the cache.
+
+    Returns:
+        The predictions of every frame, as returned by BatchYolov8.predict_batch,
+        or None if they aren't cached.
+    """
+    cache_path = cache_folder / f"{key.digest}.npz"
+    if not cache_path.exists():
+        return None
+
+    try:
+        with np.load(cache_path) as data:
+            predictions = arrays_to_predictions(data, names, colors)
+    except (OSError, KeyError, ValueError) as err:
+        logger.warning("Failed to load cached detections %s", cache_path, exc_info=err)
+        return None
+
+    # Mark as recently used for the eviction
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+
+    return predictions
+
+
+def is_cached(
+    key: DetectionCacheKey, cache_folder: Path = Common.cache_folder / "detections"
+) -> bool:
+    """Check if the detections of a video are cached, without loading them.
+
+    Args:
+        key: The cache key of the detections.
+        cache_folder: The folder of the cache.
+
+    Returns:
+        True if the detections are cached.
+    """
+    return (cache_folder / f"{key.digest}.npz").exists()
+
+
+def save_detections(
+    key: DetectionCacheKey,
+    predictions: Sequence[Sequence[Dict[str, Any]] | None],
+    cache_folder: Path = Common.cache_folder / "detections",
+    max_bytes: int | None = None,
+) -> None:
+    """Cache the detections of a video, evicting the least recently used detections
+    if the cache grows beyond max_bytes.
+
+    Args:
+        key: The cache key of the detections.
+        predictions: The predictions of every frame.
+        cache_folder: The folder of the cache.
+        max_bytes: The max size of the cache, defaults to settings.detection_cache_mb.
+    """
+    if max_bytes is None:
+        max_bytes = settings.detection_cache_mb * 1024 * 1024
+
+    try:
+        cache_folder.mkdir(parents=True, exist_ok=True)
+        cache_path = cache_folder / f"{key.digest}.npz"
+        # Write to a temporary file first so a crash never leaves partial detections
+        tmp_path = cache_path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp_path, **predictions_to_arrays(predictions))
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.warning("Failed to cache detections", exc_info=err)
+        return
+
+    evict_detections(cache_folder, max_bytes)
+
+
+def evict_detections(cache_folder: Path, max_bytes: int) -> None:
+    """Delete the least recently used detections until the cache fits in max_bytes.
+
+    Args:
+        cache_folder: The folder of the cache.
+        max_bytes: The max size of the cache.
+    """
+    entries = []
+    for entry in os.scandir(cache_folder):
+        if entry.is_file() and entry.name.endswith(".npz"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_bytes -= size
+            logger.debug("Evicted cached detections %s", path)
+        except OSError as err:
+            logger.warning("Failed to evict cached detections %s", path, exc_info=err)
@@ -18,6 +18,7 @@ from torch import Tensor
 
 from app.detection.batch_yolov8 import BatchYolov8
 from app.logger import get_logger
+from app.video_processor.video_index import VideoIndex, load_video_index
 
 logger = get_logger()
 
@@ -51,7 +52,11 @@ class ThreadedFrameGrabber:  # pylint: disable=too-many-instance-attributes
     model: BatchYolov8
     video_path: Path
     batch_counter: int = 0
-    num_workers: int = field(init=False)
+    start_frame: int = 0
+    # Number of preprocessing threads, 0 uses half the CPUs
+    num_workers: int = 0
+    # Max batches waiting in each queue, 0 uses twice the number of workers
+    queue_depth: int = 0
     capture: cv2.VideoCapture = field(init=False)
     frame_count: int = field(init=False)
     unprocessed_batch_queue: PriorityQueue[
@@ -81,12 +86,21 @@ class ThreadedFrameGrabber:  # pylint: disable=too-many-instance-attributes
         if not self.capture.isOpened():
             raise RuntimeError(f"Could not open video file {self.video_path}")
 
-        self.num_workers = int(cpu_count() / 2)
+        if self.num_workers <= 0:
+            self.num_workers = max(1, int(cpu_count() / 2))
+        if self.queue_depth <= 0:
+            self.queue_depth = self.num_workers * 2
 
-        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # CAP_PROP_FRAME_COUNT is an estimate from the container, use the exact count instead
+        video_index = load_video_index(self.video_path)
+        self.frame_count = video_index.frame_count
 
-        self.unprocessed_batch_queue = PriorityQueue(maxsize=self.num_workers * 2)
-        self.processed_batch_queue = PriorityQueue(maxsize=self.num_workers * 2)
+        self.start_frame = min(self.start_frame, self.frame_count)
+        if self.start_frame > 0:
+            self.__seek(video_index, self.start_frame)
+
+        self.unprocessed_batch_queue = PriorityQueue(maxsize=self.queue_depth)
+        self.processed_batch_queue = PriorityQueue(maxsize=self.queue_depth)
 
         self.shutdown_flag = Event()
 
@@ -100,6 +114,28 @@ class ThreadedFrameGrabber:  # pylint: disable=too-many-instance-attributes
             future = self.executor.submit(self.worker)
             self.workers.append(future)
 
+    def __seek(self, video_index: VideoIndex, start_frame: int) -> None:
+        """Seeks to the keyframe before the start frame and skips to the start frame.
+
+        Seeks by the exact timestamp of the keyframe from the index, since seeking
+        by frame number assumes a constant frame rate.
+        """
+        keyframe = max(
+            (frame for frame in video_index.keyframes if frame <= start_frame),
+            default=0,
+        )
+        timestamp = video_index.frame_to_timestamp(
+            keyframe
+        ) - video_index.frame_to_timestamp(0)
+        self.capture.set(
+            cv2.CAP_PROP_POS_MSEC, float(timestamp * video_index.time_base * 1000)
+        )
+        for _ in range(start_frame - keyframe):
+            self.capture.grab()
+        # The frames before the start count as read
+        self.frames_read = start_frame
+        logger.info("Starting at frame %s of %s", start_frame, self.video_path)
+
     def read_next_frame(self) -> np.ndarray[Any, Any] | None:
         """Reads the next frame from the video file"""
         ret: bool
@@ -189,9 +225,16 @@ class ThreadedFrameGrabber:  # pylint: disable=too-many-instance-attributes
                     break
                 continue
 
-            self.processed_batch_queue.put(
-                BatchWrapper(batch_index, (self.model.prepare_images(batch), batch))
+            batch_wrapper = BatchWrapper(
+                batch_index, (self.model.prepare_images(batch), batch)
             )
+            # Gives up when closed, so workers don't block on a queue nobody reads
+            while not self.shutdown_flag.is_set():
+                try:
+                    self.processed_batch_queue.put(batch_wrapper, timeout=1)
+                    break
+                except Full:
+                    continue
 
     def close(self) -> None:
         """Closes the video capture and shuts down the batch loader thread and workers"""
@@ -202,13 +245,17 @@ class ThreadedFrameGrabber:  # pylint: disable=too-many-instance-attributes
         self.executor.shutdown(wait=False)
         logger.debug("Shutdown executor")
         self.capture.release()
-        torch.cuda.empty_cache()
-        torch.cuda.reset_peak_memory_stats()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()
 
     def total_batch_count(self) -> int:
         """Returns the total number of batches that will be returned by this object."""
         return int(
-            math.ceil((self.frame_count - self.skipped_frames) / self.batch_size)
+            math.ceil(
+                (self.frame_count - self.start_frame - self.skipped_frames)
+                / self.batch_size
+            )
         )
 
     def get_batch(self) -> Tuple[Tensor, List[np.ndarray[Any, Any]]] | None:
@@ -0,0 +1,657 @@
+"""Processes the videos of a folder in several worker processes at once.
+
+Each worker process loads its own model and detects and cuts one video at a time
+within a thread budget, its share of the CPU cores split between torch, OpenCV, the
+frame grabber and PyAV. On machines without a GPU, several narrow pipelines keep the
+cores busier than one wide pipeline, whose threads wait on each other. The results
+flow back to the parent, which writes them through a single DatabaseWriter.
+
+The number of workers can be calibrated by detecting for a few seconds with each
+candidate count and keeping the fastest:
+
+    python -m app.detection.job_runner INPUT_FOLDER OUTPUT_FOLDER --workers 0
+
+With --queue, the videos are queued in a database on a shared drive instead, and
+runners on several hosts claim them from there until the queue is empty.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import cv2
+import torch
+
+from app import settings
+from app.common import Common
+from app.data_manager.data_manager import DataManager
+from app.data_manager.database_writer import DatabaseWriter
+from app.data_manager.job_queue import Job, JobQueue, Lease
+from app.data_manager.processing_manifest import ProcessingManifest
+from app.data_manager.video_summary import DetectionStatistics, summarize_predictions
+from app.detection import detection
+from app.detection.autotune import detection_parameters
+from app.detection.batch_yolov8 import BatchYolov8
+from app.detection.detection_cache import (
+    detection_cache_key,
+    load_detections,
+    save_detections,
+)
+from app.detection.planner import measured_throughput, plan_videos
+from app.logger import get_logger
+from app.video_processor.encoder_profiles import get_encoder_profile
+from app.video_processor.probe import probe_video
+from app.video_processor.scan import (
+    ScannedVideo,
+    output_video_path,
+    scan_videos,
+    stat_video,
+)
+from app.video_processor.video_processor import cut_video
+
+logger = get_logger()
+
+# Worker counts tried by the calibration
+CALIBRATION_CANDIDATES = (1, 2, 4, 8)
+
+# Seconds each candidate detects for during the calibration
+CALIBRATION_SECONDS = 20.0
+
+__worker_state: Dict[str, Any] = {}
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    """The threads one worker process may use."""
+
+    torch_threads: int
+    opencv_threads: int
+    grabber_workers: int
+    decoder_threads: int
+    encoder_threads: int
+
+
+def thread_budget(worker_count: int, cpu_count: int | None = None) -> ThreadBudget:
+    """Splits the CPU cores evenly between the worker processes.
+
+    Detection and cutting of a video don't overlap within a worker, so both get the
+    worker's whole share. The frame grabber and decoder only feed the model and
+    encoder, so they get a quarter of it.
+
+    Args:
+        worker_count: The number of worker processes.
+        cpu_count: The number of CPU cores, defaults to the cores of this machine.
+
+    Returns:
+        The thread budget of each worker.
+    """
+    cores = max(1, (cpu_count or os.cpu_count() or 1) // max(1, worker_count))
+    return ThreadBudget(
+        torch_threads=cores,
+        # The grabber threads already run OpenCV in parallel
+        opencv_threads=1,
+        grabber_workers=max(1, cores // 4),
+        decoder_threads=max(1, cores // 4),
+        encoder_threads=cores,
+    )
+
+
+@dataclass
+class VideoResult:  # pylint: disable=too-many-instance-attributes
+    """The outcome of processing one video in a worker process."""
+
+    video_path: Path
+    output_path: Path | None
+    frame_ranges: List[Tuple[int, int]]
+    statistics: DetectionStatistics
+    completed: bool
+    # The predictions of every frame, kept when the frame detections are stored
+    predictions: List[Any] | None = None
+    video_size: Tuple[int, int] = (0, 0)
+    class_names: Dict[int, str] = field(default_factory=dict)
+
+
+def _init_worker(
+    weights_path: Path, device: str, budget: ThreadBudget, barrier: Any = None
+) -> None:
+    """Loads the model of a worker process and applies its thread budget"""
+    settings.setup()
+    torch.set_num_threads(budget.torch_threads)
+    cv2.setNumThreads(budget.opencv_threads)
+    __worker_state["model"] = BatchYolov8(weights_path, device)
+    __worker_state["budget"] = budget
+    __worker_state["barrier"] = barrier
+    __worker_state["stop_event"] = threading.Event()
+
+
+def __detect(model: BatchYolov8, video_path: Path) -> Tuple[List[Any], float | None]:
+    """Detects in a video at the confidence floor, reusing the cached detections
+
+    Returns the predictions and the seconds spent detecting, None if cached.
+    """
+    record_floor = 0 < settings.confidence_floor < settings.prediction_threshold
+    model.conf_thres = (
+        settings.confidence_floor if record_floor else settings.prediction_threshold
+    ) / 100
+
+    cache_key = None
+    if settings.detection_cache_mb > 0:
+        cache_key = detection_cache_key(model, video_path)
+        predictions = load_detections(cache_key, model.names, model.colors)
+        if predictions is not None:
+            return predictions, None
+
+    detection_start_time = time.time()
+    # Workers can't tune side by side, so they only use the cached tuning
+    _, predictions = detection.process_video(
+        model=model,
+        video_path=video_path,
+        batch_size=detection_parameters(model, video_path, False).batch_size,
+        max_batches_to_queue=4,
+        output_path=None,
+        stop_event=__worker_state["stop_event"],
+        grabber_workers=__worker_state["budget"].grabber_workers,
+    )
+    detection_seconds = time.time() - detection_start_time
+    if cache_key is not None:
+        save_detections(cache_key, predictions)
+    return predictions, detection_seconds
+
+
+def _process_video_job(video_path: Path, output_path: Path) -> VideoResult:
+    """Detects in and cuts one video to output_path in a worker process"""
+    model: BatchYolov8 = __worker_state["model"]
+    budget: ThreadBudget = __worker_state["budget"]
+    start_time = time.time()
+
+    predictions, detection_seconds = __detect(model, video_path)
+    predictions = detection.filter_predictions(
+        predictions, settings.prediction_threshold / 100
+    )
+    video_info = probe_video(video_path)
+    frame_ranges = detection.add_buffer_to_ranges(
+        detection.detected_frames_to_ranges(
+            detection.frames_with_detections(predictions),
+            frame_buffer=int(video_info.fps * settings.frame_buffer_seconds),
+        ),
+        video_info.fps,
+        video_info.frame_count,
+        settings.buffer_before,
+        settings.buffer_after,
+    )
+
+    completed = True
+    if len(frame_ranges) > 0:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        encoder_profile = replace(
+            get_encoder_profile(settings.encoder_profile),
+            threads=budget.encoder_threads,
+        )
+        completed = cut_video(
+            video_path,
+            output_path,
+            frame_ranges,
+            detection.predictions_to_detections(predictions)
+            if settings.box_around_fish
+            else None,
+            encoder_profile=encoder_profile,
+            decoder_threads=budget.decoder_threads,
+        )
+
+    return VideoResult(
+        video_path=video_path,
+        output_path=output_path if len(frame_ranges) > 0 else None,
+        frame_ranges=frame_ranges,
+        statistics=summarize_predictions(
+            predictions, time.time() - start_time, detection_seconds
+        ),
+        completed=completed,
+        predictions=predictions if settings.store_frame_detections else None,
+        video_size=(video_info.width, video_info.height),
+        class_names=(
+            model.names
+            if isinstance(model.names, dict)
+            else dict(enumerate(model.names))
+        ),
+    )
+
+
+def _calibration_job(video_path: Path, seconds: float) -> int:
+    """Detects in a video for a number of seconds, returns the frames processed"""
+    model: BatchYolov8 = __worker_state["model"]
+    # Every worker has loaded its model, start detecting together
+    __worker_state["barrier"].wait()
+
+    stop_event = threading.Event()
+    timer = threading.Timer(seconds, stop_event.set)
+    timer.start()
+    try:
+        _, predictions = detection.process_video(
+            model=model,
+            video_path=video_path,
+            batch_size=detection_parameters(model, video_path, False).batch_size,
+            max_batches_to_queue=4,
+            output_path=None,
+            stop_event=stop_event,
+            grabber_workers=__worker_state["budget"].grabber_workers,
+        )
+    finally:
+        timer.cancel()
+    return len(predictions)
+
+
+def calibrate_worker_count(
+    video_path: Path,
+    weights_path: Path,
+    device: str = "",
+    candidates: Sequence[int] = CALIBRATION_CANDIDATES,
+    seconds: float = CALIBRATION_SECONDS,
+) -> Tuple[int, Dict[int, float]]:
+    """Finds the number of workers that detects the most frames per second.
+
+    Every worker of a candidate detects in the same video for the same time, after
+    all of them have loaded their model.
+
+    Args:
+        video_path: The video to detect in.
+        weights_path: The weights of the model.
+        device: The device to run the model on.
+        candidates: The worker counts to try.
+        seconds: The seconds each candidate detects for.
+
+    Returns:
+        The fastest worker count, and the frames per second of each candidate.
+    """
+    context = multiprocessing.get_context("spawn")
+    throughput: Dict[int, float] = {}
+    for worker_count in candidates:
+        barrier = context.Barrier(worker_count)
+        with ProcessPoolExecutor(
+            max_workers=worker_count,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(weights_path, device, thread_budget(worker_count), barrier),
+        ) as executor:
+            frames = sum(
+                executor.map(
+                    _calibration_job,
+                    [video_path] * worker_count,
+                    [seconds] * worker_count,
+                )
+            )
+        throughput[worker_count] = frames / seconds
+        logger.info(
+            "%s workers detect %.2f frames per second",
+            worker_count,
+            throughput[worker_count],
+        )
+
+    return max(throughput, key=lambda count: throughput[count]), throughput
+
+
+class JobRunner:
+    """Processes videos in worker processes, writing the results to one database."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        data_manager: DataManager,
+        output_folder: Path,
+        weights_path: Path,
+        device: str = "",
+        worker_count: int = 1,
+        input_folder: Path | None = None,
+    ) -> None:
+        """Sets up the runner, the workers start with run
+
+        Args:
+            data_manager (DataManager): the database to write the results to
+            output_folder (Path): the folder to save the cut videos to
+            weights_path (Path): the weights of the model
+            device (str): the device to run the models on
+            worker_count (int): the number of videos processed at once
+            input_folder (Path | None): the folder the videos were scanned from, the
+                cut videos of its subfolders are saved in the same subfolders
+        """
+        self.data_manager = data_manager
+        self.output_folder = output_folder
+        self.weights_path = weights_path
+        self.device = device
+        self.worker_count = worker_count
+        self.input_folder = input_folder
+
+    def run(
+        self,
+        videos: List[ScannedVideo],
+        on_result: Callable[[VideoResult], None] | None = None,
+    ) -> List[VideoResult]:
+        """Processes the videos that aren't already processed
+
+        Args:
+            videos (List[ScannedVideo]): the videos to process
+            on_result (Callable[[VideoResult], None] | None): called with the result
+                of each video as it completes
+
+        Returns:
+            List[VideoResult]: the results, in the order the videos completed
+        """
+        manifest = ProcessingManifest(
+            self.data_manager, self.output_folder, self.weights_path
+        )
+        if settings.skip_processed_videos:
+            videos = [video for video in videos if not manifest.is_current(video)]
+        if self.worker_count > 1:
+            # Longest first, so no worker is left with a long video at the end
+            videos = self.longest_first(videos)
+
+        results: List[VideoResult] = []
+        with DatabaseWriter(
+            self.data_manager
+        ) as database_writer, self.__executor() as executor:
+            futures = {
+                executor.submit(
+                    _process_video_job, video.path, self.__output_path(video.path)
+                ): video
+                for video in videos
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.error(
+                        "Failed to process %s", futures[future].path, exc_info=error
+                    )
+                    continue
+                if result.completed:
+                    failure = self.__save_result(
+                        database_writer, manifest, futures[future], result
+                    )
+                    if failure is not None:
+                        # Keep the original, its results are lost
+                        logger.error("%s: %s", result.video_path, failure)
+                        continue
+                    self.__remove_original(result)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+        return results
+
+    def longest_first(self, videos: List[ScannedVideo]) -> List[ScannedVideo]:
+        """Orders videos from the most to the least costly to process"""
+        plan = plan_videos(videos, measured_throughput(self.data_manager))
+        return [planned.video for planned in plan.longest_first()]
+
+    def run_queue(
+        self,
+        job_queue: JobQueue,
+        on_result: Callable[[VideoResult], None] | None = None,
+    ) -> List[VideoResult]:
+        """Processes videos claimed from a shared queue until it is empty
+
+        Each claimed video keeps its lease with heartbeats while a worker processes it.
+        If the lease is lost to another worker, the result is dropped since that
+        worker is processing the video again. If a worker process dies, the videos
+        being processed fail to be retried and new worker processes are started.
+
+        Args:
+            job_queue (JobQueue): the queue to claim videos from
+            on_result (Callable[[VideoResult], None] | None): called with the result
+                of each video as it completes
+
+        Returns:
+            List[VideoResult]: the results, in the order the videos completed
+        """
+        manifest = ProcessingManifest(
+            self.data_manager, self.output_folder, self.weights_path
+        )
+
+        results: List[VideoResult] = []
+        running: Dict["Future[VideoResult]", Tuple[Job, Lease, ScannedVideo]] = {}
+        executor = self.__executor()
+        try:
+            with DatabaseWriter(self.data_manager) as database_writer:
+                while True:
+                    executor = self.__submit_claimed(
+                        job_queue, manifest, executor, running
+                    )
+                    if len(running) == 0:
+                        break
+
+                    for future in wait(running, return_when=FIRST_COMPLETED).done:
+                        job, lease, video = running.pop(future)
+                        lease.stop()
+                        try:
+                            result = future.result()
+                        except Exception as error:  # pylint: disable=broad-except
+                            logger.error(
+                                "Failed to process %s", job.path, exc_info=error
+                            )
+                            job_queue.fail(job, repr(error))
+                            continue
+
+                        if lease.lost.is_set():
+                            continue
+                        if not result.completed:
+                            job_queue.fail(job, "Cutting was stopped")
+                            continue
+
+                        # Only finish the job once its results are stored
+                        failure = self.__save_result(
+                            database_writer, manifest, video, result
+                        )
+                        if failure is not None:
+                            job_queue.fail(job, failure)
+                            continue
+                        if job_queue.complete(job):
+                            self.__remove_original(result)
+                            results.append(result)
+                            if on_result is not None:
+                                on_result(result)
+        finally:
+            executor.shutdown()
+
+        return results
+
+    def __submit_claimed(
+        self,
+        job_queue: JobQueue,
+        manifest: ProcessingManifest,
+        executor: ProcessPoolExecutor,
+        running: Dict["Future[VideoResult]", Tuple[Job, Lease, ScannedVideo]],
+    ) -> ProcessPoolExecutor:
+        """Claims videos from the queue until every worker is processing one
+
+        Returns:
+            ProcessPoolExecutor: the executor, a new one if a worker process died
+        """
+        while len(running) < self.worker_count:
+            job = job_queue.claim()
+            if job is None:
+                break
+            try:
+                video = stat_video(job.path)
+            except OSError as error:
+                job_queue.fail(job, str(error))
+                continue
+            if settings.skip_processed_videos and manifest.is_current(video):
+                job_queue.complete(job)
+                continue
+
+            try:
+                future = executor.submit(
+                    _process_video_job, job.path, self.__output_path(job.path)
+                )
+            except BrokenProcessPool:
+                # The futures of the dead pool fail, which releases their jobs
+                logger.error("A worker process died, starting new workers")
+                executor.shutdown()
+                executor = self.__executor()
+                future = executor.submit(
+                    _process_video_job, job.path, self.__output_path(job.path)
+                )
+            running[future] = (job, job_queue.lease(job), video)
+
+        return executor
+
+    def __output_path(self, video_path: Path) -> Path:
+        """The path of the cut video of a video"""
+        return output_video_path(video_path, self.input_folder, self.output_folder)
+
+    def __executor(self) -> ProcessPoolExecutor:
+        """Starts the worker processes, each loading its own model"""
+        return ProcessPoolExecutor(
+            max_workers=self.worker_count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.weights_path,
+                self.device,
+                thread_budget(self.worker_count),
+            ),
+        )
+
+    def __write_result(
+        self,
+        database_writer: DatabaseWriter,
+        manifest: ProcessingManifest,
+        video: ScannedVideo,
+        result: VideoResult,
+    ) -> None:
+        """Queues the writes of a processed video"""
+        database_writer.add_detection_data(
+            result.video_path, result.frame_ranges, result.statistics
+        )
+        if result.predictions is not None:
+            database_writer.add_frame_detections(
+                result.video_path,
+                result.frame_ranges,
+                result.predictions,
+                result.video_size,
+                result.class_names,
+            )
+        database_writer.add_video_data(
+            result.video_path, result.video_path.name, result.output_path
+        )
+        database_writer.add_processed_video(manifest.row(video, result.output_path))
+
+    def __save_result(
+        self,
+        database_writer: DatabaseWriter,
+        manifest: ProcessingManifest,
+        video: ScannedVideo,
+        result: VideoResult,
+    ) -> str | None:
+        """Writes the results of a processed video and waits until they are stored
+
+        Returns:
+            str | None: why the results could not be saved, None if they were
+        """
+        self.__write_result(database_writer, manifest, video, result)
+        errors = database_writer.flush()
+        if len(errors) == 0:
+            return None
+        return "; ".join(
+            f"Failed to save {description}: {error!r}" for description, error in errors
+        )
+
+    def __remove_original(self, result: VideoResult) -> None:
+        """Deletes the original video if the user has selected to do so"""
+        if not settings.keep_original:
+            result.video_path.unlink()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Runs the job runner from the command line."""
+    settings.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input_folder", type=Path, help="folder of videos to process")
+    parser.add_argument("output_folder", type=Path, help="folder to save videos to")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="videos processed at once, 0 calibrates the fastest count",
+    )
+    parser.add_argument("--device", default="", help="device to run the models on")
+    parser.add_argument(
+        "--recursive", action="store_true", help="also process subfolders"
+    )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        default=None,
+        help="database on a shared drive to queue the videos in and store the results "
+        "to, so workers on several hosts can process the same folder",
+    )
+    args = parser.parse_args(argv)
+
+    videos = list(
+        scan_videos(
+            args.input_folder, Common.video_extensions, recursive=args.recursive
+        )
+    )
+    if len(videos) == 0:
+        print("No videos found in the input folder")
+        return 1
+
+    weights_path = Common.weights_folder / settings.weights
+    worker_count = args.workers
+    if worker_count <= 0:
+        # Calibrate on the largest video, so no candidate runs out of frames
+        largest = max(videos, key=lambda video: video.size)
+        worker_count, _ = calibrate_worker_count(
+            largest.path, weights_path, args.device
+        )
+        print(f"Using {worker_count} workers")
+
+    args.output_folder.mkdir(parents=True, exist_ok=True)
+    data_manager = (
+        DataManager()
+        if args.queue is None
+        # WAL needs all connections on one host
+        else DataManager(args.queue, journal_mode="DELETE")
+    )
+    with data_manager:
+        runner = JobRunner(
+            data_manager,
+            args.output_folder,
+            weights_path,
+            args.device,
+            worker_count,
+            args.input_folder,
+        )
+
+        def on_result(result: VideoResult) -> None:
+            print(f"{result.video_path.name}: {len(result.frame_ranges)} ranges")
+
+        if args.queue is None:
+            results = runner.run(videos, on_result=on_result)
+        else:
+            job_queue = JobQueue(data_manager)
+            added = job_queue.enqueue(
+                video.path for video in runner.longest_first(videos)
+            )
+            print(f"Queued {added} new videos as worker {job_queue.worker_id}")
+            results = runner.run_queue(job_queue, on_result=on_result)
+            print(f"Queue: {job_queue.counts()}")
+
+    print(f"Processed {len(results)} videos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
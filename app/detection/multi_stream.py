@@ -0,0 +1,301 @@
+"""Detects in several videos at once, sharing full inference batches between them.
+
+A video processed on its own ends with a partial batch, and a short clip may be
+little more than one. The batcher keeps a few videos open, each read by its own
+ThreadedFrameGrabber, and fills every batch from them in turn, so batches stay full
+across the ends of videos and the next video is already being decoded when one ends.
+The predictions are split back per video.
+
+Letterboxing gives every frame the same shape, so frames of videos with different
+resolutions can share a batch, and the boxes are scaled back per frame.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing import cpu_count
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, Deque, Dict, List, Sequence, Tuple, Type
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from app import settings
+from app.detection.batch_yolov8 import BatchYolov8
+from app.detection.frame_grabber import ThreadedFrameGrabber
+from app.logger import get_logger
+
+logger = get_logger()
+
+
+@dataclass
+class VideoStream:
+    """A video being read into shared batches."""
+
+    video_path: Path
+    frame_grabber: ThreadedFrameGrabber
+    predictions: List[Any] = field(default_factory=list)
+    # Frames read from the grabber and not yet put in a batch
+    tensor: Tensor | None = None
+    frames: List[np.ndarray[Any, Any]] = field(default_factory=list)
+
+    @property
+    def frame_count(self) -> int:
+        """The number of frames in the video"""
+        return self.frame_grabber.frame_count
+
+    def is_done(self) -> bool:
+        """Returns true if every frame of the video is in a batch"""
+        return len(self.frames) == 0 and self.frame_grabber.is_done()
+
+    def take(
+        self, count: int, shape: torch.Size | None
+    ) -> Tuple[Tensor, List[np.ndarray[Any, Any]]] | None:
+        """Takes up to count frames for a batch, reading the next batch if needed
+
+        Args:
+            count (int): the max number of frames to take
+            shape (torch.Size | None): the shape of the frames in the batch so far
+
+        Returns:
+            the prepared and original frames, or None if none are ready or the frames
+            don't have the shape of the batch
+        """
+        if len(self.frames) == 0:
+            if self.frame_grabber.is_done():
+                return None
+            batch = self.frame_grabber.get_batch()
+            if batch is None:
+                return None
+            self.tensor, self.frames = batch[0], list(batch[1])
+
+        assert self.tensor is not None
+        if shape is not None and self.tensor.shape[1:] != shape:
+            return None
+        taken = (self.tensor[:count], self.frames[:count])
+        self.tensor, self.frames = self.tensor[count:], self.frames[count:]
+        return taken
+
+
+class MultiStreamDetector:  # pylint: disable=too-many-instance-attributes
+    """Detects in the videos of a run in shared batches, a few videos at a time.
+
+    The videos are opened in the given order as earlier ones finish. Their predictions
+    are collected with detect, one video at a time.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model: BatchYolov8,
+        video_paths: Sequence[Path],
+        batch_size: int,
+        stop_event: threading.Event,
+        max_streams: int = 2,
+        grabber_workers: int = 0,
+        queue_depth: int = 0,
+    ) -> None:
+        """Sets up the detector, videos are only opened once detection starts
+
+        Args:
+            model (BatchYolov8): the model to detect with
+            video_paths (Sequence[Path]): the videos, in the order they are detected
+            batch_size (int): the number of frames in each batch
+            stop_event (threading.Event): stops detecting when set
+            max_streams (int): the number of videos open at once
+            grabber_workers (int): the preprocessing threads of each video, 0 splits
+                                   half the CPUs between the videos
+            queue_depth (int): the max batches waiting in the queues of each video,
+                               0 uses twice the preprocessing threads
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.stop_event = stop_event
+        self.max_streams = max(1, max_streams)
+        self.grabber_workers = grabber_workers or max(
+            1, cpu_count() // (2 * self.max_streams)
+        )
+        self.queue_depth = queue_depth
+        self.frames_detected = 0
+        self.detection_seconds = 0.0
+        self.__pending: Deque[Path] = deque(video_paths)
+        self.__streams: List[VideoStream] = []
+        self.__finished: Dict[Path, List[Any]] = {}
+        # Rotates the stream that starts each batch, so all open videos progress
+        self.__next_stream = 0
+
+    def __enter__(self) -> "MultiStreamDetector":
+        """Returns the detector"""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,  # pylint: disable=unused-argument
+        exc_value: BaseException | None,  # pylint: disable=unused-argument
+        trace_back: TracebackType | None,  # pylint: disable=unused-argument
+    ) -> None:
+        """Closes the open videos"""
+        self.close()
+
+    def __contains__(self, video_path: object) -> bool:
+        """Returns true if the video was given to the detector and not collected"""
+        return (
+            video_path in self.__pending
+            or video_path in self.__finished
+            or any(stream.video_path == video_path for stream in self.__streams)
+        )
+
+    @property
+    def fps(self) -> float | None:
+        """The detection speed over every video so far, None before any batch"""
+        if self.detection_seconds <= 0:
+            return None
+        return self.frames_detected / self.detection_seconds
+
+    def detect(
+        self,
+        video_path: Path,
+        notify_progress: Callable[[int], None] | None = None,
+        on_checkpoint: Callable[[List[Any]], None] | None = None,
+        checkpoint_seconds: float = 60,
+    ) -> List[Any] | None:
+        """Detects until the predictions of a video are complete
+
+        Frames of the next videos fill the batches meanwhile, and their predictions
+        are kept until they are collected.
+
+        Args:
+            video_path (Path): a video given to the detector, not yet collected
+            notify_progress (Callable[[int], None] | None): called with the progress
+                of the video
+            on_checkpoint (Callable[[List[Any]], None] | None): called with the
+                predictions of the video so far every checkpoint_seconds and when
+                stopped
+            checkpoint_seconds (float): the seconds between checkpoints
+
+        Raises:
+            KeyError: if the video wasn't given to the detector or was collected
+
+        Returns:
+            List[Any] | None: the predictions of every frame, None if stopped
+        """
+        last_checkpoint = time.time()
+        while video_path not in self.__finished:
+            if video_path not in self:
+                raise KeyError(video_path)
+            if self.stop_event.is_set():
+                stream = self.__find(video_path)
+                if on_checkpoint is not None and stream is not None:
+                    on_checkpoint(stream.predictions)
+                return None
+
+            self.__detect_batch()
+
+            # None until the earlier videos finish and the video is opened
+            stream = self.__find(video_path)
+            if stream is None:
+                continue
+            if notify_progress is not None and stream.frame_count > 0:
+                notify_progress(int(len(stream.predictions) / stream.frame_count * 100))
+            if (
+                on_checkpoint is not None
+                and time.time() - last_checkpoint >= checkpoint_seconds
+            ):
+                on_checkpoint(stream.predictions)
+                last_checkpoint = time.time()
+
+        if notify_progress is not None:
+            notify_progress(100)
+        return self.__finished.pop(video_path)
+
+    def discard(self, video_path: Path) -> None:
+        """Drops a video that is detected some other way, closing it if it is open"""
+        if video_path in self.__pending:
+            self.__pending.remove(video_path)
+        self.__finished.pop(video_path, None)
+        for stream in [s for s in self.__streams if s.video_path == video_path]:
+            self.__streams.remove(stream)
+            stream.frame_grabber.close()
+
+    def close(self) -> None:
+        """Closes the open videos, the videos not yet collected are dropped"""
+        for stream in self.__streams:
+            stream.frame_grabber.close()
+        self.__streams = []
+        self.__pending.clear()
+        self.__finished.clear()
+
+    def __find(self, video_path: Path) -> VideoStream | None:
+        """Returns the stream of an open video"""
+        for stream in self.__streams:
+            if stream.video_path == video_path:
+                return stream
+        return None
+
+    def __open_next(self) -> None:
+        """Opens the next pending video"""
+        video_path = self.__pending.popleft()
+        self.__streams.append(
+            VideoStream(
+                video_path,
+                ThreadedFrameGrabber(
+                    batch_size=self.batch_size,
+                    model=self.model,
+                    video_path=video_path,
+                    num_workers=self.grabber_workers,
+                    queue_depth=self.queue_depth,
+                ),
+            )
+        )
+
+    def __detect_batch(self) -> None:
+        """Fills a batch from the open videos, detects in it and splits the predictions"""
+        while len(self.__streams) < self.max_streams and len(self.__pending) > 0:
+            self.__open_next()
+
+        tensors: List[Tensor] = []
+        frames: List[np.ndarray[Any, Any]] = []
+        segments: List[Tuple[VideoStream, int]] = []
+        streams = (
+            self.__streams[self.__next_stream :] + self.__streams[: self.__next_stream]
+        )
+        for stream in streams:
+            while len(frames) < self.batch_size:
+                taken = stream.take(
+                    self.batch_size - len(frames),
+                    tensors[0].shape[1:] if len(tensors) > 0 else None,
+                )
+                if taken is None:
+                    break
+                tensors.append(taken[0])
+                frames.extend(taken[1])
+                segments.append((stream, len(taken[1])))
+        self.__next_stream = (self.__next_stream + 1) % max(1, len(self.__streams))
+
+        if len(frames) > 0:
+            start_time = time.time()
+            predictions = self.model.predict_batch(
+                frames,
+                tensors[0] if len(tensors) == 1 else torch.cat(tensors),
+                max_detections=settings.max_detections,
+            )
+            self.detection_seconds += time.time() - start_time
+            self.frames_detected += len(frames)
+
+            offset = 0
+            for stream, count in segments:
+                stream.predictions.extend(predictions[offset : offset + count])
+                offset += count
+
+        for stream in [s for s in self.__streams if s.is_done()]:
+            self.__streams.remove(stream)
+            stream.frame_grabber.close()
+            if len(stream.predictions) != stream.frame_count:
+                logger.warning(
+                    "Detected %s of %s frames in %s",
+                    len(stream.predictions),
+                    stream.frame_count,
+                    stream.video_path,
+                )
+            self.__finished[stream.video_path] = stream.predictions
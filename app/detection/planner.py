@@ -0,0 +1,313 @@
+"""Plans a folder run: the cost of each video, the order to process them in and an ETA.
+
+Video lengths vary by orders of magnitude, so the cost of a video is predicted from
+its frame count and the throughput measured on earlier runs, instead of counting
+videos. Probing every video up front also gives a frame-based ETA and an estimate of
+the disk space the cut videos will take, before anything is processed:
+
+    python -m app.detection.planner INPUT_FOLDER [--workers N]
+"""
+import argparse
+import heapq
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import List, Sequence
+
+import av
+
+from app import settings
+from app.common import Common
+from app.data_manager.data_manager import DataManager
+from app.logger import get_logger
+from app.video_processor.encoder_profiles import cached_encoder_fps, get_encoder_profile
+from app.video_processor.probe import VideoInfo, probe_video
+from app.video_processor.scan import ScannedVideo, scan_videos
+
+logger = get_logger()
+
+# Number of videos probed at once, probing mostly waits on the disk
+PROBE_WORKERS = 16
+
+
+@dataclass(frozen=True)
+class Throughput:
+    """How fast each stage processes frames, and how much of a video is kept."""
+
+    detection_fps: float
+    cut_fps: float
+    # Fraction of the source frames in the cut video
+    output_fraction: float
+
+
+# Used for the stages that have not been measured on this machine yet
+DEFAULT_THROUGHPUT = Throughput(detection_fps=30.0, cut_fps=120.0, output_fraction=0.2)
+
+
+@dataclass(frozen=True)
+class PlannedVideo:
+    """The predicted cost of processing one video."""
+
+    video: ScannedVideo
+    info: VideoInfo | None
+    detection_seconds: float
+    cut_seconds: float
+    output_bytes: int
+    # Cutting overlaps with the detection of the next video
+    overlapped: bool = False
+
+    @property
+    def frame_count(self) -> int:
+        """The number of frames in the video, 0 if it couldn't be probed"""
+        return 0 if self.info is None else self.info.frame_count
+
+    @property
+    def seconds(self) -> float:
+        """The predicted time to process the video"""
+        if self.overlapped:
+            return max(self.detection_seconds, self.cut_seconds)
+        return self.detection_seconds + self.cut_seconds
+
+
+@dataclass
+class Plan:
+    """The planned videos of a run, in the order they are given."""
+
+    videos: List[PlannedVideo]
+    throughput: Throughput
+
+    @property
+    def frame_count(self) -> int:
+        """The number of frames in all videos"""
+        return sum(planned.frame_count for planned in self.videos)
+
+    @property
+    def seconds(self) -> float:
+        """The predicted time to process the videos one at a time"""
+        return sum(planned.seconds for planned in self.videos)
+
+    @property
+    def output_bytes(self) -> int:
+        """The predicted size of the cut videos"""
+        return sum(planned.output_bytes for planned in self.videos)
+
+    def longest_first(self) -> List[PlannedVideo]:
+        """The videos ordered from the most to the least costly.
+
+        Starting the longest videos first keeps workers from idling at the end of a
+        run while one of them is still processing a long video.
+        """
+        return sorted(self.videos, key=lambda planned: planned.seconds, reverse=True)
+
+    def makespan(self, worker_count: int) -> float:
+        """Predicts the time to process the videos longest-first with several workers"""
+        workers = [0.0] * max(1, worker_count)
+        for planned in self.longest_first():
+            heapq.heapreplace(workers, workers[0] + planned.seconds)
+        return max(workers)
+
+
+def measured_throughput(
+    data_manager: DataManager, default: Throughput = DEFAULT_THROUGHPUT
+) -> Throughput:
+    """Get the detection throughput and output fraction of the processed videos.
+
+    Args:
+        data_manager: The database with the processed videos.
+        default: The throughput used for what hasn't been measured.
+
+    Returns:
+        The throughput.
+    """
+    frames, seconds, source_ms, output_ms = data_manager.get_processing_totals()
+    return Throughput(
+        detection_fps=frames / seconds if seconds > 0 else default.detection_fps,
+        cut_fps=default.cut_fps,
+        output_fraction=(
+            min(1.0, output_ms / source_ms)
+            if source_ms > 0
+            else default.output_fraction
+        ),
+    )
+
+
+def __probe(video: ScannedVideo) -> VideoInfo | None:
+    """Probes a video, None if it can't be read"""
+    try:
+        return probe_video(video.path)
+    except (OSError, av.error.FFmpegError) as err:
+        logger.warning("Failed to probe %s", video.path, exc_info=err)
+        return None
+
+
+def __plan_video(
+    video: ScannedVideo,
+    info: VideoInfo | None,
+    throughput: Throughput,
+    overlapped: bool,
+) -> PlannedVideo:
+    """Predicts the cost of a video from its frame count and resolution"""
+    if info is None:
+        return PlannedVideo(video, None, 0.0, 0.0, 0, overlapped)
+
+    output_frames = info.frame_count * throughput.output_fraction
+    # Encoding speed depends on the resolution, use the measured speed if there is one
+    cut_fps = (
+        cached_encoder_fps(
+            info.width,
+            info.height,
+            get_encoder_profile(settings.encoder_profile).preset,
+        )
+        or throughput.cut_fps
+    )
+    return PlannedVideo(
+        video=video,
+        info=info,
+        detection_seconds=info.frame_count / throughput.detection_fps,
+        cut_seconds=output_frames / cut_fps,
+        # Cut videos keep the resolution, so their bitrate is close to the source's
+        output_bytes=round(video.size * throughput.output_fraction),
+        overlapped=overlapped,
+    )
+
+
+def plan_videos(
+    videos: Sequence[ScannedVideo],
+    throughput: Throughput,
+    overlapped: bool = False,
+    max_workers: int = PROBE_WORKERS,
+) -> Plan:
+    """Probes the videos in parallel and predicts the cost of each one.
+
+    Args:
+        videos: The videos to plan.
+        throughput: The throughput of each stage.
+        overlapped: Whether cutting overlaps with the detection of the next video.
+        max_workers: The number of videos probed at once.
+
+    Returns:
+        The plan, with the videos in the given order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        infos = list(executor.map(__probe, videos))
+    return Plan(
+        [
+            __plan_video(video, info, throughput, overlapped)
+            for video, info in zip(videos, infos)
+        ],
+        throughput,
+    )
+
+
+class EtaEstimator:  # pylint: disable=too-few-public-methods
+    """Estimates the time left of a run from the planned cost of the videos.
+
+    The plan is scaled by how long the run has taken so far compared to the plan,
+    so the estimate corrects itself when this machine is faster or slower than the
+    measured throughput.
+    """
+
+    def __init__(self, plan: Plan) -> None:
+        """Starts timing the run
+
+        Args:
+            plan (Plan): the plan of the videos, in the order they are processed
+        """
+        self.plan = plan
+        self.start_time = time.time()
+        # Planned seconds of the videos from each index to the end
+        self.__remaining = [0.0] * (len(plan.videos) + 1)
+        for index in range(len(plan.videos) - 1, -1, -1):
+            self.__remaining[index] = (
+                self.__remaining[index + 1] + plan.videos[index].seconds
+            )
+
+    def seconds_left(self, video_num: int, progress: float) -> float:
+        """Get the time left of the run
+
+        Args:
+            video_num (int): the index of the video being processed
+            progress (float): the fraction of the video that is processed
+
+        Returns:
+            float: the seconds left
+        """
+        if video_num >= len(self.plan.videos):
+            return 0.0
+
+        current = self.plan.videos[video_num].seconds
+        planned_left = self.__remaining[video_num + 1] + current * (1 - progress)
+        planned_done = self.__remaining[0] - planned_left
+        if planned_done <= 0:
+            return planned_left
+        return planned_left * (time.time() - self.start_time) / planned_done
+
+
+def format_bytes(size: float) -> str:
+    """Formats a size in bytes with a binary unit"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def check_disk_space(plan: Plan, output_folder: Path) -> bool:
+    """Checks that the predicted cut videos fit on the disk of the output folder
+
+    Returns:
+        bool: False if they don't fit, which is logged
+    """
+    free_bytes = shutil.disk_usage(output_folder).free
+    if plan.output_bytes > free_bytes:
+        logger.warning(
+            "The cut videos may need %s but only %s is free in %s",
+            format_bytes(plan.output_bytes),
+            format_bytes(free_bytes),
+            output_folder,
+        )
+        return False
+    return True
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Prints the plan of a folder run without processing anything."""
+    settings.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input_folder", type=Path, help="folder of videos to plan")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="videos processed at once"
+    )
+    parser.add_argument("--recursive", action="store_true", help="also plan subfolders")
+    args = parser.parse_args(argv)
+
+    videos = list(
+        scan_videos(
+            args.input_folder, Common.video_extensions, recursive=args.recursive
+        )
+    )
+    with DataManager() as data_manager:
+        throughput = measured_throughput(data_manager)
+    plan = plan_videos(videos, throughput, overlapped=settings.cut_look_ahead > 0)
+
+    for planned in plan.longest_first():
+        print(
+            f"{str(timedelta(seconds=round(planned.seconds))):>10} "
+            f"{planned.frame_count:>10} frames  {planned.video.path}"
+        )
+    print(
+        f"\n{len(plan.videos)} videos, {plan.frame_count} frames at "
+        f"{throughput.detection_fps:.1f} FPS detection"
+    )
+    print(f"Estimated time: {timedelta(seconds=round(plan.makespan(args.workers)))}")
+    print(f"Estimated output size: {format_bytes(plan.output_bytes)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Sweeps confidence thresholds over detections recorded at a low confidence floor.
+
+Detects each video once at the floor, or reuses the cached detections, and prints the
+number of ranges and the output duration each threshold would give with the current
+buffer settings:
+
+    python -m app.detection.threshold_sweep VIDEO [VIDEO ...] --thresholds 40 50 60
+"""
+import argparse
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from app import settings
+from app.common import Common
+from app.detection import detection
+from app.detection.autotune import detection_parameters
+from app.detection.batch_yolov8 import BatchYolov8
+from app.detection.detection_cache import (
+    detection_cache_key,
+    load_detections,
+    save_detections,
+)
+from app.video_processor.probe import probe_video
+
+
+@dataclass
+class SweepResult:
+    """The outcome of one threshold on a video."""
+
+    threshold: int
+    frames_with_fish: int
+    range_count: int
+    output_seconds: float
+
+
+def sweep_thresholds(  # pylint: disable=too-many-arguments
+    predictions: Sequence[Sequence[Dict[str, Any]] | None],
+    thresholds: Sequence[int],
+    fps: float,
+    frame_buffer_seconds: float,
+    buffer_before: float,
+    buffer_after: float,
+) -> List[SweepResult]:
+    """Builds the frame ranges each threshold would give, like the detection worker.
+
+    Args:
+        predictions: The predictions of every frame, recorded at or below the lowest
+                     threshold.
+        thresholds: The confidence thresholds in percent.
+        fps: The frame rate of the video.
+        frame_buffer_seconds: The gap without detections that still continues a range.
+        buffer_before: The seconds added before each range.
+        buffer_after: The seconds added after each range.
+
+    Returns:
+        The result of each threshold.
+    """
+    results = []
+    for threshold in thresholds:
+        filtered = detection.filter_predictions(predictions, threshold / 100)
+        frames_with_fish = detection.frames_with_detections(filtered)
+        frame_ranges = detection.add_buffer_to_ranges(
+            detection.detected_frames_to_ranges(
+                frames_with_fish, frame_buffer=int(fps * frame_buffer_seconds)
+            ),
+            fps,
+            len(predictions),
+            buffer_before,
+            buffer_after,
+        )
+        output_frames = sum(end - start + 1 for start, end in frame_ranges)
+        results.append(
+            SweepResult(
+                threshold=threshold,
+                frames_with_fish=len(frames_with_fish),
+                range_count=len(frame_ranges),
+                output_seconds=output_frames / fps if fps > 0 else 0.0,
+            )
+        )
+    return results
+
+
+def __load_or_detect(
+    model: BatchYolov8, video_path: Path, batch_size: int
+) -> List[List[Dict[str, Any]]]:
+    """Gets the detections of a video at the model's threshold, from the cache if possible"""
+    cache_key = detection_cache_key(model, video_path)
+    predictions = load_detections(cache_key, model.names, model.colors)
+    if predictions is not None:
+        print(f"{video_path.name}: using cached detections")
+        return predictions
+
+    print(f"{video_path.name}: detecting at {model.conf_thres:.2f}")
+    _, predictions = detection.process_video(
+        model=model,
+        video_path=video_path,
+        batch_size=batch_size,
+        max_batches_to_queue=4,
+        output_path=None,
+        stop_event=threading.Event(),
+    )
+    save_detections(cache_key, predictions)
+    return predictions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Runs the threshold sweep from the command line."""
+    settings.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("videos", nargs="+", type=Path, help="videos to sweep")
+    parser.add_argument(
+        "--thresholds",
+        nargs="+",
+        type=int,
+        default=[30, 40, 50, 60, 70, 80],
+        help="confidence thresholds in percent",
+    )
+    parser.add_argument(
+        "--floor",
+        type=int,
+        default=None,
+        help="confidence floor in percent to detect at, defaults to the lowest threshold",
+    )
+    parser.add_argument("--weights", default=settings.weights, help="model weights")
+    parser.add_argument("--device", default="", help="device to run the model on")
+    args = parser.parse_args(argv)
+
+    thresholds = sorted(args.thresholds)
+    floor = args.floor if args.floor is not None else thresholds[0]
+    if floor > thresholds[0]:
+        parser.error("The floor must not be above the lowest threshold")
+
+    model = BatchYolov8(Common.weights_folder / args.weights, args.device)
+    model.conf_thres = floor / 100
+
+    for video_path in args.videos:
+        predictions = __load_or_detect(
+            model, video_path, detection_parameters(model, video_path).batch_size
+        )
+        results = sweep_thresholds(
+            predictions,
+            thresholds,
+            probe_video(video_path).fps,
+            settings.frame_buffer_seconds,
+            settings.buffer_before,
+            settings.buffer_after,
+        )
+
+        print(f"\n{video_path.name}")
+        print(f"{'Threshold':>10} {'Frames':>8} {'Ranges':>7} {'Output':>16}")
+        for result in results:
+            output = timedelta(seconds=round(result.output_seconds, 1))
+            print(
+                f"{result.threshold:>9}% {result.frames_with_fish:>8} "
+                f"{result.range_count:>7} {str(output):>16}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Exports videos, detection ranges and per-frame detections as typed Parquet tables.
+
+pyarrow is an optional dependency, installed with the parquet extra, and only
+imported when exporting.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.frame_detection_store import FrameDetectionStore
+from app.data_manager.report_queries import ReportQueries
+from app.logger import get_logger
+
+logger = get_logger()
+
+# Number of rows written to the file at a time
+BATCH_ROWS = 65536
+
+COMPRESSION = "zstd"
+
+
+def __import_pyarrow() -> Any:
+    """Imports pyarrow, with a helpful error if it isn't installed"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise RuntimeError(
+            "Parquet export needs pyarrow, install it with the parquet extra"
+        ) from err
+    return pyarrow
+
+
+def __schemas(pyarrow: Any) -> Dict[str, Any]:
+    """The schema of each exported table"""
+    return {
+        "videos": pyarrow.schema(
+            [
+                ("video_id", pyarrow.string()),
+                ("title", pyarrow.string()),
+                ("folder", pyarrow.string()),
+                ("date", pyarrow.string()),
+                ("fps", pyarrow.float64()),
+                ("length_ms", pyarrow.int64()),
+                ("output_length_ms", pyarrow.int64()),
+                ("range_count", pyarrow.int64()),
+                ("detected_ms", pyarrow.int64()),
+                ("class_counts", pyarrow.map_(pyarrow.string(), pyarrow.int64())),
+                ("max_confidence", pyarrow.float64()),
+                ("frame_count", pyarrow.int64()),
+                ("processing_seconds", pyarrow.float64()),
+            ]
+        ),
+        "ranges": pyarrow.schema(
+            [
+                ("video_id", pyarrow.string()),
+                ("title", pyarrow.string()),
+                ("detection_id", pyarrow.int64()),
+                ("start_frame", pyarrow.int64()),
+                ("end_frame", pyarrow.int64()),
+                ("start_ms", pyarrow.int64()),
+                ("end_ms", pyarrow.int64()),
+            ]
+        ),
+        "frames": pyarrow.schema(
+            [
+                ("video_id", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                ("frame", pyarrow.int64()),
+                ("class_id", pyarrow.int16()),
+                ("class_name", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                ("confidence", pyarrow.float32()),
+                ("xmin", pyarrow.float32()),
+                ("ymin", pyarrow.float32()),
+                ("xmax", pyarrow.float32()),
+                ("ymax", pyarrow.float32()),
+            ]
+        ),
+    }
+
+
+def __rows_to_table(pyarrow: Any, schema: Any, rows: List[Tuple[Any, ...]]) -> Any:
+    """Converts rows to a table, column by column"""
+    if len(rows) == 0:
+        return schema.empty_table()
+    return pyarrow.Table.from_arrays(
+        [
+            pyarrow.array(column, type=field.type)
+            for column, field in zip(zip(*rows), schema)
+        ],
+        schema=schema,
+    )
+
+
+def __write_rows(
+    pyarrow: Any, path: Path, schema: Any, rows: Iterable[Tuple[Any, ...]]
+) -> int:
+    """Writes rows to a Parquet file in batches, returns the number of rows"""
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow.parquet as pq
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression=COMPRESSION) as writer:
+        batch: List[Tuple[Any, ...]] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                writer.write_table(__rows_to_table(pyarrow, schema, batch))
+                count += len(batch)
+                batch = []
+        writer.write_table(__rows_to_table(pyarrow, schema, batch))
+        count += len(batch)
+    return count
+
+
+def __video_rows(
+    report_queries: ReportQueries, videos: List[str]
+) -> Iterable[Tuple[Any, ...]]:
+    """The rows of the videos table, with the class counts decoded"""
+    for row in report_queries.iter_video_export(videos):
+        class_counts = json.loads(row[9]) if row[9] is not None else None
+        yield row[:9] + (
+            list(class_counts.items()) if class_counts is not None else None,
+        ) + row[10:]
+
+
+def __write_frames(
+    pyarrow: Any,
+    path: Path,
+    schema: Any,
+    frame_detections: FrameDetectionStore,
+    video_ids: List[str],
+) -> int:
+    """Writes the stored per-frame detections, one columnar batch per chunk"""
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow.parquet as pq
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression=COMPRESSION) as writer:
+        for video_id in video_ids:
+            class_names = frame_detections.get_class_names(video_id)
+            for chunk in frame_detections.get_frame_detections(video_id):
+                if chunk.count == 0:
+                    continue
+                boxes = chunk.boxes
+                names = [
+                    class_names.get(int(class_id), "") for class_id in chunk.class_ids
+                ]
+                writer.write_table(
+                    pyarrow.Table.from_arrays(
+                        [
+                            pyarrow.array([video_id] * chunk.count).dictionary_encode(),
+                            pyarrow.array(chunk.frames, pyarrow.int64()),
+                            pyarrow.array(
+                                chunk.class_ids.astype(np.int16), pyarrow.int16()
+                            ),
+                            pyarrow.array(names).dictionary_encode(),
+                            pyarrow.array(chunk.confidences, pyarrow.float32()),
+                            pyarrow.array(boxes[:, 0], pyarrow.float32()),
+                            pyarrow.array(boxes[:, 1], pyarrow.float32()),
+                            pyarrow.array(boxes[:, 2], pyarrow.float32()),
+                            pyarrow.array(boxes[:, 3], pyarrow.float32()),
+                        ],
+                        schema=schema,
+                    )
+                )
+                count += chunk.count
+    return count
+
+
+def export_parquet(
+    data_manager: DataManager, videos: List[str], path: Path
+) -> List[Path]:
+    """Exports the videos and their detections as Parquet tables.
+
+    The ranges are written to path, the videos to <stem>_videos.parquet next to it,
+    and the per-frame detections, if any are stored, to <stem>_frames.parquet.
+
+    Args:
+        data_manager: The database to export from.
+        videos: The ids of the videos to export.
+        path: The path of the ranges table.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed.
+
+    Returns:
+        The paths of the written tables.
+    """
+    pyarrow = __import_pyarrow()
+    schemas = __schemas(pyarrow)
+    report_queries = ReportQueries(data_manager)
+
+    videos_path = path.with_name(f"{path.stem}_videos{path.suffix}")
+    frames_path = path.with_name(f"{path.stem}_frames{path.suffix}")
+
+    range_count = __write_rows(
+        pyarrow, path, schemas["ranges"], report_queries.iter_detection_export(videos)
+    )
+    video_rows = list(__video_rows(report_queries, videos))
+    __write_rows(pyarrow, videos_path, schemas["videos"], video_rows)
+    written = [path, videos_path]
+
+    video_ids = [row[0] for row in video_rows]
+    frame_count = __write_frames(
+        pyarrow,
+        frames_path,
+        schemas["frames"],
+        FrameDetectionStore(data_manager),
+        video_ids,
+    )
+    if frame_count > 0:
+        written.append(frames_path)
+    else:
+        frames_path.unlink()
+
+    logger.info(
+        "Exported %s videos, %s ranges and %s frame detections",
+        len(video_rows),
+        range_count,
+        frame_count,
+    )
+    return written
@@ -0,0 +1,128 @@
+"""Renders the PDF report as paginated tables.
+
+Each video gets a summary table followed by a table of its detections. Rows that
+don't fit on the page start a new page with the table header repeated, and the font
+is only changed when switching between headings, headers and rows.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+from fpdf import FPDF
+
+FONT = "Arial"
+ROW_HEIGHT = 6.0
+# Height of a detection row with a thumbnail, in mm
+THUMBNAIL_ROW_HEIGHT = 14.0
+DETECTION_COLUMNS = (("Detection", 30.0), ("Start", 50.0), ("End", 50.0))
+THUMBNAIL_COLUMN = ("Thumbnail", 30.0)
+SUMMARY_COLUMNS = (("", 60.0), ("", 100.0))
+
+
+def _latin1(text: Any) -> str:
+    """The core fonts only support latin-1, other characters are replaced"""
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+
+# FPDF is untyped, and the page footer can only be added by overriding footer
+class PdfReport(FPDF):  # type: ignore[misc]
+    """A PDF report of per-video summary and detection tables."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.set_compression(True)
+        self.set_auto_page_break(True, margin=15)
+        self.alias_nb_pages()
+        self.__style: Tuple[str, int] | None = None
+        self.add_page()
+
+    def footer(self) -> None:
+        """Adds the page number at the bottom of every page"""
+        style = self.__style
+        self.set_y(-12)
+        self.__set_style("", 8)
+        self.cell(0, 6, f"Page {self.page_no()} of {{nb}}", align="C")
+        if style is not None:
+            self.__set_style(*style)
+
+    def __set_style(self, style: str, size: int) -> None:
+        """Sets the font, only if it changes"""
+        if self.__style != (style, size):
+            self.set_font(FONT, style, size)
+            self.__style = (style, size)
+
+    def __ensure_space(self, height: float) -> bool:
+        """Starts a new page if a block of the height doesn't fit on this one
+
+        Returns:
+            bool: True if a new page was started
+        """
+        if self.get_y() + height > self.page_break_trigger:
+            self.add_page()
+            return True
+        return False
+
+    def __write_table_header(self, columns: Sequence[Tuple[str, float]]) -> None:
+        """Writes the header row of a table"""
+        self.__set_style("B", 10)
+        for title, width in columns:
+            self.cell(width, ROW_HEIGHT, title, border=1, fill=True)
+        self.ln(ROW_HEIGHT)
+        self.__set_style("", 10)
+
+    def __write_summary(self, title: str, summary: Sequence[Tuple[str, Any]]) -> None:
+        """Writes the heading and summary table of a video"""
+        # Keep the heading together with the summary and the first detection
+        self.__ensure_space(12 + ROW_HEIGHT * (len(summary) + 2))
+        self.__set_style("B", 12)
+        self.set_fill_color(220, 220, 220)
+        self.cell(0, 10, _latin1(title), ln=1)
+
+        self.__set_style("", 10)
+        for name, value in summary:
+            self.cell(SUMMARY_COLUMNS[0][1], ROW_HEIGHT, _latin1(name), border=1)
+            self.cell(SUMMARY_COLUMNS[1][1], ROW_HEIGHT, _latin1(value), border=1)
+            self.ln(ROW_HEIGHT)
+        self.ln(4)
+
+    def __write_thumbnail_cell(self, height: float, thumbnail: Path | None) -> None:
+        """Writes a cell with the thumbnail of a detection, empty if it has none"""
+        left, top = self.get_x(), self.get_y()
+        self.cell(THUMBNAIL_COLUMN[1], height, "", border=1)
+        if thumbnail is not None:
+            self.image(str(thumbnail), left + 1, top + 1, h=height - 2)
+
+    def write_video(
+        self,
+        title: str,
+        summary: Sequence[Tuple[str, Any]],
+        detections: Iterable[Sequence[Any]],
+        thumbnails: Dict[int, Path] | None = None,
+    ) -> None:
+        """Writes the summary and detections of a video
+
+        Args:
+            title (str): the title of the video
+            summary (Sequence[Tuple[str, Any]]): the name and value of each summary field
+            detections (Iterable[Sequence[Any]]): the detection id, start and end of each
+                                                  detection, read as the table is written
+            thumbnails (Dict[int, Path] | None): the thumbnail of each detection id
+        """
+        self.__write_summary(title, summary)
+
+        columns = DETECTION_COLUMNS + ((THUMBNAIL_COLUMN,) if thumbnails else ())
+        row_height = THUMBNAIL_ROW_HEIGHT if thumbnails else ROW_HEIGHT
+        header_written = False
+        for detection_id, start, end in detections:
+            if detection_id is None:
+                continue
+            if self.__ensure_space(row_height) or not header_written:
+                self.__write_table_header(columns)
+                header_written = True
+
+            for (_, width), value in zip(columns, (detection_id, start, end)):
+                self.cell(width, row_height, _latin1(value), border=1)
+            if thumbnails:
+                self.__write_thumbnail_cell(row_height, thumbnails.get(detection_id))
+            self.ln(row_height)
+
+        self.ln(6)
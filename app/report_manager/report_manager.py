@@ -1,19 +1,46 @@
 """Writes a detection report into chosen path"""
 import csv
+import io
+import json
 import os
+import tempfile
 import typing
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from xml.dom import minidom
+from xml.sax.saxutils import quoteattr
 
 import xlsxwriter
-from fpdf import FPDF
 
 from app import settings
 from app.data_manager.data_manager import DataManager
+from app.data_manager.report_queries import ReportQueries
 from app.logger import get_logger
+from app.report_manager.parquet_export import export_parquet
+from app.report_manager.pdf_report import PdfReport
+from app.report_manager.thumbnails import extract_thumbnails
 
 logger = get_logger()
 
+# Bump when the layout of the reports changes, so incremental reports are rebuilt
+REPORT_VERSION = 2
+
+# Columns of the video summaries, one row per video
+SUMMARY_HEADER = (
+    "Video",
+    "Date",
+    "Input Videolength",
+    "Output Videolength",
+    "Detections",
+    "Detected Time",
+    "Classes",
+    "Max Confidence",
+    "Processing FPS",
+)
+
+# Columns of the detections, one row per detection
+DETECTION_HEADER = ("Video", "detectionID", "Start", "End")
+
 
 class ReportManager:
     """A class for managing writing the report"""
@@ -32,6 +59,7 @@ class ReportManager:
         """
         self.output_path = output_path
         self.datamanager = data
+        self.report_queries = ReportQueries(data)
         self.file_format = settings.report_format
         self.report_name = "Processing_report"
 
@@ -60,8 +88,69 @@ class ReportManager:
     def __get_save_path(self) -> Path:
         return self.output_path / (self.report_name + self.__get_extension())
 
+    def __get_manifest_path(self) -> Path:
+        return self.output_path / (
+            self.report_name + self.__get_extension() + ".manifest.json"
+        )
+
+    def __load_manifest(self) -> typing.Dict[str, typing.Any] | None:
+        """Loads the manifest of the videos in the existing report
+
+        Returns:
+            Dict[str, Any] | None: the manifest, None if there is none or it can't be read
+        """
+        manifest_path = self.__get_manifest_path()
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                manifest: typing.Dict[str, typing.Any] = json.load(file)
+            if not isinstance(manifest.get("videos"), list):
+                raise ValueError("The manifest has no list of videos")
+            return manifest
+        except (OSError, ValueError) as err:
+            logger.warning("Failed to load the report manifest", exc_info=err)
+            return None
+
+    def __can_append(self, manifest: typing.Dict[str, typing.Any]) -> bool:
+        """Checks if the report was written by this version and wasn't changed since"""
+        save_path = self.__get_save_path()
+        if (
+            manifest.get("version") != REPORT_VERSION
+            or manifest.get("format") != self.file_format
+            or not save_path.exists()
+        ):
+            return False
+        stat = save_path.stat()
+        return (
+            manifest.get("size") == stat.st_size
+            and manifest.get("mtime_ns") == stat.st_mtime_ns
+        )
+
+    def __save_manifest(self, videos: typing.List[str]) -> None:
+        """Saves the videos in the report, with the identity of the written report"""
+        stat = self.__get_save_path().stat()
+        manifest = {
+            "version": REPORT_VERSION,
+            "format": self.file_format,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "videos": videos,
+        }
+        manifest_path = self.__get_manifest_path()
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, manifest_path)
+
     def write_report(self, videos: typing.List[str]) -> None:
-        """writes a report based on the list of videos entered"""
+        """writes a report based on the list of videos entered
+
+        With settings.incremental_report, videos that are already in the report are
+        skipped, and only the new videos are appended to CSV and XML reports. Other
+        formats, and reports written by another version or changed since, are
+        rewritten with the previous and the new videos.
+        """
         if len(videos) == 0:
             logger.info("No videos to write a report for")
             return
@@ -69,6 +158,41 @@ class ReportManager:
         # This will throw an error if we can't write to the file
         self.check_can_write_report()
 
+        if not settings.incremental_report:
+            self.__write_full_report(videos)
+            return
+
+        manifest = self.__load_manifest()
+        reported: typing.List[str] = manifest["videos"] if manifest else []
+        reported_set = set(reported)
+        new_videos = [
+            video for video in dict.fromkeys(videos) if video not in reported_set
+        ]
+        if len(new_videos) == 0 and manifest and self.__can_append(manifest):
+            logger.info("All videos are already in the report")
+            return
+
+        appended = False
+        if manifest and self.__can_append(manifest):
+            try:
+                match self.file_format:
+                    case "CSV":
+                        self.append_csv_file(new_videos)
+                        appended = True
+                    case "XML":
+                        self.append_xml_file(new_videos)
+                        appended = True
+            except ValueError as err:
+                logger.warning("Failed to append to the report", exc_info=err)
+
+        if appended:
+            logger.info("Appended %s videos to the report", len(new_videos))
+        else:
+            self.__write_full_report(reported + new_videos)
+        self.__save_manifest(reported + new_videos)
+
+    def __write_full_report(self, videos: typing.List[str]) -> None:
+        """Writes the report of the videos from scratch"""
         match self.file_format:
             case "CSV":
                 self.write_csv_file(videos)
@@ -78,42 +202,67 @@ class ReportManager:
                 self.write_xml_file(videos)
             case "XLSX":
                 self.write_xlsx_file(videos)
+            case "PARQUET":
+                self.write_parquet_file(videos)
 
     def write_xml_file(self, videos: typing.List[str]) -> None:
         """Writes a report in the format of an xml file
 
+        The detections are written as they are read from the database,
+        so the document is never held in memory.
+
         Args:
             videos (List[str]): List of videos that should be included in the report
         """
+        with open(self.__get_save_path(), "w", encoding="utf-8") as out:
+            out.write('<?xml version="1.0" encoding="utf-8"?>\n<FishDetections>')
+            self.__write_xml_videos(out, videos)
 
-        root: minidom.Document = minidom.Document()
-
-        # gets data from teh database
-        item_list = self.datamanager.get_data(videos)
+    def append_xml_file(self, videos: typing.List[str]) -> None:
+        """Appends the videos to an existing xml report, before its closing root tag
 
-        # Sets up the root element of the file
-        xml = root.createElement("Fish Detections")
-        root.appendChild(xml)  # type: ignore
-
-        # iterates through the list of detections to organize them into the file
-        previous_video = ""
-        for item in item_list:
-            if str(item[0]) != previous_video:
-                video = root.createElement("Video: " + str(item[0]))
-                previous_video = str(item[0])
-                xml.appendChild(video)  # type: ignore
-            child = root.createElement("Detection" + str(item[1]))
-            child.setAttribute("starttime", str(item[2]))
-            child.setAttribute("endtime", str(item[3]))
-            video.appendChild(child)  # type: ignore
+        Args:
+            videos (List[str]): List of videos to add to the report
 
-        xml_str = root.toprettyxml(indent="\t")
+        Raises:
+            ValueError: if the end of the report is not a closing root tag
+        """
+        with open(self.__get_save_path(), "r+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            tail_start = file.seek(max(0, size - 256))
+            tail = file.read()
+            closing = tail.rfind(b"</FishDetections>")
+            if closing == -1 or tail[closing:].strip() != b"</FishDetections>":
+                raise ValueError("The report does not end with </FishDetections>")
+
+            # Continue right after the last element, before the whitespace
+            file.seek(tail_start + len(tail[:closing].rstrip()))
+            file.truncate()
+            out = io.TextIOWrapper(file, encoding="utf-8")
+            self.__write_xml_videos(out, videos)
+            out.flush()
+            out.detach()
+
+    def __write_xml_videos(self, out: typing.TextIO, videos: typing.List[str]) -> None:
+        """Writes the video elements and the closing root tag, escaping the values"""
+        # iterates through the detections to organize them into the file
+        previous_video = None
+        for video, detection, start, end in self.report_queries.iter_data(videos):
+            if video != previous_video:
+                if previous_video is not None:
+                    out.write("\n\t</Video>")
+                out.write(f"\n\t<Video title={quoteattr(str(video))}>")
+                previous_video = video
+            if detection is None:
+                continue
+            out.write(
+                f"\n\t\t<Detection id={quoteattr(str(detection))} "
+                f"starttime={quoteattr(str(start))} endtime={quoteattr(str(end))}/>"
+            )
 
-        # open the output pathway and saves the file
-        with open(
-            self.__get_save_path(), "w", encoding="ascii", errors="ignore"
-        ) as out:
-            out.write(xml_str)
+        if previous_video is not None:
+            out.write("\n\t</Video>")
+        out.write("\n</FishDetections>\n")
 
     def write_csv_file(self, videos: typing.List[str]) -> None:
         """Writes a report in the format of a csv file
@@ -121,36 +270,38 @@ class ReportManager:
         Args:
            videos (List[str]): List of videos that should be included in the report
         """
+        self.__write_csv_section(videos, "w")
 
-        video_list = [
-            (
-                "Video",
-                "Date",
-                "Input Videolength",
-                "Output Videolength",
-            )
-        ] + self.datamanager.get_video_data(videos)
-        logger.info(video_list)
+    def append_csv_file(self, videos: typing.List[str]) -> None:
+        """Appends a section with the summaries and detections of the videos
+        to an existing csv report
 
-        # Gets data from database and appends it to column titles
-        detection_list = [
-            ("Video", "detectionID", "Start", "End")
-        ] + self.datamanager.get_data(videos)
-        logger.info(detection_list)
+        Args:
+           videos (List[str]): List of videos to add to the report
+        """
+        self.__write_csv_section(videos, "a")
 
-        row_list = video_list + [("", "", "", "")] + detection_list
+    def __write_csv_section(self, videos: typing.List[str], mode: str) -> None:
+        """Writes the summaries and then the detections of the videos"""
 
         # opens the output pathway and saves the file
         try:
             with open(
                 self.__get_save_path(),
-                "w",
+                mode,
                 newline="",
                 encoding="ascii",
                 errors="ignore",
             ) as file:
                 writer = csv.writer(file)
-                writer.writerows(row_list)
+                if mode == "a":
+                    writer.writerow(("", "", "", ""))
+                writer.writerow(SUMMARY_HEADER)
+                writer.writerows(self.report_queries.get_video_summaries(videos))
+                writer.writerow(("", "", "", ""))
+                # Detections are written as they are read from the database
+                writer.writerow(DETECTION_HEADER)
+                writer.writerows(self.report_queries.iter_data(videos))
         except PermissionError as err:
             # The file is probably open in another program
             logger.error(
@@ -164,31 +315,41 @@ class ReportManager:
         Args:
             videos (List[str]): List of videos that should be included in the report
         """
+        summaries = {
+            summary[0]: list(zip(SUMMARY_HEADER[1:], summary[1:]))
+            for summary in self.report_queries.get_video_summaries(videos)
+        }
+
+        with tempfile.TemporaryDirectory() as thumbnail_folder:
+            thumbnails = None
+            if settings.report_thumbnails:
+                thumbnails = extract_thumbnails(
+                    self.report_queries.get_detection_frames(videos),
+                    Path(thumbnail_folder),
+                )
+
+            pdf = PdfReport()
+            for title, rows in groupby(
+                self.report_queries.iter_data(videos), key=itemgetter(0)
+            ):
+                pdf.write_video(
+                    title,
+                    summaries.get(title, []),
+                    (row[1:] for row in rows),
+                    thumbnails,
+                )
+
+            # opens the output pathway and saves the file
+            pdf.output(str(self.__get_save_path()), "F")
+
+    def write_parquet_file(self, videos: typing.List[str]) -> None:
+        """Writes the report as typed Parquet tables of the videos, detections and
+        stored per-frame detections, for loading into analysis tools
 
-        # Gets data from the data base
-        item_list = self.datamanager.get_data(videos)
-
-        # sets up the pdf
-        pdf = FPDF()
-        pdf.add_page()
-
-        # iterates through the detections to format and organize the file
-        previous_video = ""
-        for item in item_list:
-            if str(item[0]) != previous_video:
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(40, 10, str(item[0]))
-                pdf.ln(10)
-                previous_video = str(item[0])
-            pdf.set_font("Arial", "", 11)
-            pdf.cell(20, 10, "Detection" + str(item[1]))
-            pdf.ln(6)
-            pdf.cell(50, 10, "StartTime: " + str(item[2]))
-            pdf.cell(50, 10, "EndTime: " + str(item[3]))
-            pdf.ln(8)
-
-        # opens the output pathway and saves the file
-        pdf.output(str(self.__get_save_path()), "F")
+        Args:
+            videos (typing.List[str]): List of videos that should be included in the report
+        """
+        export_parquet(self.datamanager, videos, self.__get_save_path())
 
     def write_xlsx_file(self, videos: typing.List[str]) -> None:
         """writes a report in the format of a xlsx file
@@ -196,51 +357,22 @@ class ReportManager:
         Args:
             videos (typing.List[str]): List of videos that should be included in the report
         """
-        # Workbook() takes one, non-optional, argument
-        # which is the filename that we want to create.
-
-        workbook = xlsxwriter.Workbook(self.__get_save_path())
+        # constant_memory flushes each row to disk once the next row is written,
+        # so the rows must be written in order, one sheet after the other
+        workbook = xlsxwriter.Workbook(
+            self.__get_save_path(), {"constant_memory": True}
+        )
 
         summarysheet = workbook.add_worksheet("Summary")
+        summarysheet.write_row(0, 0, SUMMARY_HEADER)
+        for row, summary in enumerate(
+            self.report_queries.get_video_summaries(videos), start=1
+        ):
+            summarysheet.write_row(row, 0, summary)
 
-        row_list = [
-            (
-                "Video",
-                "Date",
-                "Input Videolength",
-                "Output Videolength",
-            )
-        ] + self.datamanager.get_video_data(videos)
-        logger.info(row_list)
-
-        row = 0
-        col = 0
-
-        for video, date, start, end in row_list:
-            summarysheet.write(row, col, video)
-            summarysheet.write(row, col + 1, date)
-            summarysheet.write(row, col + 2, start)
-            summarysheet.write(row, col + 3, end)
-            row += 1
-
-        # The workbook object is then used to add new
-        # worksheet via the add_worksheet() method.
         detectionsheet = workbook.add_worksheet("Detections")
+        detectionsheet.write_row(0, 0, DETECTION_HEADER)
+        for row, detection in enumerate(self.report_queries.iter_data(videos), start=1):
+            detectionsheet.write_row(row, 0, detection)
 
-        row_list = [
-            ("Video", "detectionID", "Start", "End")
-        ] + self.datamanager.get_data(videos)
-        logger.info(row_list)
-
-        row = 0
-
-        for video, detection, start, end in row_list:
-            detectionsheet.write(row, col, video)
-            detectionsheet.write(row, col + 1, detection)
-            detectionsheet.write(row, col + 2, start)
-            detectionsheet.write(row, col + 3, end)
-            row += 1
-
-        # Finally, close the Excel file
-        # via the close() method.
         workbook.close()
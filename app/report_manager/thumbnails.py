@@ -0,0 +1,96 @@
+"""Extracts small keyframe thumbnails of detections for the reports."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import av
+
+from app.logger import get_logger
+from app.video_processor.video_index import load_video_index
+
+logger = get_logger()
+
+# Height of the thumbnails in pixels, the width follows the aspect ratio of the video
+THUMBNAIL_HEIGHT = 72
+
+
+def __save_thumbnail(frame: Any, path: Path, height: int) -> None:
+    """Saves a frame scaled to the height as a JPEG"""
+    width = max(1, round(frame.width * height / frame.height))
+    frame.to_image().resize((width, height)).save(path, quality=80)
+
+
+def __extract_video_thumbnails(
+    video_path: Path,
+    detections: List[Tuple[int, int]],
+    folder: Path,
+    height: int,
+) -> Dict[int, Path]:
+    """Saves the keyframe at or before the start of each detection in one video.
+
+    Only keyframes are decoded, so each thumbnail costs a seek and a single frame.
+    """
+    thumbnails: Dict[int, Path] = {}
+    try:
+        video_index = load_video_index(video_path)
+        with av.open(str(video_path)) as container:
+            video_stream = container.streams.video[0]
+            for detection_id, start_frame in detections:
+                timestamp = video_index.keyframe_timestamp_before(
+                    min(start_frame, video_index.frame_count - 1)
+                )
+                container.seek(timestamp, stream=video_stream)
+                frame = next(container.decode(video_stream), None)
+                if frame is None:
+                    continue
+
+                thumbnail_path = folder / f"{detection_id}.jpg"
+                __save_thumbnail(frame, thumbnail_path, height)
+                thumbnails[detection_id] = thumbnail_path
+    except (OSError, av.error.FFmpegError) as err:
+        logger.warning("Failed to extract thumbnails of %s", video_path, exc_info=err)
+    return thumbnails
+
+
+def extract_thumbnails(
+    detections: List[Tuple[str, int, int]],
+    folder: Path,
+    height: int = THUMBNAIL_HEIGHT,
+    max_workers: int | None = None,
+) -> Dict[int, Path]:
+    """Extracts a keyframe thumbnail for each detection, one video per worker thread.
+
+    Decoding releases the GIL, so the videos are decoded in parallel.
+
+    Args:
+        detections: The video path, detection id and start frame of each detection.
+        folder: The folder to save the thumbnails in.
+        height: The height of the thumbnails in pixels.
+        max_workers: The number of videos decoded at once, defaults to the CPU count.
+
+    Returns:
+        The path of the thumbnail of each detection id, missing if the video
+        could not be read.
+    """
+    videos = [
+        (Path(video_id), [(detection_id, frame) for _, detection_id, frame in group])
+        for video_id, group in groupby(
+            # Sorted by frame within a video so the seeks only go forward
+            sorted(detections, key=lambda detection: (detection[0], detection[2])),
+            key=lambda detection: detection[0],
+        )
+        if os.path.exists(video_id)
+    ]
+
+    thumbnails: Dict[int, Path] = {}
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        for video_thumbnails in executor.map(
+            lambda video: __extract_video_thumbnails(
+                video[0], video[1], folder, height
+            ),
+            videos,
+        ):
+            thumbnails.update(video_thumbnails)
+    return thumbnails
@@ -21,23 +21,70 @@ buffer_before: int = 0
 buffer_after: int = 0
 keep_original: bool = True
 
+# Also process the videos in the subfolders of the input folder
+recursive_scan: bool = False
+
+# Skip videos that were already processed with the same settings and model, as long
+# as their output still exists
+skip_processed_videos: bool = True
+
 # Advanced settings
 get_report: bool = False
 
 report_format: str = "CSV"
 
-batch_size: int = 8
+# Only add the videos that aren't in the existing report yet
+incremental_report: bool = False
+
+# Add a keyframe thumbnail of each detection to PDF reports
+report_thumbnails: bool = False
+
+# Frames detected at once, 0 tunes the batch size, preprocessing threads and queue
+# depth on the first video and caches them per machine and model
+batch_size: int = 0
+
+# Max memory used by the batches while tuning the detection, on the GPU at most 90%
+# of its memory is used
+autotune_memory_mb: int = 4096
 
 prediction_threshold: int = 50
 
+# Detect down to this confidence and apply prediction_threshold afterwards, so other
+# thresholds can be tried on the cached detections without running the model again.
+# 0 detects at prediction_threshold
+confidence_floor: int = 0
+
 box_around_fish: bool = False
 
 video_crf: int = 23
 
+encoder_profile: str = "review"
+
+# Max time spent cutting as a percentage of the detection time, used by the auto encoder profile
+encoder_target_percent: int = 50
+
 max_detections: int = 100
 
 frame_buffer_seconds: int = 1
 
+# Max size of the cache of detection results on disk, 0 disables the cache
+detection_cache_mb: int = 2048
+
+# Number of videos cut in a worker process while the next video is detected,
+# 0 cuts each video before detecting the next
+cut_look_ahead: int = 1
+
+# Number of videos detected at once in shared batches, so short videos and the ends
+# of videos fill whole batches, 1 detects one video at a time
+multi_stream_videos: int = 2
+
+# Seconds between checkpoints of the detections of a video, so a stopped or crashed
+# video resumes where it left off, 0 disables checkpoints
+checkpoint_seconds: int = 60
+
+# Store every detection's box, class and confidence, not only the frame ranges
+store_frame_detections: bool = False
+
 weights: str = "v8s-640-classes-augmented-backgrounds.pt"
 
 # endregion
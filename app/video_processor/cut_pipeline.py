@@ -0,0 +1,273 @@
+"""Cuts videos in a worker process while the detection thread moves on to the next video.
+
+Detection is bound by the model and cutting by the encoder, so running them one after
+the other leaves one of them idle. The pipeline cuts in the background with a bounded
+number of videos waiting, and reports completed cuts in the order they were submitted,
+so the caller's database writes and progress stay in video order.
+
+Worker processes are spawned rather than forked, since the parent runs CUDA and Qt
+threads that a fork can't safely copy.
+"""
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, Deque, Dict, List, Tuple, Type
+
+from app import settings
+from app.logger import get_logger
+from app.video_processor import Detection
+from app.video_processor.encoder_profiles import EncoderProfile
+from app.video_processor.video_processor import cut_video
+
+logger = get_logger()
+
+# Seconds between checks of the stop event while waiting for a cut
+POLL_SECONDS = 0.1
+
+__process_state: Dict[str, Any] = {}
+
+
+def _init_cut_process(progress_queue: Any, stop_event: Any) -> None:
+    """Sets up a cut worker process, reading the settings the parent saved"""
+    settings.setup()
+    __process_state["progress_queue"] = progress_queue
+    __process_state["stop_event"] = stop_event
+
+
+def _cut_in_process(  # pylint: disable=too-many-arguments
+    job_index: int,
+    input_path: Path,
+    output_path: Path,
+    frame_ranges: List[Tuple[int, int]],
+    predictions: Dict[int, List[Detection]] | None,
+    encoder_profile: EncoderProfile | None,
+) -> bool:
+    """Cuts a video in a worker process, sending progress back to the parent"""
+    progress_queue = __process_state["progress_queue"]
+    last_progress = [-1]
+
+    def notify_progress(progress: int) -> None:
+        # Only send changes, cut_video reports every frame
+        if progress != last_progress[0]:
+            last_progress[0] = progress
+            progress_queue.put((job_index, progress))
+
+    return cut_video(
+        input_path,
+        output_path,
+        frame_ranges,
+        predictions,
+        notify_progress=notify_progress,
+        encoder_profile=encoder_profile,
+        stop_event=__process_state["stop_event"],
+    )
+
+
+@dataclass
+class CutJob:
+    """A submitted video, finished in submission order."""
+
+    index: int
+    input_path: Path
+    future: "Future[bool]"
+    on_done: Callable[[bool], None]
+    notify_progress: Callable[[int], None] | None
+
+
+class CutPipeline:
+    """Cuts videos in the background, at most max_pending at a time.
+
+    With max_pending 0, videos are cut in the calling thread as they are submitted.
+    A failed cut is reported to on_error instead of on_done, so it doesn't stop the
+    videos after it.
+    """
+
+    def __init__(
+        self,
+        stop_event: threading.Event,
+        max_pending: int = 1,
+        on_error: Callable[[Path, Exception], None] | None = None,
+    ) -> None:
+        """Starts the worker process, if cutting in the background
+
+        Args:
+            stop_event (threading.Event): stops the cuts when set
+            max_pending (int): max number of videos submitted and not finished
+            on_error (Callable[[Path, Exception], None] | None): called with the
+                video and the error of a failed cut, in submission order
+        """
+        self.stop_event = stop_event
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.__jobs: Deque[CutJob] = deque()
+        self.__job_count = 0
+        self.__executor: ProcessPoolExecutor | None = None
+
+        if max_pending > 0:
+            context = multiprocessing.get_context("spawn")
+            self.__progress_queue: Any = context.Queue()
+            self.__process_stop_event: Any = context.Event()
+            self.__executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_cut_process,
+                initargs=(self.__progress_queue, self.__process_stop_event),
+            )
+
+    def __enter__(self) -> "CutPipeline":
+        """Returns the pipeline"""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,  # pylint: disable=unused-argument
+        trace_back: TracebackType | None,  # pylint: disable=unused-argument
+    ) -> None:
+        """Finishes the submitted cuts, or stops them if leaving because of an error"""
+        if exc_type is not None:
+            self.stop_event.set()
+        self.close()
+
+    def submit(  # pylint: disable=too-many-arguments
+        self,
+        input_path: Path,
+        output_path: Path | None,
+        frame_ranges: List[Tuple[int, int]],
+        predictions: Dict[int, List[Detection]] | None,
+        encoder_profile: EncoderProfile | None,
+        on_done: Callable[[bool], None],
+        notify_progress: Callable[[int], None] | None = None,
+    ) -> None:
+        """Submits a video to cut, waiting while max_pending videos are unfinished.
+
+        A video without frame ranges or output path isn't cut, but is still finished
+        in order with the others.
+
+        Args:
+            input_path (Path): the video to cut
+            output_path (Path | None): the cut video
+            frame_ranges (List[Tuple[int, int]]): the frame ranges to keep
+            predictions (Dict[int, List[Detection]] | None): detections to annotate
+            encoder_profile (EncoderProfile | None): the encoder profile of the output
+            on_done (Callable[[bool], None]): called with whether the cut completed,
+                in submission order, from the thread that submits or waits
+            notify_progress (Callable[[int], None] | None): called with the progress
+                of the cut while it is the oldest unfinished one
+        """
+        future: "Future[bool]"
+        if len(frame_ranges) == 0 or output_path is None:
+            future = Future()
+            future.set_result(True)
+        elif self.__executor is None:
+            future = Future()
+            try:
+                future.set_result(
+                    cut_video(
+                        input_path,
+                        output_path,
+                        frame_ranges,
+                        predictions,
+                        notify_progress=notify_progress,
+                        encoder_profile=encoder_profile,
+                        stop_event=self.stop_event,
+                    )
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+        else:
+            # Passes a set stop event on before the cut can start
+            self.poll()
+            while len(self.__jobs) >= self.max_pending:
+                self.__finish_oldest()
+            future = self.__executor.submit(
+                _cut_in_process,
+                self.__job_count,
+                input_path,
+                output_path,
+                frame_ranges,
+                predictions,
+                encoder_profile,
+            )
+
+        self.__jobs.append(
+            CutJob(self.__job_count, input_path, future, on_done, notify_progress)
+        )
+        self.__job_count += 1
+        self.poll()
+
+    def poll(self) -> None:
+        """Reports progress and finishes the cuts that are done, without waiting"""
+        if self.stop_event.is_set() and self.__executor is not None:
+            self.__process_stop_event.set()
+        self.__drain_progress()
+        while len(self.__jobs) > 0 and self.__jobs[0].future.done():
+            self.__finish(self.__jobs.popleft())
+
+    def wait(self) -> None:
+        """Waits until every submitted video is finished"""
+        while len(self.__jobs) > 0:
+            self.__finish_oldest()
+
+    def close(self) -> None:
+        """Waits for the submitted videos and stops the worker process"""
+        try:
+            self.wait()
+        finally:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
+
+    def __finish_oldest(self) -> None:
+        """Waits for the oldest submitted video and finishes it"""
+        job = self.__jobs[0]
+        while not job.future.done():
+            self.poll()
+            if self.__jobs and self.__jobs[0] is job:
+                try:
+                    job.future.result(timeout=POLL_SECONDS)
+                except TimeoutError:
+                    continue
+                except Exception:  # pylint: disable=broad-except
+                    # Reported by __finish, in order
+                    pass
+        self.poll()
+
+    def __finish(self, job: CutJob) -> None:
+        """Finishes a job, reporting the error of its cut if it failed"""
+        try:
+            completed = job.future.result()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Failed to cut %s", job.input_path, exc_info=error)
+            if self.on_error is not None:
+                self.on_error(job.input_path, error)
+            return
+        if not completed:
+            logger.info("Stopped cutting %s", job.input_path)
+        job.on_done(completed)
+
+    def __drain_progress(self) -> None:
+        """Reports the progress of the oldest unfinished cut, older updates are dropped"""
+        if self.__executor is None:
+            return
+
+        updates: Dict[int, int] = {}
+        while True:
+            try:
+                job_index, progress = self.__progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            updates[job_index] = progress
+
+        oldest = self.__jobs[0] if len(self.__jobs) > 0 else None
+        if (
+            oldest is not None
+            and oldest.notify_progress is not None
+            and oldest.index in updates
+        ):
+            oldest.notify_progress(updates[oldest.index])
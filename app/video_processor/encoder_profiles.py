@@ -0,0 +1,248 @@
+"""Named encoder profiles for the cut videos, and automatic selection of the x264 preset."""
+import json
+import os
+import platform
+import time
+from dataclasses import dataclass, replace
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, List
+
+import av
+
+from app import settings
+from app.common import Common
+from app.logger import get_logger
+from app.video_processor.probe import probe_video
+
+logger = get_logger()
+
+# x264 presets ordered from the slowest (best compression) to the fastest
+PRESETS = [
+    "veryslow",
+    "slower",
+    "slow",
+    "medium",
+    "fast",
+    "faster",
+    "veryfast",
+    "superfast",
+    "ultrafast",
+]
+
+# Number of frames encoded per preset when benchmarking
+BENCHMARK_FRAMES = 50
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """Encoder parameters for libx264."""
+
+    name: str
+    preset: str
+    tune: str | None
+    gop_seconds: float
+    threads: int = 0  # 0 lets the encoder decide
+    pix_fmt: str = "yuv420p"
+
+    def options(self, crf: int, fps: float) -> Dict[str, str]:
+        """Get the codec options of the profile.
+
+        Args:
+            crf: The constant rate factor.
+            fps: The frame rate of the output video, used to convert the GOP to frames.
+
+        Returns:
+            The codec options.
+        """
+        options = {
+            "crf": str(crf),
+            "preset": self.preset,
+            "g": str(max(1, round(self.gop_seconds * fps))),
+            "threads": str(self.threads),
+        }
+        if self.tune is not None:
+            options["tune"] = self.tune
+        return options
+
+
+PROFILES = {
+    # Small files for long term storage, slow to encode and to seek in
+    "archive": EncoderProfile("archive", preset="slow", tune=None, gop_seconds=10),
+    # Short GOP so the videos are quick to scrub through when reviewing detections
+    "review": EncoderProfile("review", preset="medium", tune=None, gop_seconds=2),
+    # Keeps up with detection on slow machines, at the cost of larger files
+    "fast": EncoderProfile("fast", preset="veryfast", tune="fastdecode", gop_seconds=2),
+}
+
+AUTO_PROFILE = "auto"
+
+
+def __benchmark_preset(frames: List[av.VideoFrame], fps: float, preset: str) -> float:
+    """Encodes the frames with a preset and returns the encoding speed in FPS."""
+    codec_context = av.CodecContext.create("libx264", "w")
+    codec_context.width = frames[0].width
+    codec_context.height = frames[0].height
+    codec_context.pix_fmt = PROFILES["review"].pix_fmt
+    codec_context.time_base = 1 / Fraction(fps or 25).limit_denominator(65535)
+    codec_context.options = replace(PROFILES["review"], preset=preset).options(
+        settings.video_crf, fps
+    )
+
+    start_time = time.perf_counter()
+    for i, frame in enumerate(frames):
+        frame.pts = i
+        codec_context.encode(frame)
+    codec_context.encode(None)
+    return len(frames) / (time.perf_counter() - start_time)
+
+
+def __read_benchmark_frames(video_path: Path) -> List[av.VideoFrame]:
+    """Decodes the first frames of a video for benchmarking."""
+    frames = []
+    with av.open(str(video_path)) as container:
+        video_stream = container.streams.video[0]
+        video_stream.thread_type = "AUTO"
+        for frame in container.decode(video_stream):
+            frames.append(frame.reformat(format=PROFILES["review"].pix_fmt))
+            if len(frames) >= BENCHMARK_FRAMES:
+                break
+    return frames
+
+
+def __load_benchmarks(cache_path: Path) -> Dict[str, Dict[str, float]]:
+    """Loads the cached measurements of every machine and resolution"""
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            benchmarks: Dict[str, Dict[str, float]] = json.load(file)
+            return benchmarks
+    except (OSError, ValueError) as err:
+        logger.warning("Failed to load encoder benchmarks", exc_info=err)
+        return {}
+
+
+def cached_encoder_fps(
+    width: int, height: int, preset: str, cache_folder: Path = Common.cache_folder
+) -> float | None:
+    """Get the encoding speed of a preset measured on this machine, without measuring.
+
+    Args:
+        width: The width of the video.
+        height: The height of the video.
+        preset: The x264 preset.
+        cache_folder: The folder the measurements are cached in.
+
+    Returns:
+        The encoding speed in FPS, or None if it wasn't measured at this resolution.
+    """
+    benchmarks = __load_benchmarks(cache_folder / "encoder_benchmarks.json")
+    return benchmarks.get(f"{platform.node()}|{width}x{height}", {}).get(preset)
+
+
+def benchmark_presets(
+    video_path: Path, min_fps: float, cache_folder: Path = Common.cache_folder
+) -> Dict[str, float]:
+    """Measure the encoding speed of the presets on a sample of a video.
+
+    Presets are benchmarked from the fastest to the slowest, stopping at the first
+    one slower than min_fps, since all slower presets will be too slow as well.
+    Measurements are cached per machine and resolution.
+
+    Args:
+        video_path: The video to take the sample from.
+        min_fps: The lowest encoding speed that is of interest.
+        cache_folder: The folder to cache the measurements in.
+
+    Returns:
+        The encoding speed in FPS of each benchmarked preset.
+    """
+    video_info = probe_video(video_path)
+    cache_path = cache_folder / "encoder_benchmarks.json"
+    key = f"{platform.node()}|{video_info.width}x{video_info.height}"
+
+    benchmarks = __load_benchmarks(cache_path)
+    measurements = benchmarks.get(key, {})
+    frames: List[av.VideoFrame] = []
+    for preset in reversed(PRESETS):
+        if preset not in measurements:
+            # Only decode the sample if something has to be benchmarked
+            if len(frames) == 0:
+                frames = __read_benchmark_frames(video_path)
+            if len(frames) == 0:
+                return measurements
+            measurements[preset] = __benchmark_preset(frames, video_info.fps, preset)
+            logger.info("Preset %s encodes at %.2f FPS", preset, measurements[preset])
+        if measurements[preset] < min_fps:
+            break
+
+    benchmarks[key] = measurements
+    try:
+        cache_folder.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(benchmarks, file)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.warning("Failed to cache encoder benchmarks", exc_info=err)
+
+    return measurements
+
+
+def select_preset(
+    measurements: Dict[str, float], detection_fps: float, target_fraction: float
+) -> str:
+    """Select the slowest preset that keeps cutting within a fraction of the detection time.
+
+    Cutting a frame takes 1 / encode_fps seconds and detecting it 1 / detection_fps seconds,
+    so the preset must encode at detection_fps / target_fraction or faster.
+
+    Args:
+        measurements: The encoding speed in FPS of each preset.
+        detection_fps: The detection speed in FPS.
+        target_fraction: The max cutting time as a fraction of the detection time.
+
+    Returns:
+        The selected preset, or the fastest preset if none is fast enough.
+    """
+    min_fps = detection_fps / target_fraction
+    for preset in PRESETS:
+        if preset in measurements and measurements[preset] >= min_fps:
+            return preset
+    return PRESETS[-1]
+
+
+def get_encoder_profile(
+    name: str, video_path: Path | None = None, detection_fps: float | None = None
+) -> EncoderProfile:
+    """Get an encoder profile by name.
+
+    The auto profile benchmarks the presets on the first use on a machine and picks
+    the slowest one that keeps cutting within settings.encoder_target_percent of the
+    detection time.
+
+    Args:
+        name: The name of the profile, or "auto".
+        video_path: The video to benchmark on, required by the auto profile.
+        detection_fps: The measured detection speed, required by the auto profile.
+
+    Returns:
+        The encoder profile. Unknown names fall back to the review profile.
+    """
+    if name == AUTO_PROFILE:
+        if video_path is None or detection_fps is None or detection_fps <= 0:
+            return PROFILES["review"]
+
+        target_fraction = settings.encoder_target_percent / 100
+        measurements = benchmark_presets(video_path, detection_fps / target_fraction)
+        preset = select_preset(measurements, detection_fps, target_fraction)
+        logger.info(
+            "Auto selected preset %s for detection at %.2f FPS", preset, detection_fps
+        )
+        return replace(PROFILES["review"], name=AUTO_PROFILE, preset=preset)
+
+    if name not in PROFILES:
+        logger.warning("Unknown encoder profile %s, using review", name)
+        return PROFILES["review"]
+    return PROFILES[name]
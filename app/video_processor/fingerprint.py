@@ -0,0 +1,71 @@
+"""Fast content fingerprints of large files.
+
+Hashing a whole video takes as long as reading it, so the fingerprint hashes the size
+and a few evenly spaced samples of the file. It identifies the content regardless of
+the path or modification time, so renamed and copied videos have the same fingerprint.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+# Number of samples hashed and the size of each sample
+SAMPLE_COUNT = 8
+SAMPLE_SIZE = 256 * 1024
+
+__lock = threading.Lock()
+__file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def fingerprint_file(
+    path: Path, sample_count: int = SAMPLE_COUNT, sample_size: int = SAMPLE_SIZE
+) -> str:
+    """Get a fingerprint of a file from its size and evenly spaced samples.
+
+    Files smaller than the samples together are hashed completely.
+
+    Args:
+        path: The path to the file.
+        sample_count: The number of samples to hash.
+        sample_size: The size of each sample in bytes.
+
+    Returns:
+        The fingerprint as a hex string.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(f"{size}|".encode("ascii"))
+    with open(path, "rb") as file:
+        if size <= sample_count * sample_size:
+            digest.update(file.read())
+        else:
+            step = (size - sample_size) // (sample_count - 1)
+            for i in range(sample_count):
+                file.seek(i * step)
+                digest.update(file.read(sample_size))
+    return digest.hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    """Get the sha256 of the complete content of a file, cached by path, size and mtime.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        The hash as a hex string.
+    """
+    stat = os.stat(path)
+    key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    with __lock:
+        if key in __file_hashes:
+            return __file_hashes[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+
+    with __lock:
+        __file_hashes[key] = digest.hexdigest()
+    return digest.hexdigest()
@@ -0,0 +1,126 @@
+"""Probes video metadata, cached in memory and on disk.
+
+Opening a video is slow on network shares, so the metadata of each file is read
+once and cached keyed by the path, size and mtime of the file.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Tuple
+
+import av
+
+from app.common import Common
+from app.logger import get_logger
+
+logger = get_logger()
+
+# Max number of probes kept in memory
+MAX_CACHED_PROBES = 256
+
+
+@dataclass(frozen=True)
+class VideoInfo:  # pylint: disable=too-many-instance-attributes
+    """Metadata of a video."""
+
+    fps: float
+    frame_count: int
+    duration: float  # Seconds
+    width: int
+    height: int
+    codec: str
+    pix_fmt: str
+
+
+__lock = threading.Lock()
+__memory_cache: "OrderedDict[Tuple[str, int, int], VideoInfo]" = OrderedDict()
+
+
+def __read_video_info(video_path: Path) -> VideoInfo:
+    """Reads the metadata from the header of the first video stream."""
+    with av.open(str(video_path)) as container:
+        video_stream = container.streams.video[0]
+        fps = float(video_stream.average_rate or video_stream.guessed_rate or 0)
+
+        if video_stream.duration is not None:
+            duration = float(video_stream.duration * video_stream.time_base)
+        elif container.duration is not None:
+            duration = container.duration / av.time_base
+        else:
+            duration = 0.0
+
+        frame_count = int(video_stream.frames)
+        if frame_count == 0:
+            # Not stored in the header of every container
+            frame_count = int(round(duration * fps))
+        elif fps > 0:
+            duration = frame_count / fps
+
+        return VideoInfo(
+            fps=fps,
+            frame_count=frame_count,
+            duration=duration,
+            width=int(video_stream.codec_context.width),
+            height=int(video_stream.codec_context.height),
+            codec=str(video_stream.codec_context.name),
+            pix_fmt=str(video_stream.codec_context.pix_fmt),
+        )
+
+
+def probe_video(
+    video_path: Path, cache_folder: Path = Common.cache_folder / "probe"
+) -> VideoInfo:
+    """Get the metadata of a video.
+
+    Args:
+        video_path: The path to the video.
+        cache_folder: The folder to cache probes in.
+
+    Raises:
+        FileNotFoundError: If the video does not exist.
+        av.error.FFmpegError: If the video could not be opened.
+
+    Returns:
+        The metadata of the video.
+    """
+    stat = os.stat(video_path)
+    key = (str(Path(video_path).resolve()), stat.st_size, stat.st_mtime_ns)
+
+    with __lock:
+        if key in __memory_cache:
+            __memory_cache.move_to_end(key)
+            return __memory_cache[key]
+
+    digest = hashlib.sha1("|".join(str(part) for part in key).encode("utf-8"))
+    cache_path = cache_folder / f"{digest.hexdigest()}.json"
+
+    video_info = None
+    if cache_path.exists():
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                video_info = VideoInfo(**json.load(file))
+        except (OSError, TypeError, ValueError) as err:
+            logger.warning("Failed to load probe %s", cache_path, exc_info=err)
+
+    if video_info is None:
+        video_info = __read_video_info(video_path)
+        try:
+            cache_folder.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(asdict(video_info), file)
+            os.replace(tmp_path, cache_path)
+        except OSError as err:
+            logger.warning("Failed to cache probe %s", cache_path, exc_info=err)
+
+    with __lock:
+        __memory_cache[key] = video_info
+        __memory_cache.move_to_end(key)
+        while len(__memory_cache) > MAX_CACHED_PROBES:
+            __memory_cache.popitem(last=False)
+
+    return video_info
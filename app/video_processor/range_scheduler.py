@@ -0,0 +1,98 @@
+"""Schedules the order of seeks and decodes when cutting frame ranges out of a video."""
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+# The fixed overhead of a seek, measured in decoded frames.
+# A seek flushes the demuxer and the decoder, which costs roughly as much as
+# decoding this many frames, on top of decoding forward from the keyframe.
+SEEK_COST_FRAMES = 30
+
+
+@dataclass
+class ScheduledRange:
+    """A frame range and whether the cutter should seek before processing it."""
+
+    start: int
+    end: int
+    seek: bool
+
+
+def keyframe_before(frame: int, keyframes: Sequence[int]) -> int | None:
+    """Finds the last keyframe at or before a frame.
+
+    Args:
+        frame: The frame number.
+        keyframes: Sorted list of keyframe frame numbers.
+
+    Returns:
+        The keyframe frame number, or None if there is no keyframe before the frame.
+    """
+    index = bisect_right(keyframes, frame)
+    if index == 0:
+        return None
+    return keyframes[index - 1]
+
+
+def seek_cost(frame: int, keyframes: Sequence[int], fixed_cost: int) -> int:
+    """Estimates the cost of seeking to a frame, in decoded frames.
+
+    A seek lands on the keyframe before the frame and decodes forward from there.
+
+    Args:
+        frame: The frame to seek to.
+        keyframes: Sorted list of keyframe frame numbers.
+        fixed_cost: The fixed overhead of a seek.
+
+    Returns:
+        The estimated cost.
+    """
+    keyframe = keyframe_before(frame, keyframes)
+    if keyframe is None:
+        # Unknown keyframe positions, assume the worst case of decoding from the start
+        keyframe = 0 if len(keyframes) > 0 else frame
+    return fixed_cost + frame - keyframe
+
+
+def schedule_frame_ranges(
+    frame_ranges: List[Tuple[int, int]],
+    keyframes: Sequence[int],
+    fixed_seek_cost: int = SEEK_COST_FRAMES,
+) -> List[ScheduledRange]:
+    """Decides for each frame range whether to seek to it or decode through the gap before it.
+
+    Decoding through a gap costs one decoded frame per frame in the gap.
+    Seeking costs the fixed overhead plus the frames decoded from the keyframe before the range.
+    If that keyframe is at or before the current position, seeking can never be cheaper.
+
+    Args:
+        frame_ranges: Sorted, non-overlapping list of (start, end) frame ranges.
+        keyframes: Sorted list of keyframe frame numbers. May be empty if unknown,
+                   in which case every seek is assumed to land on the start frame.
+        fixed_seek_cost: The fixed overhead of a seek, in decoded frames.
+
+    Returns:
+        The scheduled ranges in the same order as the input.
+    """
+    schedule: List[ScheduledRange] = []
+    previous_end: int | None = None
+    for start, end in frame_ranges:
+        if previous_end is None or start <= previous_end:
+            # Always seek to the first range, and never try to decode backwards
+            schedule.append(ScheduledRange(start, end, seek=True))
+            previous_end = end
+            continue
+
+        gap_cost = start - previous_end - 1
+
+        keyframe = keyframe_before(start, keyframes)
+        if keyframe is not None and keyframe <= previous_end:
+            # The seek would land behind the current position
+            seek = False
+        else:
+            seek = seek_cost(start, keyframes, fixed_seek_cost) < gap_cost
+
+        schedule.append(ScheduledRange(start, end, seek=seek))
+        previous_end = end
+
+    return schedule
@@ -0,0 +1,104 @@
+"""Lists the videos of a folder, optionally of every subfolder too.
+
+Uses os.scandir, which returns the file type with the directory listing and, on
+Windows, the size and modification time, so huge archives are listed without a
+stat call per file.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Sequence
+
+from app.logger import get_logger
+
+logger = get_logger()
+
+
+@dataclass(frozen=True)
+class ScannedVideo:
+    """A video found by a scan, with the size and modification time it was found with."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+
+
+def stat_video(path: Path) -> ScannedVideo:
+    """Reads the size and modification time of a single video.
+
+    Args:
+        path: The path of the video.
+
+    Returns:
+        The video.
+    """
+    stat = os.stat(path)
+    return ScannedVideo(Path(path), stat.st_size, stat.st_mtime_ns)
+
+
+def scan_videos(
+    folder: Path, extensions: Sequence[str], recursive: bool = False
+) -> Iterator[ScannedVideo]:
+    """Lists the videos in a folder, in name order within each folder.
+
+    Folders that can't be read are logged and skipped. Symbolic links to folders
+    are not followed, so a link cycle can't make the scan loop.
+
+    Args:
+        folder: The folder to scan.
+        extensions: The lower case file extensions of videos, with the dot.
+        recursive: Whether to scan the subfolders too.
+
+    Yields:
+        The videos found.
+    """
+    extensions = tuple(extensions)
+    folders = [str(folder)]
+    while len(folders) > 0:
+        current = folders.pop()
+        try:
+            with os.scandir(current) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as err:
+            logger.warning("Failed to scan %s", current, exc_info=err)
+            continue
+
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.name.lower().endswith(extensions):
+                    stat = entry.stat()
+                    yield ScannedVideo(Path(entry.path), stat.st_size, stat.st_mtime_ns)
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+            except OSError as err:
+                logger.warning("Failed to read %s", entry.path, exc_info=err)
+
+        # Reversed so the stack pops the subfolders in name order
+        folders.extend(reversed(subfolders))
+
+
+def output_video_path(
+    video_path: Path, input_folder: Path | None, output_folder: Path
+) -> Path:
+    """The path of the cut video of a video.
+
+    Videos of subfolders are saved in the same subfolders of the output folder, so
+    videos with the same name in different subfolders don't overwrite each other.
+
+    Args:
+        video_path: The path of the video.
+        input_folder: The folder the video was scanned from, None saves it directly
+                      in the output folder.
+        output_folder: The folder to save the cut videos to.
+
+    Returns:
+        The path of the cut video.
+    """
+    subfolder = Path()
+    if input_folder is not None:
+        try:
+            subfolder = video_path.parent.relative_to(input_folder)
+        except ValueError:
+            pass
+    return output_folder / subfolder / f"{video_path.stem}_processed.mp4"
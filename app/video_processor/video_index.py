@@ -0,0 +1,156 @@
+"""Per-video index of packet timestamps, keyframes and byte offsets.
+
+The index is built once per video by demuxing it without decoding, and cached on disk
+keyed by the identity of the file, so later runs can look up exact frame counts and
+seek to exact frames, also for videos with a variable frame rate.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Any
+
+import av
+import numpy as np
+
+from app.common import Common
+from app.logger import get_logger
+
+logger = get_logger()
+
+# Bump when the layout of the cached index changes
+INDEX_VERSION = 1
+
+
+@dataclass
+class VideoIndex:
+    """Timestamps, keyframe flags and byte offsets of every frame in presentation order."""
+
+    time_base: Fraction
+    pts: np.ndarray[Any, Any]
+    keyframe: np.ndarray[Any, Any]
+    offset: np.ndarray[Any, Any]
+
+    @property
+    def frame_count(self) -> int:
+        """The exact number of frames in the video."""
+        return int(len(self.pts))
+
+    @property
+    def keyframes(self) -> list[int]:
+        """The sorted frame numbers of all keyframes."""
+        return [int(frame) for frame in np.flatnonzero(self.keyframe)]
+
+    def frame_to_timestamp(self, frame: int) -> int:
+        """Get the presentation timestamp of a frame, in the stream time base."""
+        return int(self.pts[frame])
+
+    def timestamp_to_frame(self, timestamp: int) -> int:
+        """Get the frame shown at a timestamp, in the stream time base.
+
+        Timestamps between two frames map to the earlier frame.
+        """
+        frame = int(np.searchsorted(self.pts, timestamp, side="right")) - 1
+        return max(frame, 0)
+
+    def keyframe_timestamp_before(self, frame: int) -> int:
+        """Get the timestamp of the last keyframe at or before a frame."""
+        keyframes = np.flatnonzero(self.keyframe[: frame + 1])
+        if len(keyframes) == 0:
+            return self.frame_to_timestamp(0)
+        return self.frame_to_timestamp(int(keyframes[-1]))
+
+
+def build_video_index(video_path: Path) -> VideoIndex:
+    """Build the index of a video by demuxing its first video stream.
+
+    Args:
+        video_path: The path to the video.
+
+    Returns:
+        The video index.
+    """
+    pts = []
+    keyframe = []
+    offset = []
+    with av.open(str(video_path)) as container:
+        video_stream = container.streams.video[0]
+        time_base = Fraction(video_stream.time_base)
+        for packet in container.demux(video_stream):
+            # Skip flush packets and packets without a timestamp
+            if packet.pts is None or packet.size == 0:
+                continue
+            pts.append(packet.pts)
+            keyframe.append(packet.is_keyframe)
+            offset.append(packet.pos if packet.pos is not None else -1)
+
+    # Packets are demuxed in decode order, sort them into presentation order
+    order = np.argsort(np.asarray(pts, dtype=np.int64), kind="stable")
+    return VideoIndex(
+        time_base=time_base,
+        pts=np.asarray(pts, dtype=np.int64)[order],
+        keyframe=np.asarray(keyframe, dtype=np.bool_)[order],
+        offset=np.asarray(offset, dtype=np.int64)[order],
+    )
+
+
+def __get_cache_path(video_path: Path, cache_folder: Path) -> Path:
+    """Get the cache path of an index, keyed by the path, size and mtime of the video."""
+    stat = os.stat(video_path)
+    identity = (
+        f"{video_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{INDEX_VERSION}"
+    )
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+    return cache_folder / f"{digest}.npz"
+
+
+def load_video_index(
+    video_path: Path, cache_folder: Path = Common.cache_folder / "video_index"
+) -> VideoIndex:
+    """Load the index of a video from the cache, building and caching it if needed.
+
+    Args:
+        video_path: The path to the video.
+        cache_folder: The folder to cache indexes in.
+
+    Returns:
+        The video index.
+    """
+    cache_path = __get_cache_path(video_path, cache_folder)
+    if cache_path.exists():
+        try:
+            with np.load(cache_path) as data:
+                return VideoIndex(
+                    time_base=Fraction(
+                        int(data["time_base"][0]), int(data["time_base"][1])
+                    ),
+                    pts=data["pts"],
+                    keyframe=data["keyframe"],
+                    offset=data["offset"],
+                )
+        except (OSError, KeyError, ValueError) as err:
+            logger.warning("Failed to load video index %s", cache_path, exc_info=err)
+
+    logger.info("Building video index for %s", video_path)
+    index = build_video_index(video_path)
+
+    try:
+        cache_folder.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a partial index behind
+        tmp_path = cache_path.with_suffix(".tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            time_base=np.asarray(
+                [index.time_base.numerator, index.time_base.denominator],
+                dtype=np.int64,
+            ),
+            pts=index.pts,
+            keyframe=index.keyframe,
+            offset=index.offset,
+        )
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.warning("Failed to cache video index %s", cache_path, exc_info=err)
+
+    return index
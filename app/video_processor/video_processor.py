@@ -1,7 +1,8 @@
 """Video processor module. Contains functions for processing videos."""
+import threading
 from fractions import Fraction
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 import av
 import av.datasets
@@ -16,6 +17,9 @@ from ultralytics.yolo.utils.checks import check_font, check_version
 from app import settings
 from app.logger import get_logger
 from app.video_processor import Detection
+from app.video_processor.encoder_profiles import EncoderProfile, get_encoder_profile
+from app.video_processor.range_scheduler import schedule_frame_ranges
+from app.video_processor.video_index import VideoIndex, load_video_index
 
 logger = get_logger()
 
@@ -102,174 +106,171 @@ class Annotator:  # pylint: disable=too-few-public-methods
         return np.asarray(image)
 
 
-# Thanks to https://github.com/PyAV-Org/PyAV/blob/main/tests/test_seek.py
-def frame_to_timestamp(frame: int, video_stream: av.video.stream) -> int:
-    """
-    Convert a frame number to a timestamp using the time base and frame rate of a video stream.
-
-    Args:
-        frame (int): The frame number.
-        video_stream (av.video.stream): The input video stream.
-
-    Returns:
-        int: The timestamp in microseconds.
-    """
-
-    time_base = float(video_stream.time_base)
-    rate = float(video_stream.average_rate)
-
-    target_sec = float(frame) * 1.0 / rate
-    timestamp = target_sec / time_base + video_stream.start_time
-
-    return int(round(timestamp))
-
-
-def timestamp_to_frame(timestamp: float, video_stream: av.video.stream) -> int:
+def decode_frames(
+    input_container: av.container.input,
+    video_stream: av.video.stream,
+    video_index: VideoIndex,
+    start: int,
+) -> Iterator[Tuple[int, av.VideoFrame]]:
     """
-    Convert a timestamp to a frame number using the time base and frame rate of a video stream.
+    Seek to the keyframe before a frame and decode forward from there.
 
     Args:
-        timestamp (float): The timestamp in microseconds.
+        input_container (av.container.input): The input container.
         video_stream (av.video.stream): The input video stream.
+        video_index (VideoIndex): The index of the input video.
+        start (int): The frame to seek to.
 
-    Returns:
-        int: The frame number.
+    Yields:
+        Tuple[int, av.VideoFrame]: The frame number and the decoded frame.
     """
-    return int(
-        round(
-            (timestamp - video_stream.start_time)
-            * float(video_stream.time_base)
-            * float(video_stream.average_rate)
-        )
+    input_container.seek(
+        video_index.keyframe_timestamp_before(start),
+        any_frame=False,
+        backward=True,
+        stream=video_stream,
     )
 
+    current_frame = None
+    for packet in input_container.demux(video_stream):
+        for frame in packet.decode():
+            if frame.pts is not None:
+                # Exact lookup, also correct for variable frame rate videos
+                current_frame = video_index.timestamp_to_frame(frame.pts)
+            elif current_frame is not None:
+                current_frame += 1
+            else:
+                continue
+            yield current_frame, frame
+
 
-def process_packet(  # pylint: disable=too-many-arguments
-    packet: av.packet,
-    current_frame: int | None,
-    start: int,
-    end: int,
-    video_stream: av.video.stream,
+def encode_frame(  # pylint: disable=too-many-arguments
+    frame: av.VideoFrame,
+    frame_number: int,
     output_container: av.container.output,
     output_stream: av.video.stream,
     predictions: Dict[int, List[Detection]] | None,
     annotator: Annotator,
-    pbar: tqdm,
-    notify_progress: Callable[[int], None] | None = None,
-) -> Tuple[int | None, bool]:
+) -> None:
     """
-    Process a packet of video frames, encode the frames,
-    and mux the resulting packets into an output container.
+    Annotate a frame, encode it and mux the resulting packets into the output container.
 
     Args:
-        packet (av.packet): The input packet of video frames.
-        current_frame (int | None): The current frame number.
-        start (int): The starting frame number for the segment.
-        end (int): The ending frame number for the segment.
-        video_stream (av.video.stream): The input video stream.
+        frame (av.VideoFrame): The decoded input frame.
+        frame_number (int): The frame number of the input frame.
         output_container (av.container.output): The output container.
         output_stream (av.video.stream): The output video stream.
         predictions (Dict[int, List[Detection]] | None): Optional detections for each frame.
-        pbar (tqdm): A progress bar to update.
-
-    Returns:
-        Tuple[int, bool]: The current frame number and a flag indicating
-                          whether processing should continue.
+        annotator (Annotator): The annotator used to draw the detections.
     """
-    for frame in packet.decode():
-        if current_frame is None:
-            current_frame = timestamp_to_frame(frame.pts, video_stream)
-            assert (
-                current_frame - start <= 0
-            ), f"Delta: {current_frame - start}, probably seeked past start frame"
-        else:
-            current_frame += 1
-
-        if current_frame > end:
-            return current_frame, False
-
-        if current_frame >= start:
-            frame_image = frame.to_ndarray(format="bgr24")
-
-            if predictions is not None:
-                frame_detections = predictions.get(current_frame, [])
-                frame_image = annotator.annotate(frame_image, frame_detections)
+    frame_image = frame.to_ndarray(format="bgr24")
 
-            output_frame = av.VideoFrame.from_ndarray(frame_image, format="bgr24")
+    if predictions is not None:
+        frame_detections = predictions.get(frame_number, [])
+        frame_image = annotator.annotate(frame_image, frame_detections)
 
-            packet = output_stream.encode(output_frame)
-            if packet is not None:
-                output_container.mux(packet)
-                pbar.update(1)
-                if notify_progress is not None:
-                    notify_progress(int((pbar.n / float(pbar.total)) * 100))
-
-    if current_frame is None:
-        return None, True
+    output_frame = av.VideoFrame.from_ndarray(frame_image, format="bgr24")
 
-    return int(current_frame), True
+    packet = output_stream.encode(output_frame)
+    if packet is not None:
+        output_container.mux(packet)
 
 
-def process_frame_ranges(  # pylint: disable=too-many-arguments
+def process_frame_ranges(  # pylint: disable=too-many-arguments,too-many-locals
     frame_ranges: List[Tuple[int, int]],
     input_container: av.container.input,
     video_stream: av.video.stream,
+    video_index: VideoIndex,
     output_container: av.container.output,
     output_stream: av.video.stream,
     predictions: Dict[int, List[Detection]] | None,
     annotator: Annotator,
     notify_progress: Callable[[int], None] | None = None,
-) -> None:
+    stop_event: threading.Event | None = None,
+) -> bool:
     """
-    Process a list of frame ranges, seek to the appropriate timestamps,
-    and process each packet of video frames.
+    Process a list of frame ranges, seeking only when it is cheaper than decoding
+    through the gap since the previous range.
 
     Args:
         frame_ranges (List[Tuple[int, int]]): A list of (start, end) frame ranges.
         input_container (av.container.input): The input container.
         video_stream (av.video.stream): The input video stream.
+        video_index (VideoIndex): The index of the input video, used to schedule seeks.
         output_container (av.container.output): The output container.
         output_stream (av.video.stream): The output video stream.
         predictions (Dict[int, List[Detection]] | None): Optional detections for each frame.
+        stop_event (threading.Event | None): Stops processing when set, checked for every frame.
+
+    Returns:
+        bool: True if all frame ranges were processed, False if stopped.
     """
+    schedule = schedule_frame_ranges(frame_ranges, video_index.keyframes)
+    logger.debug(
+        "Scheduled %s seeks for %s frame ranges",
+        sum(1 for scheduled in schedule if scheduled.seek),
+        len(schedule),
+    )
+
     with tqdm(
         total=sum(end - start + 1 for start, end in frame_ranges),
         desc="Processing frames",
     ) as pbar:
-        for start, end in frame_ranges:
-            timestamp = frame_to_timestamp(start, video_stream)
-            # Verify that the timestamp is correct
-            assert timestamp_to_frame(timestamp, video_stream) == start
-            input_container.seek(
-                int(timestamp), any_frame=False, backward=True, stream=video_stream
-            )
+        frames: Iterator[Tuple[int, av.VideoFrame]] | None = None
+        for scheduled in schedule:
+            if scheduled.seek or frames is None:
+                frames = decode_frames(
+                    input_container, video_stream, video_index, scheduled.start
+                )
 
-            current_frame = None
-            for packet in input_container.demux(video_stream):
-                current_frame, continue_processing = process_packet(
-                    packet,
-                    current_frame,
-                    start,
-                    end,
-                    video_stream,
+            # Keep consuming the same decoder when not seeking,
+            # skipping the frames in the gap since the previous range
+            first_frame = True
+            for frame_number, frame in frames:
+                if stop_event is not None and stop_event.is_set():
+                    logger.info("Stopping cutting at frame %s", frame_number)
+                    return False
+
+                if first_frame and scheduled.seek and frame_number > scheduled.start:
+                    logger.warning(
+                        "Seeked past start frame %s to %s",
+                        scheduled.start,
+                        frame_number,
+                    )
+                first_frame = False
+
+                if frame_number < scheduled.start:
+                    continue
+
+                encode_frame(
+                    frame,
+                    frame_number,
                     output_container,
                     output_stream,
                     predictions,
                     annotator,
-                    pbar,
-                    notify_progress,
                 )
-                if not continue_processing:
+                pbar.update(1)
+                if notify_progress is not None:
+                    notify_progress(int((pbar.n / float(pbar.total)) * 100))
+
+                if frame_number >= scheduled.end:
                     break
 
+    return True
 
-def cut_video(
+
+def cut_video(  # pylint: disable=too-many-arguments,too-many-locals
     input_path: Path,
     output_path: Path,
     frame_ranges: List[Tuple[int, int]],
     predictions: Dict[int, List[Detection]] | None = None,
     notify_progress: Callable[[int], None] | None = None,
-) -> None:
+    encoder_profile: EncoderProfile | None = None,
+    stop_event: threading.Event | None = None,
+    keep_partial: bool = False,
+    decoder_threads: int = 0,
+) -> bool:
     """
     Cut a video into segments specified by a list of frame ranges,
     and optionally annotate the frames with detections.
@@ -280,6 +281,15 @@ def cut_video(
         frame_ranges (List[Tuple[int, int]]): A list of (start, end) frame ranges.
         predictions (Dict[int, List[Detection]] | None, optional):
             A dictionary mapping frame numbers to lists of Detection objects. Defaults to None.
+        encoder_profile (EncoderProfile | None, optional):
+            The encoder profile to use. Defaults to the profile in the settings.
+        stop_event (threading.Event | None, optional):
+            Stops cutting when set. Defaults to None.
+        keep_partial (bool, optional):
+            Whether a stopped cut is finalized as a valid, truncated video instead of
+            being removed. Defaults to False.
+        decoder_threads (int, optional):
+            The number of decoding threads, 0 lets the decoder decide. Defaults to 0.
 
     Raises:
         FileNotFoundError: If the input file does not exist.
@@ -287,39 +297,58 @@ def cut_video(
                     or encoding/muxing the output file.
 
     Returns:
-        None
+        bool: True if the whole video was cut, False if stopped.
     """
+    video_index = load_video_index(input_path)
+
     input_container = av.open(str(input_path))
     video_stream = input_container.streams.video[0]
     video_stream.thread_type = "AUTO"
+    if decoder_threads > 0:
+        video_stream.thread_count = decoder_threads
+
+    if encoder_profile is None:
+        encoder_profile = get_encoder_profile(settings.encoder_profile)
 
     output_container = av.open(str(output_path), mode="w")
     fps = video_stream.average_rate.numerator / video_stream.average_rate.denominator
     output_stream = output_container.add_stream(
         "libx264",
         rate=Fraction(fps).limit_denominator(65535),
-        options={"crf": str(settings.video_crf)},
+        options=encoder_profile.options(settings.video_crf, fps),
     )
     output_stream.width = video_stream.codec_context.width
     output_stream.height = video_stream.codec_context.height
-    output_stream.pix_fmt = video_stream.codec_context.pix_fmt
+    # Not copied from the input, the decoder may output formats x264 can't encode
+    output_stream.pix_fmt = encoder_profile.pix_fmt
 
     annotator = Annotator((output_stream.width, output_stream.height))
 
-    process_frame_ranges(
-        frame_ranges,
-        input_container,
-        video_stream,
-        output_container,
-        output_stream,
-        predictions,
-        annotator,
-        notify_progress,
-    )
+    try:
+        completed = process_frame_ranges(
+            frame_ranges,
+            input_container,
+            video_stream,
+            video_index,
+            output_container,
+            output_stream,
+            predictions,
+            annotator,
+            notify_progress,
+            stop_event,
+        )
 
-    packet = output_stream.encode(None)
-    if packet is not None:
-        output_container.mux(packet)
+        if completed or keep_partial:
+            # Flush the encoder so the output is a valid video
+            packet = output_stream.encode(None)
+            if packet is not None:
+                output_container.mux(packet)
+    finally:
+        output_container.close()
+        input_container.close()
+
+    if not completed and not keep_partial:
+        logger.info("Removing partially cut video %s", output_path)
+        output_path.unlink(missing_ok=True)
 
-    output_container.close()
-    input_container.close()
+    return completed
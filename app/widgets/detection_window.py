@@ -4,12 +4,12 @@ import os
 import sys
 import threading
 import time
-from contextlib import redirect_stdout
+from contextlib import nullcontext, redirect_stdout
 from datetime import timedelta
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 
-import cv2
 import torch
 from PyQt6 import QtGui
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
@@ -27,13 +27,39 @@ from PyQt6.QtWidgets import (
 from app import settings
 from app.common import Common
 from app.data_manager.data_manager import DataManager
+from app.data_manager.database_writer import DatabaseWriter
+from app.data_manager.processing_manifest import ProcessingManifest
+from app.data_manager.video_summary import summarize_predictions
 from app.detection import detection
+from app.detection.autotune import DEFAULT_PARAMETERS, detection_parameters
 from app.detection.batch_yolov8 import BatchYolov8
+from app.detection.checkpoint import (
+    checkpoint_path,
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+)
+from app.detection.detection_cache import (
+    DetectionCacheKey,
+    detection_cache_key,
+    is_cached,
+    load_detections,
+    save_detections,
+)
+from app.detection.multi_stream import MultiStreamDetector
+from app.detection.planner import (
+    EtaEstimator,
+    check_disk_space,
+    format_bytes,
+    measured_throughput,
+    plan_videos,
+)
 from app.report_manager.report_manager import ReportManager
-from app.video_processor import Detection, video_processor
-
-# TODO: test all these file types
-ALLOWED_EXTENSIONS = (".mp4", ".m4a", ".avi", ".mkv", ".mov", ".wmv")
+from app.video_processor import Detection
+from app.video_processor.cut_pipeline import CutPipeline
+from app.video_processor.encoder_profiles import get_encoder_profile
+from app.video_processor.probe import probe_video
+from app.video_processor.scan import ScannedVideo, output_video_path, scan_videos
 
 
 class DetectionWorker(QThread):
@@ -61,6 +87,10 @@ class DetectionWorker(QThread):
         self.start_time = time.time()
         self.video_start_time = 0.0
         self.last_time_update = 0.0
+        self.eta: EtaEstimator | None = None
+        self.detection_parameters = DEFAULT_PARAMETERS
+        # Cut progress is only shown while no video is being detected
+        self.__detecting = False
 
     def stop(self) -> None:
         """Stop worker from processing more videos."""
@@ -90,7 +120,12 @@ class DetectionWorker(QThread):
         if self.input_folder_path is None:
             return
 
-        with DataManager() as data_manager:
+        with DataManager() as data_manager, DatabaseWriter(
+            data_manager,
+            on_error=lambda description, error: self.log(
+                f"Failed to save {description}: {error}"
+            ),
+        ) as database_writer:
             report_manager = ReportManager(
                 self.output_folder_path,
                 data_manager,
@@ -102,31 +137,104 @@ class DetectionWorker(QThread):
                 self.log("Please close the report file.")
                 return
 
-            videos = [
-                filename
-                for filename in os.listdir(self.input_folder_path)
-                if filename.lower().endswith(ALLOWED_EXTENSIONS)
-            ]
+            scanned_videos = list(
+                scan_videos(
+                    self.input_folder_path,
+                    Common.video_extensions,
+                    recursive=settings.recursive_scan,
+                )
+            )
+            # The report looks the videos up by id, the path they were added with
+            videos = [str(video.path) for video in scanned_videos]
 
             if len(videos) == 0:
                 self.log("No videos found in the input folder")
                 return
 
-            self.set_video_count.emit(len(videos))
-            self.update_overall_progress.emit(0)
+            manifest = ProcessingManifest(
+                data_manager,
+                self.output_folder_path,
+                Common.weights_folder / settings.weights,
+            )
+            if settings.skip_processed_videos:
+                scanned_videos = [
+                    video for video in scanned_videos if not manifest.is_current(video)
+                ]
+                skipped = len(videos) - len(scanned_videos)
+                if skipped > 0:
+                    self.log(f"Skipping {skipped} videos that are already processed")
+
+            # Probe the videos up front, for an ETA based on their frame counts
+            plan = plan_videos(
+                scanned_videos,
+                measured_throughput(data_manager),
+                overlapped=settings.cut_look_ahead > 0,
+            )
+            self.log(
+                f"{plan.frame_count} frames to process, estimated time "
+                f"{timedelta(seconds=round(plan.seconds))}, estimated output size "
+                f"{format_bytes(plan.output_bytes)}"
+            )
+            if not check_disk_space(plan, self.output_folder_path):
+                self.log("The output folder may run out of disk space")
+
+            if self.model is not None and len(scanned_videos) > 0:
+                if settings.batch_size <= 0:
+                    self.log("Tuning the batch size on the first video...")
+                self.detection_parameters = detection_parameters(
+                    self.model, scanned_videos[0].path
+                )
+                self.log(
+                    f"Using a batch size of {self.detection_parameters.batch_size}"
+                )
+            self.eta = EtaEstimator(plan)
 
-            for i, video in enumerate(videos):
-                self.log(f"Processing {i + 1}/{len(videos)} ({video})")
-                video_path = self.input_folder_path / video
-                if not self.process_video(i, len(videos), video_path, data_manager):
-                    break
-                data_manager.add_video_data(video_path, video, self.output_folder_path)
+            # Videos with cached detections or a checkpoint aren't streamed, so no
+            # batches are spent on them
+            cache_keys = {
+                video.path: self.__cache_key(video.path) for video in scanned_videos
+            }
 
-                # Delete the original video if the user has selected to do so
-                if not settings.keep_original:
-                    video_path.unlink()
+            self.set_video_count.emit(len(scanned_videos))
+            self.update_overall_progress.emit(0)
 
-                self.update_overall_progress.emit(i + 1)
+            # Cuts run in a worker process while the next video is detected
+            with CutPipeline(
+                self.stop_event,
+                max_pending=settings.cut_look_ahead,
+                on_error=lambda video_path, error: self.log(
+                    f"Failed to cut {video_path.name}: {error}"
+                ),
+            ) as cut_pipeline, self.__multi_stream_detector(
+                [
+                    video.path
+                    for video in scanned_videos
+                    if self.__detects_from_start(cache_keys[video.path])
+                ]
+            ) as detector:
+                for i, scanned_video in enumerate(scanned_videos):
+                    video = scanned_video.path.name
+                    self.log(f"Processing {i + 1}/{len(scanned_videos)} ({video})")
+                    if not self.process_video(
+                        i,
+                        len(scanned_videos),
+                        scanned_video.path,
+                        database_writer,
+                        cut_pipeline,
+                        detector,
+                        cache_keys[scanned_video.path],
+                        partial(
+                            self.__finish_video,
+                            i,
+                            scanned_video,
+                            manifest,
+                            database_writer,
+                        ),
+                    ):
+                        break
+
+            # The report reads everything written so far
+            database_writer.flush()
 
             if settings.get_report:
                 try:
@@ -134,73 +242,123 @@ class DetectionWorker(QThread):
                 except PermissionError:
                     self.log("Could not write report. Please close the report file.")
 
+    def __set_confidence_threshold(self) -> Tuple[float, bool]:
+        """Sets the threshold of the model, down to the confidence floor if it is recorded
+
+        Returns:
+            Tuple[float, bool]: the threshold of the kept detections, and whether the
+                                model detects below it
+        """
+        assert self.model is not None
+        threshold = settings.prediction_threshold / 100
+        record_floor = 0 < settings.confidence_floor < settings.prediction_threshold
+        self.model.conf_thres = (
+            settings.confidence_floor / 100 if record_floor else threshold
+        )
+        return threshold, record_floor
+
+    def __cache_key(self, video_path: Path) -> DetectionCacheKey | None:
+        """The cache key of the detections of a video, None if neither the cache nor
+        checkpoints are enabled"""
+        if self.model is None or (
+            settings.detection_cache_mb <= 0 and settings.checkpoint_seconds <= 0
+        ):
+            return None
+        # The key includes the threshold the model detects at
+        self.__set_confidence_threshold()
+        return detection_cache_key(self.model, video_path)
+
+    def __detects_from_start(self, cache_key: DetectionCacheKey | None) -> bool:
+        """Checks if a video has neither cached detections nor a checkpoint"""
+        if cache_key is None:
+            return True
+        if settings.detection_cache_mb > 0 and is_cached(cache_key):
+            return False
+        return not (
+            settings.checkpoint_seconds > 0 and checkpoint_path(cache_key).exists()
+        )
+
+    def __multi_stream_detector(
+        self, video_paths: List[Path]
+    ) -> MultiStreamDetector | nullcontext[None]:
+        """Detects in several videos at once if enabled, otherwise one at a time"""
+        if self.model is None or settings.multi_stream_videos <= 1:
+            return nullcontext()
+        return MultiStreamDetector(
+            self.model,
+            video_paths,
+            self.detection_parameters.batch_size,
+            self.stop_event,
+            max_streams=settings.multi_stream_videos,
+            # The tuned threads are shared by the open videos
+            grabber_workers=self.detection_parameters.grabber_workers
+            // settings.multi_stream_videos,
+            queue_depth=self.detection_parameters.queue_depth,
+        )
+
+    def __finish_video(
+        self,
+        video_num: int,
+        scanned_video: ScannedVideo,
+        manifest: ProcessingManifest,
+        database_writer: DatabaseWriter,
+    ) -> None:
+        """Records a video whose outputs are complete, called in video order."""
+        video_path = scanned_video.path
+        out_path = self.__output_path(video_path)
+        output_video = out_path if out_path.exists() else None
+        database_writer.add_video_data(video_path, video_path.name, output_video)
+        database_writer.add_processed_video(manifest.row(scanned_video, output_video))
+
+        # Delete the original video if the user has selected to do so
+        if not settings.keep_original:
+            video_path.unlink()
+
+        self.update_overall_progress.emit(video_num + 1)
+
+    def __output_path(self, video_path: Path) -> Path:
+        """The path of the cut video, in the subfolder matching that of the video"""
+        return output_video_path(
+            video_path, self.input_folder_path, self.output_folder_path
+        )
+
     def tensors_to_predictions(
         self, tensors: List[torch.Tensor]
     ) -> Dict[int, List[Detection]]:
         """Convert the tensors to a dictionary of frame number to detections."""
-        detections: Dict[int, List[Detection]] = {}
-        for frame, tensor in enumerate(tensors):
-            # annotator.text((32, 32), text, txt_color=(0, 255, 255))
-            detections[frame] = []
-            for pred in tensor:
-                bndbox = pred["bndbox"]
-                detections[frame].append(
-                    Detection(
-                        label=str(pred["name"]),
-                        confidence=float(pred["conf"]),
-                        xmin=int(bndbox["xmin"]),
-                        ymin=int(bndbox["ymin"]),
-                        xmax=int(bndbox["xmax"]),
-                        ymax=int(bndbox["ymax"]),
-                    )
-                )
-        return detections
+        return detection.predictions_to_detections(tensors)
 
     def __add_buffer_to_ranges(
         self, frame_ranges: List[Tuple[int, int]], video_path: Path
     ) -> List[Tuple[int, int]]:
         """Add buffer time before and after each frame range and merge overlapping ranges"""
 
-        cap = cv2.VideoCapture(str(video_path))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        video_length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        # Add buffer time to each frame range
-        frame_ranges_with_buffer = [
-            (
-                max(0, start_frame - int(fps * settings.buffer_before)),
-                min(video_length, end_frame + int(fps * settings.buffer_after)),
-            )
-            for (start_frame, end_frame) in frame_ranges
-        ]
-
-        # Merge overlapping frame ranges
-        merged_ranges: List[Tuple[int, int]] = []
-        for start_frame, end_frame in frame_ranges_with_buffer:
-            if not merged_ranges or start_frame > merged_ranges[-1][1]:
-                merged_ranges.append((start_frame, end_frame))
-            else:
-                merged_ranges[-1] = (
-                    merged_ranges[-1][0],
-                    max(merged_ranges[-1][1], end_frame),
-                )
-
-        return merged_ranges
-
-    def get_fps(self, video_path: Path) -> float:
-        """Get the FPS of a video."""
-        cap = cv2.VideoCapture(str(video_path))
-        return float(cap.get(cv2.CAP_PROP_FPS))
+        video_info = probe_video(video_path)
+        return detection.add_buffer_to_ranges(
+            frame_ranges,
+            video_info.fps,
+            video_info.frame_count,
+            settings.buffer_before,
+            settings.buffer_after,
+        )
 
     def process_video(
         self,
         video_num: int,
         num_videos: int,
         video_path: Path,
-        data_manager: DataManager,
+        database_writer: DatabaseWriter,
+        cut_pipeline: CutPipeline,
+        detector: MultiStreamDetector | None,
+        cache_key: DetectionCacheKey | None,
+        on_finished: Callable[[], None],
     ) -> bool:
         """
-        Process a video and save the processed video to the same folder as the original video.
+        Detect in a video and submit it to the cut pipeline, which saves the processed
+        video to the output folder. on_finished is called once the video is cut and its
+        detections are saved, in video order. If the video was given to the multi
+        stream detector, it shares batches with the next videos. cache_key is the key
+        of its cached detections and checkpoint, None if neither is enabled.
 
         Returns True if we should continue processing videos, False if we should stop.
         """
@@ -210,31 +368,109 @@ class DetectionWorker(QThread):
 
         # self.add_text.emit(f"Processing {video_path}")
 
-        # Update threshold
-        self.model.conf_thres = settings.prediction_threshold / 100
+        threshold, record_floor = self.__set_confidence_threshold()
 
         self.update_task_progress.emit(0)
         self.update_task_format.emit("Performing detection: %p%")
 
         self.video_start_time = time.time()
+        self.__detecting = True
 
         def detection_notify_progress(progress: int) -> None:
             self.update_task_progress.emit(progress)
-            self.update_time_prediction(int(progress / 2), video_num, num_videos)
-
-        frames_with_fish, tensors = detection.process_video(
-            model=self.model,
-            video_path=video_path,
-            batch_size=settings.batch_size,
-            max_batches_to_queue=4,
-            output_path=None,
-            stop_event=self.stop_event,
-            notify_progress=detection_notify_progress,
-        )
+            # Detection is the whole video when cutting overlaps the next video
+            self.update_time_prediction(
+                progress if cut_pipeline.max_pending > 0 else int(progress / 2),
+                video_num,
+                num_videos,
+            )
+            # Finish the videos cut in the background meanwhile
+            cut_pipeline.poll()
+
+        tensors = None
+        if cache_key is not None and settings.detection_cache_mb > 0:
+            tensors = load_detections(cache_key, self.model.names, self.model.colors)
+
+        detection_fps = None
+        detection_seconds = None
+        if tensors is not None:
+            if detector is not None:
+                detector.discard(video_path)
+            self.log("Using cached detections")
+            frames_with_fish = detection.frames_with_detections(tensors)
+            self.update_task_progress.emit(100)
+        else:
+            checkpoint = None
+            resume_tensors = None
+            on_checkpoint = None
+            if cache_key is not None and settings.checkpoint_seconds > 0:
+                checkpoint = checkpoint_path(cache_key)
+                resume_tensors = load_checkpoint(
+                    checkpoint, self.model.names, self.model.colors
+                )
+                if resume_tensors is not None:
+                    self.log(f"Resuming from frame {len(resume_tensors)}")
+                on_checkpoint = partial(save_checkpoint, checkpoint)
+
+            detection_start_time = time.time()
+            if (
+                detector is not None
+                and resume_tensors is None
+                and video_path in detector
+            ):
+                streamed_tensors = detector.detect(
+                    video_path,
+                    notify_progress=detection_notify_progress,
+                    on_checkpoint=on_checkpoint,
+                    checkpoint_seconds=settings.checkpoint_seconds,
+                )
+                if streamed_tensors is None:
+                    return False
+                tensors = streamed_tensors
+                frames_with_fish = detection.frames_with_detections(tensors)
+                # Frames of this video were detected along with the previous videos
+                detection_fps = detector.fps
+                if detection_fps is not None:
+                    detection_seconds = len(tensors) / detection_fps
+            else:
+                if detector is not None:
+                    detector.discard(video_path)
+                frames_with_fish, tensors = detection.process_video(
+                    model=self.model,
+                    video_path=video_path,
+                    batch_size=self.detection_parameters.batch_size,
+                    max_batches_to_queue=4,
+                    output_path=None,
+                    stop_event=self.stop_event,
+                    notify_progress=detection_notify_progress,
+                    resume_predictions=resume_tensors,
+                    on_checkpoint=on_checkpoint,
+                    checkpoint_seconds=settings.checkpoint_seconds,
+                    grabber_workers=self.detection_parameters.grabber_workers,
+                    queue_depth=self.detection_parameters.queue_depth,
+                )
 
-        # If the stop event is set, stop processing and return
-        if self.stop_event.is_set():
-            return False
+                # If the stop event is set, stop processing and return
+                if self.stop_event.is_set():
+                    return False
+
+                # Only the frames detected in this run count towards the detection speed
+                detected_frames = len(tensors) - len(resume_tensors or [])
+                detection_fps = detected_frames / max(
+                    time.time() - detection_start_time, 1e-6
+                )
+                if resume_tensors is None:
+                    detection_seconds = time.time() - detection_start_time
+            if cache_key is not None and settings.detection_cache_mb > 0:
+                save_detections(cache_key, tensors)
+            if checkpoint is not None:
+                remove_checkpoint(checkpoint)
+
+        self.__detecting = False
+
+        if record_floor:
+            tensors = detection.filter_predictions(tensors, threshold)
+            frames_with_fish = detection.frames_with_detections(tensors)
 
         print(f"Found {len(frames_with_fish)} frames with fish")
 
@@ -243,51 +479,100 @@ class DetectionWorker(QThread):
         # Convert the detected frames to frame ranges to cut the video
         frame_ranges = detection.detected_frames_to_ranges(
             frames_with_fish,
-            frame_buffer=int(self.get_fps(video_path) * settings.frame_buffer_seconds),
+            frame_buffer=int(
+                probe_video(video_path).fps * settings.frame_buffer_seconds
+            ),
         )
         print(f"Found {len(frame_ranges)} frame ranges with fish")
         self.add_log.emit(f"Found {len(frame_ranges)} frame ranges with fish")
 
         frame_ranges = self.__add_buffer_to_ranges(frame_ranges, video_path)
 
+        statistics = summarize_predictions(
+            tensors, time.time() - self.video_start_time, detection_seconds
+        )
+
         if len(frame_ranges) == 0:
             print("No fish detected, skipping video")
+
+            # Still summarized, so the report shows the video was processed
+            def on_nothing_detected(_: bool) -> None:
+                database_writer.add_detection_data(video_path, [], statistics)
+                on_finished()
+
+            cut_pipeline.submit(video_path, None, [], None, None, on_nothing_detected)
             return True
 
-        vid_path = Path(video_path)
-        out_path = self.output_folder_path / f"{vid_path.stem}_processed.mp4"
+        out_path = self.__output_path(video_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
 
         dets = None
         if settings.box_around_fish:
             dets = self.tensors_to_predictions(tensors)
 
-        self.update_task_progress.emit(0)
-        self.update_task_format.emit("Cutting video: %p%")
+        encoder_profile = get_encoder_profile(
+            settings.encoder_profile, video_path, detection_fps
+        )
+
+        class_names = (
+            self.model.names
+            if isinstance(self.model.names, dict)
+            else dict(enumerate(self.model.names))
+        )
 
         def cut_notify_progress(progress: int) -> None:
-            self.update_task_progress.emit(progress)
-            self.update_time_prediction(int(progress / 2) + 50, video_num, num_videos)
+            if cut_pipeline.max_pending == 0:
+                self.update_task_progress.emit(progress)
+                self.update_time_prediction(
+                    int(progress / 2) + 50, video_num, num_videos
+                )
+            elif not self.__detecting:
+                # Waiting for the background cut, after the last video or when the
+                # next video can't be submitted yet
+                self.update_task_format.emit(f"Cutting {video_path.name}: %p%")
+                self.update_task_progress.emit(progress)
+
+        # Narrowing doesn't carry into the closure
+        predictions: List[Any] = tensors
+
+        def on_cut(completed: bool) -> None:
+            if not completed:
+                self.log("Stopped cutting, removed the partially processed video")
+                return
+
+            self.log(f"Saved processed video to {out_path}")
+            database_writer.add_detection_data(video_path, frame_ranges, statistics)
+            if settings.store_frame_detections:
+                video_info = probe_video(video_path)
+                database_writer.add_frame_detections(
+                    video_path,
+                    frame_ranges,
+                    predictions,
+                    (video_info.width, video_info.height),
+                    class_names,
+                )
+            on_finished()
+
+        if cut_pipeline.max_pending == 0:
+            self.update_task_progress.emit(0)
+            self.update_task_format.emit("Cutting video: %p%")
 
         # Cut the video to the detected frames
-        # TODO: implement the stop event for this function too
-        video_processor.cut_video(
+        cut_pipeline.submit(
             video_path,
             out_path,
             frame_ranges,
             dets,
+            encoder_profile,
+            on_cut,
             notify_progress=cut_notify_progress,
         )
+
         # Just show percentage at this point
         self.update_task_format.emit("%p%")
-
-        self.log(f"Saved processed video to {out_path}")
-
-        # It will get set to 100 in cut_video, but we aren't actually done
-        self.update_task_progress.emit(99)
-        data_manager.add_detection_data(video_path, frame_ranges)
         self.update_task_progress.emit(100)
 
-        return True
+        return not self.stop_event.is_set()
 
     def update_time_prediction(
         self, progress: int, video_num: int, num_videos: int
@@ -295,7 +580,7 @@ class DetectionWorker(QThread):
         """Update the time prediction label.
 
         Args:
-            progress: The progress of the current task.
+            progress: The progress of the current video.
             video_num: The number of the current video.
             num_videos: The total number of videos.
         """
@@ -305,6 +590,12 @@ class DetectionWorker(QThread):
             return
         self.last_time_update = current_time
 
+        if self.eta is not None and self.eta.plan.seconds > 0:
+            time_left = self.eta.seconds_left(video_num, progress / 100)
+            time_left_str = str(timedelta(seconds=int(time_left)))
+            self.update_time_prediction_sig.emit(f"Total Time Left: {time_left_str}")
+            return
+
         total_elapsed_time = current_time - self.start_time
         video_elapsed_time = current_time - self.video_start_time
 
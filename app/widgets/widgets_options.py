@@ -343,6 +343,7 @@ class AdvancedOptions(QWidget):
         self.layout_r2.addWidget(self.__create_max_detections_spinbox())
 
         self.layout_r3.addWidget(self.__create_crf_slider())
+        self.layout_r3.addWidget(self.__create_encoder_profile_dropdown())
 
         self.layout_r4.addWidget(self.__create_weights_dropdown())
 
@@ -368,13 +369,19 @@ class AdvancedOptions(QWidget):
         batch_size_dd = DropDownWidget(
             "Batch Size",
             Common.batch_size,
-            "NB! Only for experienced users! \nThis is how many images are processed at once.",
+            "NB! Only for experienced users! \nThis is how many images are processed at once."
+            "\nAuto measures the fastest batch size on the first video.",
         )
 
-        batch_size_dd.set_index(Common.batch_size.index(str(settings.batch_size)))
+        batch_size_dd.set_index(
+            0
+            if settings.batch_size <= 0
+            else Common.batch_size.index(str(settings.batch_size))
+        )
 
         def on_batch_size_changed(index: int) -> None:
-            settings.batch_size = int(Common.batch_size[index])
+            value = Common.batch_size[index]
+            settings.batch_size = int(value) if value.isdigit() else 0
 
         batch_size_dd.connect(on_batch_size_changed)
         return batch_size_dd
@@ -438,6 +445,30 @@ The available range is 0–51 (0 is lossless, 51 is worst quality possible, defa
         crf_slider.connect(on_crf_slider_changed)
         return crf_slider
 
+    def __create_encoder_profile_dropdown(self) -> DropDownWidget:
+        encoder_profile_dd = DropDownWidget(
+            "Encoder Profile",
+            Common.encoder_profiles,
+            """The encoder settings used for the processed videos.
+archive: smallest files, slowest to encode.
+review: quick to scrub through when reviewing detections.
+fast: fastest to encode, largest files.
+auto: picks the best quality that keeps up with detection on this machine.""",
+            fit_content=True,
+        )
+
+        try:
+            profile_index = Common.encoder_profiles.index(settings.encoder_profile)
+        except ValueError:
+            profile_index = Common.encoder_profiles.index("review")
+        encoder_profile_dd.set_index(profile_index)
+
+        def on_encoder_profile_changed(index: int) -> None:
+            settings.encoder_profile = Common.encoder_profiles[index]
+
+        encoder_profile_dd.connect(on_encoder_profile_changed)
+        return encoder_profile_dd
+
     def __create_max_detections_spinbox(self) -> SpinBox:
         max_detections_spinbox = SpinBox(
             "Max Detections",
@@ -0,0 +1,103 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import time
+from fractions import Fraction
+
+import av
+import numpy as np
+import pytest
+import torch
+
+CLASS_NAMES = ["pike", "perch", "roach", "zander"]
+CLASS_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+
+
+class FakeModel:
+    """Stands in for BatchYolov8. Each frame is prepared as its mean pixel value and
+    predicted as that value, and the batch sizes are recorded."""
+
+    def __init__(self, weights_path=None, batch_seconds=0.0, frame_seconds=0.0):
+        self.device = torch.device("cpu")
+        self.weights_path = weights_path
+        self.batch_seconds = batch_seconds
+        self.frame_seconds = frame_seconds
+        self.batch_sizes = []
+
+    def prepare_images(self, images):
+        return torch.tensor([float(image.mean()) for image in images])
+
+    def predict_batch(self, img0s, imgs, max_detections=300):
+        assert len(img0s) == len(imgs)
+        self.batch_sizes.append(len(imgs))
+        if self.batch_seconds > 0 or self.frame_seconds > 0:
+            time.sleep(self.batch_seconds + self.frame_seconds * len(imgs))
+        return [[float(img)] for img in imgs]
+
+
+@pytest.fixture
+def class_names():
+    """The class names of the fake predictions, by class id."""
+    return list(CLASS_NAMES)
+
+
+@pytest.fixture
+def class_colors():
+    """The box colors of the fake predictions, by class id."""
+    return list(CLASS_COLORS)
+
+
+@pytest.fixture
+def make_model():
+    """Creates a FakeModel."""
+    return FakeModel
+
+
+@pytest.fixture
+def make_prediction():
+    """Creates a prediction in the format of BatchYolov8.predict_batch."""
+
+    def make(class_id, conf, xmin=1, ymin=2, xmax=11, ymax=22):
+        return {
+            "bndbox": {
+                "xmin": xmin,
+                "xmax": xmax,
+                "ymin": ymin,
+                "ymax": ymax,
+                "width": xmax - xmin,
+                "height": ymax - ymin,
+            },
+            "name": CLASS_NAMES[class_id],
+            "class_id": class_id,
+            "conf": conf,
+            "color": CLASS_COLORS[class_id],
+        }
+
+    return make
+
+
+@pytest.fixture
+def make_video():
+    """Writes a 25 FPS, 64x48 video where the value of each pixel is the frame number
+    plus an offset."""
+
+    def make(path, frame_count, offset=0):
+        with av.open(str(path), "w") as container:
+            stream = container.add_stream("libx264", rate=Fraction(25))
+            stream.width = 64
+            stream.height = 48
+            stream.pix_fmt = "yuv420p"
+            for i in range(frame_count):
+                frame = av.VideoFrame.from_ndarray(
+                    np.full((48, 64, 3), offset + i, dtype=np.uint8), format="rgb24"
+                )
+                container.mux(stream.encode(frame))
+            container.mux(stream.encode(None))
+        return path
+
+    return make
+
+
+@pytest.fixture
+def video_path(tmp_path, make_video):
+    """A 2 second, 25 FPS video where the value of each pixel is the frame number."""
+    return make_video(tmp_path / "video.mp4", 50)
@@ -0,0 +1,72 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import pytest
+
+from app import settings
+from app.detection import autotune
+from app.detection.autotune import DetectionParameters
+from app.detection.autotune import autotune as autotune_detection
+from app.detection.autotune import detection_parameters, measure, tune
+
+
+@pytest.fixture
+def model(tmp_path, make_model):
+    weights_path = tmp_path / "weights.pt"
+    weights_path.write_bytes(b"weights")
+    # A fixed time per batch, so larger batches detect more frames per second
+    return make_model(weights_path, batch_seconds=0.02, frame_seconds=0.001)
+
+
+@pytest.fixture
+def long_video_path(tmp_path, make_video):
+    return make_video(tmp_path / "long.mp4", 200)
+
+
+def test_measure_counts_frames_after_warm_up(model, video_path):
+    # Act
+    measurement = measure(
+        model, video_path, DetectionParameters(8, 1, 2), sample_frames=16
+    )
+
+    # Assert
+    assert measurement.fps > 0
+    # 5 batches of 64x48 BGR frames and one float per prepared image
+    assert measurement.memory_bytes == 5 * 8 * (64 * 48 * 3 + 4)
+
+
+def test_tune_picks_fastest_batch_size_within_memory(model, long_video_path):
+    # Act
+    unlimited = tune(model, long_video_path, 2**40, sample_seconds=2)
+    limited = tune(model, long_video_path, 1_000_000, sample_seconds=2)
+
+    # Assert
+    assert unlimited.batch_size == 64
+    assert unlimited.fps > 0
+    assert limited.batch_size == 16
+
+
+def test_autotune_is_cached(model, video_path, tmp_path, monkeypatch):
+    # Arrange
+    cache_folder = tmp_path / "cache"
+    tuned = DetectionParameters(16, 2, 4, 100.0)
+    monkeypatch.setattr(autotune, "tune", lambda *args: tuned)
+    autotune_detection(model, video_path, cache_folder)
+
+    # Act
+    monkeypatch.setattr(autotune, "tune", lambda *args: pytest.fail("Tuned again"))
+    cached = autotune_detection(model, video_path, cache_folder)
+
+    # Assert
+    assert cached == tuned
+
+
+def test_fixed_batch_size_is_not_tuned(model, video_path, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(settings, "batch_size", 32)
+    monkeypatch.setattr(autotune, "tune", lambda *args: pytest.fail("Tuned"))
+
+    # Act
+    parameters = detection_parameters(model, video_path)
+
+    # Assert
+    assert parameters == DetectionParameters(32)
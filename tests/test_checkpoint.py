@@ -0,0 +1,62 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from app.detection.checkpoint import load_checkpoint, remove_checkpoint, save_checkpoint
+from app.detection.frame_grabber import ThreadedFrameGrabber
+
+
+def read_frames(model, video_path, start_frame):
+    frames = []
+    with ThreadedFrameGrabber(
+        batch_size=4, model=model, video_path=video_path, start_frame=start_frame
+    ) as frame_grabber:
+        while not frame_grabber.is_done():
+            batch = frame_grabber.get_batch()
+            if batch is not None:
+                frames.extend(batch[1])
+    return frames
+
+
+def test_checkpoint_round_trip(tmp_path, make_prediction, class_names, class_colors):
+    # Arrange
+    path = tmp_path / "checkpoint.npz"
+    predictions = [[], [make_prediction(1, 0.75)], [], [make_prediction(0, 0.5)]]
+
+    # Act
+    save_checkpoint(path, predictions)
+    loaded = load_checkpoint(path, class_names, class_colors)
+
+    # Assert
+    assert loaded == predictions
+
+
+def test_checkpoint_missing_and_removed(tmp_path, class_names, class_colors):
+    # Arrange
+    path = tmp_path / "checkpoint.npz"
+    save_checkpoint(path, [[]])
+
+    # Act
+    remove_checkpoint(path)
+
+    # Assert
+    assert load_checkpoint(path, class_names, class_colors) is None
+    remove_checkpoint(path)
+
+
+def test_frame_grabber_resumes_at_start_frame(video_path, make_model):
+    # Arrange
+    all_frames = read_frames(make_model(), video_path, start_frame=0)
+
+    # Act
+    frames = read_frames(make_model(), video_path, start_frame=23)
+
+    # Assert
+    assert len(frames) == 50 - 23
+    assert all((a == b).all() for a, b in zip(frames, all_frames[23:]))
+
+
+def test_frame_grabber_start_frame_past_end(video_path, make_model):
+    # Act
+    frames = read_frames(make_model(), video_path, start_frame=80)
+
+    # Assert
+    assert frames == []
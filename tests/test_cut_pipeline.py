@@ -0,0 +1,84 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import threading
+
+import pytest
+
+from app.video_processor.cut_pipeline import CutPipeline
+from app.video_processor.probe import probe_video
+
+
+@pytest.mark.parametrize("max_pending", [0, 1])
+def test_cuts_finish_in_submission_order(video_path, tmp_path, max_pending):
+    # Arrange
+    finished = []
+    progress = []
+    outputs = [tmp_path / "first.mp4", None, tmp_path / "third.mp4"]
+    ranges = [[(0, 9)], [], [(10, 19), (30, 34)]]
+
+    # Act
+    with CutPipeline(threading.Event(), max_pending=max_pending) as cut_pipeline:
+        for i, (output_path, frame_ranges) in enumerate(zip(outputs, ranges)):
+            cut_pipeline.submit(
+                video_path,
+                output_path,
+                frame_ranges,
+                None,
+                None,
+                lambda completed, i=i: finished.append((i, completed)),
+                notify_progress=lambda value, i=i: progress.append((i, value)),
+            )
+
+    # Assert
+    assert finished == [(0, True), (1, True), (2, True)]
+    assert probe_video(outputs[0]).frame_count == 10
+    assert probe_video(outputs[2]).frame_count == 15
+    assert (2, 100) in progress
+    assert all(value <= 100 for _, value in progress)
+
+
+def test_stopped_cut_is_not_completed(video_path, tmp_path):
+    # Arrange
+    stop_event = threading.Event()
+    stop_event.set()
+    finished = []
+
+    # Act
+    with CutPipeline(stop_event, max_pending=1) as cut_pipeline:
+        cut_pipeline.submit(
+            video_path, tmp_path / "out.mp4", [(0, 49)], None, None, finished.append
+        )
+
+    # Assert
+    assert finished == [False]
+    assert not (tmp_path / "out.mp4").exists()
+
+
+@pytest.mark.parametrize("max_pending", [0, 1])
+def test_failed_cut_is_reported_and_later_cuts_finish(
+    video_path, tmp_path, max_pending
+):
+    # Arrange
+    finished = []
+    errors = []
+    missing_path = tmp_path / "missing.mp4"
+
+    # Act
+    with CutPipeline(
+        threading.Event(),
+        max_pending=max_pending,
+        on_error=lambda path, error: errors.append(path),
+    ) as cut_pipeline:
+        for input_path in (missing_path, video_path):
+            cut_pipeline.submit(
+                input_path,
+                tmp_path / f"{input_path.stem}_out.mp4",
+                [(0, 9)],
+                None,
+                None,
+                lambda completed, path=input_path: finished.append(path),
+            )
+
+    # Assert
+    assert errors == [missing_path]
+    assert finished == [video_path]
@@ -0,0 +1,201 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import sqlite3
+import threading
+
+import pytest
+
+from app.data_manager.data_manager import MIGRATIONS_PATH, DataManager
+from app.data_manager.report_queries import ReportQueries
+from app.data_manager.video_summary import summarize_predictions
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        yield data_manager
+
+
+def test_wal_mode(data_manager):
+    journal_mode = data_manager.sqlite_connection.execute(
+        "PRAGMA journal_mode"
+    ).fetchone()[0]
+
+    assert journal_mode == "wal"
+
+
+def test_indexes_exist(data_manager):
+    indexes = {
+        row[0]
+        for row in data_manager.sqlite_connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'"
+        )
+    }
+
+    assert "detection_videoid_index" in indexes
+    assert "video_title_index" in indexes
+
+
+def test_add_and_get_data(data_manager, video_path):
+    # Act
+    data_manager.add_video_data(video_path, video_path.name, None)
+    data_manager.add_detection_data(video_path, [(0, 25), (30, 40)])
+
+    # Assert
+    (video,) = ReportQueries(data_manager).get_video_data([str(video_path)])
+    assert video[0] == video_path.name
+    # The processed video doesn't exist
+    assert video[2:] == ("0:00:02", "0:00:00")
+    assert [
+        row[2:] for row in ReportQueries(data_manager).get_data([str(video_path)])
+    ] == [
+        ("0:00:00", "0:00:01"),
+        ("0:00:01.200000", "0:00:01.600000"),
+    ]
+
+
+def test_detections_added_before_their_video(data_manager, video_path, tmp_path):
+    # Arrange
+    output_video = tmp_path / f"{video_path.stem}_processed.mp4"
+    output_video.write_bytes(video_path.read_bytes())
+
+    # Act
+    data_manager.add_detection_data(video_path, [(0, 25)])
+    data_manager.add_video_data(video_path, video_path.name, output_video)
+
+    # Assert
+    assert [
+        row[2:] for row in ReportQueries(data_manager).get_data([str(video_path)])
+    ] == [("0:00:00", "0:00:01")]
+    (video,) = ReportQueries(data_manager).get_video_data([str(video_path)])
+    assert video[2:] == ("0:00:02", "0:00:02")
+
+
+def test_add_detection_data_replaces_previous(data_manager, video_path):
+    # Arrange
+    data_manager.add_video_data(video_path, video_path.name, None)
+    data_manager.add_detection_data(video_path, [(0, 25), (30, 40)])
+
+    # Act
+    data_manager.add_detection_data(video_path, [(5, 10)])
+
+    # Assert
+    assert len(ReportQueries(data_manager).get_data([str(video_path)])) == 1
+
+
+def test_summary_is_updated_with_detections(data_manager, video_path):
+    # Arrange
+    predictions = [[] for _ in range(50)]
+    predictions[3] = [{"name": "pike", "conf": 0.9}, {"name": "perch", "conf": 0.4}]
+    predictions[4] = [{"name": "pike", "conf": 0.7}]
+    data_manager.add_video_data(video_path, video_path.name, None)
+    data_manager.add_detection_data(
+        video_path, [(0, 25), (30, 40)], summarize_predictions(predictions, 2.0)
+    )
+
+    # Act
+    data_manager.add_detection_data(video_path, [(5, 10)])
+
+    # Assert
+    (summary,) = ReportQueries(data_manager).get_video_summaries([str(video_path)])
+    assert summary[0] == video_path.name
+    assert summary[4:] == (1, "0:00:00.200000", "pike: 2, perch: 1", "0.90", "25.0")
+
+
+def test_titles_are_not_interpolated_into_queries(data_manager):
+    assert ReportQueries(data_manager).get_data(["' OR '1'='1"]) == []
+    assert data_manager.video_check("' OR '1'='1")
+
+
+def test_transaction_rolls_back_on_error(data_manager):
+    # Act
+    with pytest.raises(RuntimeError):
+        with data_manager.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO video VALUES ('id', 'title', '', '2023-01-01', 0, 25, 0, 0)"
+            )
+            raise RuntimeError()
+
+    # Assert
+    assert data_manager.video_check("id")
+
+
+def test_concurrent_writes_from_threads(data_manager):
+    # Arrange
+    errors = []
+
+    def write(thread_index):
+        try:
+            for i in range(20):
+                with data_manager.transaction() as cursor:
+                    cursor.execute(
+                        "INSERT INTO video VALUES (?, ?, '', '2023-01-01', 0, 25, 0, 0)",
+                        (f"{thread_index}-{i}", f"{thread_index}-{i}"),
+                    )
+                ReportQueries(data_manager).get_video_data([f"{thread_index}-{i}"])
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+
+    # Act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    assert errors == []
+    count = data_manager.sqlite_connection.execute(
+        "SELECT COUNT(*) FROM video"
+    ).fetchone()[0]
+    assert count == 80
+
+
+def test_migrates_string_times_to_numeric(tmp_path, video_path):
+    # Arrange
+    database_path = tmp_path / "old.db"
+    with sqlite3.connect(database_path) as connection:
+        connection.executescript((MIGRATIONS_PATH / "0001_initial.sql").read_text())
+        connection.execute(
+            "INSERT INTO video VALUES (?, 'video.mp4', '2023-05-01', 0, '0:00:02', '0:00:01')",
+            (str(video_path),),
+        )
+        connection.execute(
+            "INSERT INTO detection (videoid, starttime, endtime) VALUES (?, ?, ?)",
+            (str(video_path), "0:00:01.200000", "0:00:01.600000"),
+        )
+    connection.close()
+
+    # Act
+    with DataManager(database_path) as data_manager:
+        video = data_manager.sqlite_connection.execute(
+            "SELECT folder, fps, videolengthms, outputvideolengthms FROM video"
+        ).fetchone()
+        detection = data_manager.sqlite_connection.execute(
+            "SELECT startframe, endframe, startms, endms FROM detection"
+        ).fetchone()
+        by_month = ReportQueries(data_manager).get_detection_time_by_month()
+        version = data_manager.get_schema_version()
+
+    # Assert
+    assert video == (str(video_path.parent), 25, 2000, 1000)
+    assert detection == (30, 40, 1200, 1600)
+    assert by_month == [(str(video_path.parent), "2023-05", 400)]
+    assert version == max(
+        int(path.name.split("_")[0]) for path in MIGRATIONS_PATH.glob("*.sql")
+    )
+
+
+def test_foreign_keys_are_enforced(data_manager):
+    # Act
+    enabled = data_manager.sqlite_connection.execute("PRAGMA foreign_keys").fetchone()
+
+    # Assert
+    assert enabled == (1,)
+    with pytest.raises(sqlite3.IntegrityError):
+        with data_manager.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO detection (videoid, startframe, endframe, startms, endms) "
+                "VALUES ('missing.mp4', 0, 1, 0, 40)"
+            )
@@ -0,0 +1,81 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import shutil
+import threading
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.database_writer import DatabaseWriter
+from app.data_manager.frame_detection_store import FrameDetectionStore
+
+
+def test_writes_are_batched_and_flushed(tmp_path, video_path):
+    # Arrange
+    output_video = tmp_path / f"{video_path.stem}_processed.mp4"
+    shutil.copy(video_path, output_video)
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        with DatabaseWriter(data_manager) as database_writer:
+            # Act
+            database_writer.add_detection_data(video_path, [(0, 24)])
+            database_writer.add_video_data(video_path, video_path.name, output_video)
+            errors = database_writer.flush()
+
+            # Assert
+            assert errors == []
+            assert data_manager.get_timestamps(video_path, [(0, 24)]) == [(0, 960)]
+            rows = data_manager.sqlite_connection.execute(
+                "SELECT videolengthms, outputvideolengthms FROM video"
+            ).fetchall()
+            assert rows == [(2000, 2000)]
+            assert data_manager.detection_check(str(video_path))
+
+
+def test_writes_run_on_writer_thread(tmp_path, video_path):
+    # Arrange
+    threads = []
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        replace_detections = data_manager.replace_detections
+
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            replace_detections(*args)
+
+        data_manager.replace_detections = record_thread
+
+        # Act
+        with DatabaseWriter(data_manager) as database_writer:
+            database_writer.add_detection_data(video_path, [(0, 24)])
+
+    # Assert
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_failed_write_is_reported(tmp_path, video_path, monkeypatch):
+    # Arrange
+    reported = []
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        database_writer = DatabaseWriter(
+            data_manager,
+            on_error=lambda description, error: reported.append(description),
+        )
+
+        def fail(*args):
+            raise ValueError("Broken write")
+
+        monkeypatch.setattr(FrameDetectionStore, "replace_frame_detections", fail)
+
+        # Act
+        database_writer.add_frame_detections(
+            video_path, [(0, 1)], [[], []], (64, 48), {}
+        )
+        database_writer.add_detection_data(video_path, [(0, 24)])
+        errors = database_writer.close()
+
+        # Assert
+        assert reported == [f"frame detections of {video_path}"]
+        assert [description for description, _ in errors] == reported
+        # The other write in the batch is still committed
+        assert data_manager.detection_check(str(video_path))
@@ -0,0 +1,80 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import os
+import shutil
+
+from app.detection.detection_cache import (
+    DetectionCacheKey,
+    evict_detections,
+    load_detections,
+    save_detections,
+)
+from app.video_processor.fingerprint import fingerprint_file
+
+
+def make_key(video="video", conf_thres=0.5):
+    return DetectionCacheKey(
+        video=video,
+        weights="weights",
+        imgsz=[640, 640],
+        conf_thres=conf_thres,
+        iou_thres=0.5,
+        max_detections=100,
+        classes=None,
+        agnostic_nms=False,
+        augment=False,
+    )
+
+
+def test_fingerprint_follows_content(tmp_path, video_path):
+    # Arrange
+    copy_path = tmp_path / "copy.mp4"
+    shutil.copy(video_path, copy_path)
+    changed_path = tmp_path / "changed.mp4"
+    changed_path.write_bytes(video_path.read_bytes() + b"\0")
+
+    # Act
+    fingerprint = fingerprint_file(video_path)
+
+    # Assert
+    assert fingerprint_file(copy_path) == fingerprint
+    assert fingerprint_file(changed_path) != fingerprint
+    assert fingerprint_file(video_path, sample_count=2, sample_size=1024) != fingerprint
+
+
+def test_save_and_load_detections(tmp_path, make_prediction, class_names, class_colors):
+    # Arrange
+    predictions = [
+        [],
+        [make_prediction(0, 0.75, 1, 2, 30, 40), make_prediction(1, 0.5, 5, 6, 7, 8)],
+        [],
+    ]
+
+    # Act
+    save_detections(make_key(), predictions, tmp_path, max_bytes=1024 * 1024)
+    loaded = load_detections(make_key(), class_names, class_colors, tmp_path)
+
+    # Assert
+    assert loaded == predictions
+    assert load_detections(make_key(conf_thres=0.4), ["pike"], [], tmp_path) is None
+
+
+def test_least_recently_used_detections_are_evicted(tmp_path, make_prediction):
+    # Arrange
+    predictions = [[make_prediction(0, 0.5, 1, 2, 3, 4)]] * 100
+    for i, video in enumerate(["a", "b", "c"]):
+        save_detections(make_key(video), predictions, tmp_path, max_bytes=1 << 30)
+        path = tmp_path / f"{make_key(video).digest}.npz"
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    entry_size = os.path.getsize(tmp_path / f"{make_key('a').digest}.npz")
+
+    # Using a makes b the least recently used
+    load_detections(make_key("a"), ["pike"], [(1, 2, 3)], tmp_path)
+
+    # Act
+    evict_detections(tmp_path, 2 * entry_size)
+
+    # Assert
+    assert (tmp_path / f"{make_key('a').digest}.npz").exists()
+    assert not (tmp_path / f"{make_key('b').digest}.npz").exists()
+    assert (tmp_path / f"{make_key('c').digest}.npz").exists()
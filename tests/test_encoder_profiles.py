@@ -0,0 +1,35 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from app.video_processor.encoder_profiles import PROFILES, select_preset
+
+
+def test_options_convert_gop_to_frames():
+    options = PROFILES["review"].options(crf=23, fps=25)
+
+    assert options["crf"] == "23"
+    assert options["preset"] == "medium"
+    assert options["g"] == "50"
+    assert "tune" not in options
+
+
+def test_options_include_tune():
+    assert PROFILES["fast"].options(crf=23, fps=25)["tune"] == "fastdecode"
+
+
+def test_select_slowest_fast_enough_preset():
+    # Arrange
+    measurements = {"ultrafast": 900, "veryfast": 400, "medium": 150, "slow": 80}
+
+    # Act
+    preset = select_preset(measurements, detection_fps=50, target_fraction=0.5)
+
+    # Assert
+    assert preset == "medium"
+
+
+def test_select_fastest_preset_when_none_is_fast_enough():
+    measurements = {"ultrafast": 90, "veryfast": 40}
+
+    assert select_preset(measurements, detection_fps=50, target_fraction=0.5) == (
+        "ultrafast"
+    )
@@ -0,0 +1,151 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.frame_detection_store import FrameDetectionStore
+from app.data_manager.frame_detections import MAX_CHUNK_FRAMES, encode_frame_detections
+
+
+def test_encode_decode_round_trip(make_prediction):
+    # Arrange
+    predictions = [[] for _ in range(10)]
+    predictions[2] = [make_prediction(1, 0.5, 10, 20, 30, 40)]
+    predictions[5] = [
+        make_prediction(0, 0.9, 0, 0, 640, 480),
+        make_prediction(3, 0.25, 100.5, 200.5, 300.5, 400.5),
+    ]
+
+    # Act
+    chunks = list(encode_frame_detections([(0, 9)], predictions, 640, 480))
+
+    # Assert
+    assert len(chunks) == 1
+    chunk = chunks[0]
+    assert chunk.count == 3
+    assert len(chunk.data) == 3 * 12
+    assert chunk.frames.tolist() == [2, 5, 5]
+    assert chunk.class_ids.tolist() == [1, 0, 3]
+    assert np.allclose(chunk.confidences, [0.5, 0.9, 0.25], atol=1 / 255)
+    assert np.allclose(
+        chunk.boxes,
+        [[10, 20, 30, 40], [0, 0, 640, 480], [100.5, 200.5, 300.5, 400.5]],
+        atol=0.01,
+    )
+
+
+def test_long_ranges_are_split(make_prediction):
+    # Arrange
+    frame_count = MAX_CHUNK_FRAMES + 10
+    predictions = [None] * frame_count
+    predictions[-1] = [make_prediction(0, 1.0, 0, 0, 1, 1)]
+
+    # Act
+    chunks = list(encode_frame_detections([(0, frame_count - 1)], predictions, 64, 48))
+
+    # Assert
+    assert [(chunk.start_frame, chunk.end_frame) for chunk in chunks] == [
+        (0, MAX_CHUNK_FRAMES - 1),
+        (MAX_CHUNK_FRAMES, frame_count - 1),
+    ]
+    assert chunks[0].count == 0
+    assert chunks[1].frames.tolist() == [frame_count - 1]
+
+
+def test_store_and_read_frame_detections(tmp_path, video_path, make_prediction):
+    # Arrange
+    predictions = [[make_prediction(frame % 2, 0.5, 1, 2, 3, 4)] for frame in range(50)]
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        store = FrameDetectionStore(data_manager)
+
+        # Act
+        store.add_frame_detections(
+            video_path, [(0, 9), (20, 29)], predictions, (64, 48), {0: "a", 1: "b"}
+        )
+        # Storing again replaces the previous detections
+        store.add_frame_detections(
+            video_path, [(0, 9), (20, 29)], predictions, (64, 48), {0: "a", 1: "b"}
+        )
+        chunks = list(store.get_frame_detections(str(video_path)))
+        late_chunks = list(store.get_frame_detections(str(video_path), start_frame=15))
+        class_names = store.get_class_names(str(video_path))
+
+    # Assert
+    assert [(chunk.start_frame, chunk.end_frame) for chunk in chunks] == [
+        (0, 9),
+        (20, 29),
+    ]
+    assert chunks[1].frames.tolist() == list(range(20, 30))
+    assert chunks[1].class_ids.tolist() == [0, 1] * 5
+    assert [chunk.start_frame for chunk in late_chunks] == [20]
+    assert class_names == {0: "a", 1: "b"}
+
+
+def test_region_queries(tmp_path, video_path, make_prediction):
+    # Arrange
+    predictions = [[] for _ in range(50)]
+    # Left third of the 64x48 frame
+    predictions[5] = [make_prediction(0, 0.8, 2, 2, 10, 10)]
+    # Right half of the frame
+    predictions[6] = [make_prediction(1, 0.6, 40, 20, 60, 40)]
+    predictions[30] = [make_prediction(1, 0.7, 40, 20, 60, 40)]
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        store = FrameDetectionStore(data_manager)
+        store.add_frame_detections(
+            video_path, [(0, 49)], predictions, (64, 48), {0: "pike", 1: "perch"}
+        )
+        # Replacing the detections also replaces their index entries
+        store.add_frame_detections(
+            video_path, [(0, 49)], predictions, (64, 48), {0: "pike", 1: "perch"}
+        )
+        # Detections are stored with their video row, so the video must exist
+        other_path = Path(shutil.copy(video_path, tmp_path / "other.mp4"))
+        store.add_frame_detections(other_path, [(0, 9)], predictions, (64, 48), {})
+
+        # Act
+        left_third = list(
+            store.get_detections_in_region((0, 0, 1 / 3, 1), video_id=str(video_path))
+        )
+        right_half_count = store.count_detections_in_region(
+            (0.5, 0, 1, 1), video_id=str(video_path)
+        )
+        early_perch_count = store.count_detections_in_region(
+            video_id=str(video_path), end_frame=10, class_id=1
+        )
+        total_count = store.count_detections_in_region()
+
+    # Assert
+    assert len(left_third) == 1
+    assert left_third[0].video_id == str(video_path)
+    assert left_third[0].frame == 5
+    assert left_third[0].class_id == 0
+    assert abs(left_third[0].confidence - 0.8) < 1 / 255
+    assert np.allclose(
+        [
+            left_third[0].xmin,
+            left_third[0].ymin,
+            left_third[0].xmax,
+            left_third[0].ymax,
+        ],
+        [2, 2, 10, 10],
+        atol=0.01,
+    )
+    assert right_half_count == 2
+    assert early_perch_count == 1
+    assert total_count == 5
+
+
+def test_region_query_uses_spatial_index(tmp_path):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        plan = data_manager.sqlite_connection.execute(
+            """EXPLAIN QUERY PLAN SELECT COUNT(*) FROM detectionbox
+            JOIN framedetection ON framedetection.id = detectionbox.minchunk
+            WHERE detectionbox.maxx >= 0 AND detectionbox.minx <= 100"""
+        ).fetchall()
+
+    assert any("VIRTUAL TABLE INDEX" in row[-1] for row in plan)
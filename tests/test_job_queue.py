@@ -0,0 +1,140 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import multiprocessing
+import time
+from pathlib import Path
+
+import pytest
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.job_queue import JobQueue
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    with DataManager(tmp_path / "queue.db", journal_mode="DELETE") as data_manager:
+        yield data_manager
+
+
+def drain_queue(database_path, worker_id):
+    """Claims and completes jobs until the queue is empty, like a worker host"""
+    with DataManager(database_path, journal_mode="DELETE") as data_manager:
+        job_queue = JobQueue(data_manager, worker_id=worker_id)
+        claimed = []
+        while (job := job_queue.claim()) is not None:
+            with job_queue.lease(job, interval=0.01):
+                time.sleep(0.02)
+            assert job_queue.complete(job)
+            claimed.append(str(job.path))
+        return claimed
+
+
+def test_workers_drain_queue_without_double_processing(data_manager, tmp_path):
+    # Arrange
+    paths = [Path(f"video{i:02}.mp4") for i in range(40)]
+    JobQueue(data_manager).enqueue(paths)
+
+    # Act
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        claimed = pool.starmap(
+            drain_queue, [(tmp_path / "queue.db", f"worker{i}") for i in range(4)]
+        )
+
+    # Assert
+    all_claimed = [path for worker_claimed in claimed for path in worker_claimed]
+    assert sorted(all_claimed) == sorted(str(path) for path in paths)
+    assert JobQueue(data_manager).counts() == {"done": 40}
+
+
+def test_enqueue_ignores_queued_videos(data_manager):
+    # Arrange
+    job_queue = JobQueue(data_manager)
+
+    # Act
+    first = job_queue.enqueue([Path("a.mp4"), Path("b.mp4")])
+    second = job_queue.enqueue([Path("b.mp4"), Path("c.mp4")])
+
+    # Assert
+    assert (first, second) == (2, 1)
+
+
+def test_expired_lease_is_reclaimed(data_manager):
+    # Arrange
+    crashed = JobQueue(data_manager, worker_id="crashed", lease_seconds=0.05)
+    other = JobQueue(data_manager, worker_id="other")
+    crashed.enqueue([Path("a.mp4")])
+    job = crashed.claim()
+
+    # Act
+    before_expiry = other.claim()
+    time.sleep(0.1)
+    reclaimed = other.claim()
+
+    # Assert
+    assert before_expiry is None
+    assert reclaimed.path == job.path and reclaimed.attempt == 2
+    assert not crashed.complete(job)
+    assert other.complete(reclaimed)
+
+
+def test_heartbeats_keep_the_lease(data_manager):
+    # Arrange
+    worker = JobQueue(data_manager, worker_id="worker", lease_seconds=0.1)
+    other = JobQueue(data_manager, worker_id="other")
+    worker.enqueue([Path("a.mp4")])
+    job = worker.claim()
+
+    # Act
+    with worker.lease(job, interval=0.02) as lease:
+        time.sleep(0.3)
+        stolen = other.claim()
+
+    # Assert
+    assert stolen is None
+    assert not lease.lost.is_set()
+
+
+def test_failed_job_is_retried_then_given_up(data_manager):
+    # Arrange
+    job_queue = JobQueue(data_manager, max_attempts=2)
+    job_queue.enqueue([Path("a.mp4")])
+
+    # Act
+    job_queue.fail(job_queue.claim(), "first")
+    job_queue.fail(job_queue.claim(), "second")
+
+    # Assert
+    assert job_queue.claim() is None
+    assert job_queue.counts() == {"failed": 1}
+
+
+def test_jobs_are_claimed_in_enqueued_order(data_manager):
+    # Arrange
+    paths = [Path("c.mp4"), Path("a.mp4"), Path("b.mp4")]
+    job_queue = JobQueue(data_manager)
+    job_queue.enqueue(paths)
+
+    # Act
+    claimed = [job_queue.claim().path for _ in paths]
+
+    # Assert
+    assert claimed == paths
+
+
+def test_reclaimed_job_has_a_new_lease(data_manager):
+    # Arrange
+    worker = JobQueue(data_manager, worker_id="worker", lease_seconds=0.05)
+    worker.enqueue([Path("a.mp4")])
+    first = worker.claim()
+    time.sleep(0.1)
+    second = worker.claim()
+
+    # Act
+    completed_first = worker.complete(first)
+    completed_second = worker.complete(second)
+
+    # Assert
+    assert second.attempt == 2
+    assert not completed_first
+    assert completed_second
@@ -0,0 +1,181 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import os
+import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from app import settings
+from app.common import Common
+from app.data_manager.data_manager import DataManager
+from app.data_manager.job_queue import JobQueue
+from app.data_manager.video_summary import summarize_predictions
+from app.detection import job_runner
+from app.detection.job_runner import JobRunner, VideoResult, thread_budget
+from app.video_processor.scan import scan_videos
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        yield data_manager
+
+
+@pytest.fixture
+def weights_path(tmp_path):
+    path = tmp_path / "weights.pt"
+    path.write_bytes(b"weights")
+    return path
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch, data_manager, weights_path):
+    """A runner whose workers are threads that cut by copying the video"""
+
+    def process_video_job(video_path, output_path):
+        if video_path.stem == "broken":
+            raise RuntimeError("The worker failed")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(video_path, output_path)
+        return VideoResult(
+            video_path=video_path,
+            output_path=output_path,
+            frame_ranges=[(0, 24)],
+            statistics=summarize_predictions([[]] * 50, 1.0),
+            completed=True,
+        )
+
+    monkeypatch.setattr(job_runner, "_process_video_job", process_video_job)
+    monkeypatch.setattr(
+        job_runner,
+        "ProcessPoolExecutor",
+        lambda max_workers, **_: ThreadPoolExecutor(max_workers),
+    )
+    monkeypatch.setattr(settings, "keep_original", False)
+    return JobRunner(data_manager, tmp_path / "output", weights_path, worker_count=2)
+
+
+@pytest.fixture
+def videos(tmp_path, video_path):
+    (tmp_path / "input").mkdir()
+    for name in ("one", "two", "broken"):
+        shutil.copy(video_path, tmp_path / "input" / f"{name}.mp4")
+    return list(scan_videos(tmp_path / "input", Common.video_extensions))
+
+
+@pytest.mark.parametrize("worker_count", [1, 2, 4, 8])
+def test_thread_budget_fits_the_cores(worker_count):
+    # Act
+    budget = thread_budget(worker_count, cpu_count=32)
+
+    # Assert
+    assert budget.torch_threads * worker_count == 32
+    assert budget.encoder_threads * worker_count == 32
+    assert budget.grabber_workers * worker_count <= 32
+    assert budget.decoder_threads * worker_count <= 32
+    assert budget.opencv_threads == 1
+
+
+def test_thread_budget_with_more_workers_than_cores():
+    # Act
+    budget = thread_budget(8, cpu_count=4)
+
+    # Assert
+    assert budget.torch_threads == 1
+    assert budget.grabber_workers == 1
+    assert budget.decoder_threads == 1
+
+
+def test_run_writes_the_results(tmp_path, data_manager, runner, videos):
+    # Act
+    results = runner.run(videos)
+
+    # Assert
+    assert sorted(result.video_path.name for result in results) == [
+        "one.mp4",
+        "two.mp4",
+    ]
+    for name in ("one", "two"):
+        assert data_manager.detection_check(str(tmp_path / "input" / f"{name}.mp4"))
+        assert (tmp_path / "output" / f"{name}_processed.mp4").exists()
+        assert not (tmp_path / "input" / f"{name}.mp4").exists()
+    manifest = data_manager.sqlite_connection.execute(
+        "SELECT path FROM processedvideo ORDER BY path"
+    ).fetchall()
+    assert manifest == [
+        (str(tmp_path / "input" / "one.mp4"),),
+        (str(tmp_path / "input" / "two.mp4"),),
+    ]
+
+
+def test_run_skips_a_failed_video(tmp_path, data_manager, runner, videos):
+    # Act
+    results = runner.run(videos)
+
+    # Assert
+    assert "broken.mp4" not in [result.video_path.name for result in results]
+    assert not data_manager.detection_check(str(tmp_path / "input" / "broken.mp4"))
+    assert (tmp_path / "input" / "broken.mp4").exists()
+
+
+def test_run_keeps_the_originals_when_a_write_fails(
+    tmp_path, data_manager, runner, videos
+):
+    # Arrange
+    def replace_detections(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    data_manager.replace_detections = replace_detections
+
+    # Act
+    results = runner.run(videos)
+
+    # Assert
+    assert results == []
+    for name in ("one", "two", "broken"):
+        assert (tmp_path / "input" / f"{name}.mp4").exists()
+
+
+def process_video_or_die(video_path, output_path):
+    """Processes a video in a worker process, which dies on the broken video"""
+    if video_path.stem == "broken":
+        os._exit(1)
+    return VideoResult(
+        video_path=video_path,
+        output_path=None,
+        frame_ranges=[],
+        statistics=summarize_predictions([], 0.0),
+        completed=True,
+    )
+
+
+def test_run_queue_replaces_dead_workers(
+    tmp_path, monkeypatch, data_manager, weights_path, videos
+):
+    # Arrange
+    monkeypatch.setattr(job_runner, "_process_video_job", process_video_or_die)
+    # The workers don't load a model
+    monkeypatch.setattr(
+        job_runner,
+        "ProcessPoolExecutor",
+        lambda max_workers, mp_context, **_: ProcessPoolExecutor(
+            max_workers, mp_context
+        ),
+    )
+    # The videos are copies of each other
+    monkeypatch.setattr(settings, "skip_processed_videos", False)
+    job_queue = JobQueue(data_manager, max_attempts=1)
+    job_queue.enqueue(video.path for video in videos)
+    runner = JobRunner(data_manager, tmp_path / "output", weights_path)
+
+    # Act
+    results = runner.run_queue(job_queue)
+
+    # Assert
+    assert sorted(result.video_path.name for result in results) == [
+        "one.mp4",
+        "two.mp4",
+    ]
+    assert job_queue.counts() == {"done": 2, "failed": 1}
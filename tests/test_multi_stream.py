@@ -0,0 +1,100 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import threading
+
+import pytest
+
+from app.detection.frame_grabber import ThreadedFrameGrabber
+from app.detection.multi_stream import MultiStreamDetector
+
+
+def expected_predictions(model, video_path):
+    predictions = []
+    with ThreadedFrameGrabber(
+        batch_size=4, model=model, video_path=video_path
+    ) as frame_grabber:
+        while not frame_grabber.is_done():
+            batch = frame_grabber.get_batch()
+            if batch is not None:
+                predictions.extend([float(img)] for img in batch[0])
+    return predictions
+
+
+@pytest.fixture
+def videos(tmp_path, make_video):
+    return [
+        make_video(tmp_path / "a.mp4", 13, 0),
+        make_video(tmp_path / "b.mp4", 7, 50),
+        make_video(tmp_path / "c.mp4", 10, 100),
+    ]
+
+
+def test_batches_are_shared_and_predictions_split_per_video(videos, make_model):
+    # Arrange
+    model = make_model()
+
+    # Act
+    with MultiStreamDetector(
+        model, videos, batch_size=4, stop_event=threading.Event(), max_streams=2
+    ) as detector:
+        predictions = [detector.detect(video) for video in videos]
+
+    # Assert
+    assert predictions == [
+        expected_predictions(make_model(), video) for video in videos
+    ]
+    # 30 frames fill 7 batches, only the last is partial
+    assert model.batch_sizes == [4] * 7 + [2]
+    assert detector.frames_detected == 30
+
+
+def test_discarded_video_is_skipped(videos, make_model):
+    # Arrange
+    model = make_model()
+
+    # Act
+    with MultiStreamDetector(
+        model, videos, batch_size=4, stop_event=threading.Event()
+    ) as detector:
+        first = detector.detect(videos[0])
+        detector.discard(videos[1])
+        last = detector.detect(videos[2])
+
+        # Assert
+        with pytest.raises(KeyError):
+            detector.detect(videos[1])
+    assert len(first) == 13
+    assert last == expected_predictions(make_model(), videos[2])
+
+
+def test_detector_contains_the_videos_not_yet_collected(videos, make_model):
+    # Arrange
+    model = make_model()
+
+    # Act
+    with MultiStreamDetector(
+        model, videos[:2], batch_size=4, stop_event=threading.Event()
+    ) as detector:
+        detector.detect(videos[0])
+
+        # Assert
+        assert videos[0] not in detector
+        assert videos[1] in detector
+        assert videos[2] not in detector
+
+
+def test_stopped_detection_checkpoints_and_returns_none(videos, make_model):
+    # Arrange
+    stop_event = threading.Event()
+    stop_event.set()
+    checkpoints = []
+
+    # Act
+    with MultiStreamDetector(
+        make_model(), videos, batch_size=4, stop_event=stop_event
+    ) as detector:
+        result = detector.detect(videos[0], on_checkpoint=checkpoints.append)
+
+    # Assert
+    assert result is None
+    assert checkpoints == []
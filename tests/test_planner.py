@@ -0,0 +1,121 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import shutil
+
+import pytest
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.video_summary import summarize_predictions
+from app.detection import planner
+from app.detection.planner import (
+    DEFAULT_THROUGHPUT,
+    EtaEstimator,
+    Plan,
+    PlannedVideo,
+    Throughput,
+    measured_throughput,
+    plan_videos,
+)
+from app.video_processor.scan import ScannedVideo, stat_video
+
+THROUGHPUT = Throughput(detection_fps=25.0, cut_fps=100.0, output_fraction=0.5)
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        yield data_manager
+
+
+def planned(name, seconds):
+    return PlannedVideo(ScannedVideo(name, 0, 0), None, seconds, 0.0, 0)
+
+
+def test_measured_throughput_defaults_without_history(data_manager):
+    # Act
+    throughput = measured_throughput(data_manager)
+
+    # Assert
+    assert throughput == DEFAULT_THROUGHPUT
+
+
+def test_measured_throughput_only_counts_detection(data_manager, video_path, tmp_path):
+    # Arrange
+    cached_path = tmp_path / "cached.mp4"
+    shutil.copy(video_path, cached_path)
+    data_manager.add_detection_data(
+        video_path, [], summarize_predictions([[]] * 50, 5.0, detection_seconds=2.0)
+    )
+    data_manager.add_detection_data(
+        cached_path, [], summarize_predictions([[]] * 50, 0.1)
+    )
+
+    # Act
+    throughput = measured_throughput(data_manager)
+
+    # Assert
+    assert throughput.detection_fps == pytest.approx(25.0)
+
+
+def test_plan_videos_predicts_cost_from_frames(video_path, tmp_path, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(planner, "cached_encoder_fps", lambda *args: None)
+    broken_path = tmp_path / "broken.mp4"
+    broken_path.write_bytes(b"not a video")
+    videos = [stat_video(video_path), stat_video(broken_path)]
+
+    # Act
+    plan = plan_videos(videos, THROUGHPUT, max_workers=2)
+
+    # Assert
+    video, broken = plan.videos
+    assert video.frame_count == 50
+    assert video.detection_seconds == pytest.approx(2.0)
+    assert video.cut_seconds == pytest.approx(0.25)
+    assert video.seconds == pytest.approx(2.25)
+    assert video.output_bytes == round(videos[0].size * 0.5)
+    assert broken.info is None and broken.seconds == 0
+    assert plan.frame_count == 50
+
+
+def test_overlapped_video_costs_the_slowest_stage():
+    # Arrange
+    video = PlannedVideo(ScannedVideo("a", 0, 0), None, 3.0, 1.0, 0, overlapped=True)
+
+    # Assert
+    assert video.seconds == 3.0
+
+
+def test_longest_first_and_makespan():
+    # Arrange
+    plan = Plan(
+        [planned(name, seconds) for name, seconds in [("a", 1), ("b", 5), ("c", 3)]],
+        THROUGHPUT,
+    )
+
+    # Act
+    order = [video.video.path for video in plan.longest_first()]
+
+    # Assert
+    assert order == ["b", "c", "a"]
+    assert plan.makespan(1) == 9
+    assert plan.makespan(2) == 5
+    assert plan.makespan(8) == 5
+
+
+def test_eta_scales_plan_by_measured_speed(monkeypatch):
+    # Arrange
+    now = [100.0]
+    monkeypatch.setattr(planner.time, "time", lambda: now[0])
+    plan = Plan([planned("a", 10), planned("b", 30)], THROUGHPUT)
+    eta = EtaEstimator(plan)
+
+    # Act
+    before_start = eta.seconds_left(0, 0.0)
+    now[0] += 10  # Half of the first video took twice the planned time
+    halfway = eta.seconds_left(0, 0.5)
+
+    # Assert
+    assert before_start == 40
+    assert halfway == pytest.approx(35 * 2)
+    assert eta.seconds_left(2, 0.0) == 0
@@ -0,0 +1,38 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import pytest
+
+from app.video_processor import probe
+from app.video_processor.probe import probe_video
+
+
+def test_probe_video(video_path, tmp_path):
+    # Act
+    video_info = probe_video(video_path, tmp_path / "cache")
+
+    # Assert
+    assert video_info.fps == 25
+    assert video_info.frame_count == 50
+    assert video_info.duration == pytest.approx(2.0)
+    assert (video_info.width, video_info.height) == (64, 48)
+    assert video_info.codec == "h264"
+    assert video_info.pix_fmt == "yuv420p"
+
+
+def test_probe_video_is_cached_on_disk(video_path, tmp_path):
+    # Arrange
+    cache_folder = tmp_path / "cache"
+    expected = probe_video(video_path, cache_folder)
+    probe.__dict__["__memory_cache"].clear()
+
+    # Act
+    video_info = probe_video(video_path, cache_folder)
+
+    # Assert
+    assert len(list(cache_folder.glob("*.json"))) == 1
+    assert video_info == expected
+
+
+def test_probe_missing_video_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        probe_video(tmp_path / "missing.mp4", tmp_path / "cache")
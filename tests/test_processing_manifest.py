@@ -0,0 +1,153 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import os
+import shutil
+
+import pytest
+
+from app.data_manager.data_manager import DataManager
+from app.data_manager.processing_manifest import (
+    ProcessingManifest,
+    upsert_processed_video,
+)
+from app.video_processor.scan import output_video_path, scan_videos
+
+EXTENSIONS = (".mp4", ".avi")
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        yield data_manager
+
+
+@pytest.fixture
+def weights_path(tmp_path):
+    path = tmp_path / "weights.pt"
+    path.write_bytes(b"weights")
+    return path
+
+
+def make_tree(root):
+    (root / "b").mkdir(parents=True)
+    (root / "a" / "deep").mkdir(parents=True)
+    for path in ("top.mp4", "notes.txt", "a/one.MP4", "a/deep/two.avi", "b/three.mp4"):
+        (root / path).write_bytes(path.encode("ascii"))
+
+
+def record(data_manager, manifest, video, output_path):
+    with data_manager.transaction() as cursor:
+        upsert_processed_video(cursor, manifest.row(video, output_path))
+
+
+def test_scan_videos_top_folder_only(tmp_path):
+    # Arrange
+    make_tree(tmp_path / "videos")
+
+    # Act
+    videos = list(scan_videos(tmp_path / "videos", EXTENSIONS))
+
+    # Assert
+    assert [video.path.name for video in videos] == ["top.mp4"]
+    assert videos[0].size == len(b"top.mp4")
+
+
+def test_scan_videos_recursive(tmp_path):
+    # Arrange
+    make_tree(tmp_path / "videos")
+
+    # Act
+    videos = list(scan_videos(tmp_path / "videos", EXTENSIONS, recursive=True))
+
+    # Assert
+    assert [
+        video.path.relative_to(tmp_path / "videos").as_posix() for video in videos
+    ] == [
+        "top.mp4",
+        "a/one.MP4",
+        "a/deep/two.avi",
+        "b/three.mp4",
+    ]
+
+
+def test_output_video_path_keeps_subfolders(tmp_path):
+    # Arrange
+    make_tree(tmp_path / "videos")
+    videos = scan_videos(tmp_path / "videos", EXTENSIONS, recursive=True)
+
+    # Act
+    output_paths = [
+        output_video_path(video.path, tmp_path / "videos", tmp_path / "output")
+        for video in videos
+    ]
+
+    # Assert
+    assert [
+        path.relative_to(tmp_path / "output").as_posix() for path in output_paths
+    ] == [
+        "top_processed.mp4",
+        "a/one_processed.mp4",
+        "a/deep/two_processed.mp4",
+        "b/three_processed.mp4",
+    ]
+
+
+def test_manifest_skips_processed_video_with_output(
+    data_manager, weights_path, video_path, tmp_path
+):
+    # Arrange
+    manifest = ProcessingManifest(data_manager, tmp_path / "output", weights_path)
+    video = next(scan_videos(video_path.parent, EXTENSIONS))
+    output_path = tmp_path / "output.mp4"
+    output_path.write_bytes(b"output")
+
+    # Act
+    before = manifest.is_current(video)
+    record(data_manager, manifest, video, output_path)
+    after = manifest.is_current(video)
+    output_path.unlink()
+    without_output = manifest.is_current(video)
+
+    # Assert
+    assert not before
+    assert after
+    assert not without_output
+
+
+def test_manifest_matches_moved_video_by_content(
+    data_manager, weights_path, video_path, tmp_path
+):
+    # Arrange
+    manifest = ProcessingManifest(data_manager, tmp_path / "output", weights_path)
+    record(
+        data_manager, manifest, next(scan_videos(video_path.parent, EXTENSIONS)), None
+    )
+    (tmp_path / "moved").mkdir()
+    shutil.copy(video_path, tmp_path / "moved" / "copy.mp4")
+
+    # Act
+    moved = next(scan_videos(tmp_path / "moved", EXTENSIONS))
+
+    # Assert
+    assert ProcessingManifest(
+        data_manager, tmp_path / "output", weights_path
+    ).is_current(moved)
+
+
+def test_manifest_reprocesses_on_changes(
+    data_manager, weights_path, video_path, tmp_path
+):
+    # Arrange
+    manifest = ProcessingManifest(data_manager, tmp_path / "output", weights_path)
+    video = next(scan_videos(video_path.parent, EXTENSIONS))
+    record(data_manager, manifest, video, None)
+
+    # Act
+    other_output = ProcessingManifest(data_manager, tmp_path / "other", weights_path)
+    weights_path.write_bytes(b"retrained")
+    os.utime(weights_path, ns=(1, 1))
+    other_model = ProcessingManifest(data_manager, tmp_path / "output", weights_path)
+
+    # Assert
+    assert not other_output.is_current(video)
+    assert not other_model.is_current(video)
@@ -0,0 +1,63 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from app.video_processor.range_scheduler import (
+    ScheduledRange,
+    keyframe_before,
+    schedule_frame_ranges,
+)
+
+
+def test_keyframe_before():
+    keyframes = [0, 50, 100]
+
+    assert keyframe_before(0, keyframes) == 0
+    assert keyframe_before(49, keyframes) == 0
+    assert keyframe_before(50, keyframes) == 50
+    assert keyframe_before(250, keyframes) == 100
+    assert keyframe_before(10, []) is None
+
+
+def test_first_range_always_seeks():
+    # Act
+    schedule = schedule_frame_ranges([(500, 600)], [0, 250, 500])
+
+    # Assert
+    assert schedule == [ScheduledRange(500, 600, seek=True)]
+
+
+def test_small_gap_decodes_through():
+    # Act
+    schedule = schedule_frame_ranges([(10, 20), (25, 40)], [0, 250], 30)
+
+    # Assert
+    assert [scheduled.seek for scheduled in schedule] == [True, False]
+
+
+def test_same_gop_never_seeks():
+    # The keyframe before the second range is behind the end of the first range
+    schedule = schedule_frame_ranges([(10, 20), (200, 210)], [0, 250], 0)
+
+    assert [scheduled.seek for scheduled in schedule] == [True, False]
+
+
+def test_large_gap_seeks():
+    # Act
+    schedule = schedule_frame_ranges([(10, 20), (1010, 1020)], [0, 250, 1000], 30)
+
+    # Assert
+    assert [scheduled.seek for scheduled in schedule] == [True, True]
+
+
+def test_gap_cheaper_than_decoding_from_keyframe():
+    # Seeking would land on frame 360 and decode 140 frames, the gap is only 150
+    schedule = schedule_frame_ranges([(10, 349), (500, 510)], [0, 360], 30)
+
+    assert [scheduled.seek for scheduled in schedule] == [True, False]
+
+
+def test_unknown_keyframes_uses_gap_against_fixed_cost():
+    # Act
+    schedule = schedule_frame_ranges([(0, 10), (20, 30), (500, 510)], [], 30)
+
+    # Assert
+    assert [scheduled.seek for scheduled in schedule] == [True, False, True]
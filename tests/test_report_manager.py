@@ -0,0 +1,225 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import csv
+import shutil
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+import pytest
+
+from app import settings
+from app.data_manager.data_manager import DataManager
+from app.data_manager.frame_detection_store import FrameDetectionStore
+from app.data_manager.video_summary import summarize_predictions
+from app.report_manager.report_manager import ReportManager
+from app.report_manager.thumbnails import extract_thumbnails
+
+
+@pytest.fixture
+def report_manager(tmp_path, video_path, monkeypatch):
+    with DataManager(tmp_path / "database.db") as data_manager:
+        data_manager.add_video_data(video_path, video_path.name, None)
+        data_manager.add_detection_data(video_path, [(0, 25), (30, 40)])
+
+        def make_report_manager(report_format):
+            monkeypatch.setattr(settings, "report_format", report_format)
+            return ReportManager(tmp_path, data_manager)
+
+        yield make_report_manager
+
+
+def test_write_csv_file(report_manager, tmp_path, video_path):
+    # Act
+    report_manager("CSV").write_report([str(video_path)])
+
+    # Assert
+    with open(tmp_path / "Processing_report.csv", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0][0] == "Video"
+    assert rows[1][0] == video_path.name
+    assert rows[3] == ["Video", "detectionID", "Start", "End"]
+    assert [row[2:] for row in rows[4:]] == [
+        ["0:00:00", "0:00:01"],
+        ["0:00:01.200000", "0:00:01.600000"],
+    ]
+
+
+def test_write_xml_file(report_manager, tmp_path, video_path):
+    # Act
+    report_manager("XML").write_report([str(video_path)])
+
+    # Assert
+    root = ElementTree.parse(tmp_path / "Processing_report.xml").getroot()
+    assert root.tag == "FishDetections"
+    (video,) = root.findall("Video")
+    assert video.get("title") == video_path.name
+    assert [detection.get("starttime") for detection in video] == [
+        "0:00:00",
+        "0:00:01.200000",
+    ]
+
+
+def test_write_xlsx_file(report_manager, tmp_path, video_path):
+    # Act
+    report_manager("XLSX").write_report([str(video_path)])
+
+    # Assert
+    with zipfile.ZipFile(tmp_path / "Processing_report.xlsx") as workbook:
+        summary_sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        detection_sheet = workbook.read("xl/worksheets/sheet2.xml").decode()
+    assert video_path.name in summary_sheet
+    assert "0:00:01.200000" in detection_sheet
+
+
+def test_write_pdf_file(report_manager, tmp_path, video_path, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(settings, "report_thumbnails", True)
+
+    # Act
+    report_manager("PDF").write_report([str(video_path)])
+
+    # Assert
+    with open(tmp_path / "Processing_report.pdf", "rb") as file:
+        pdf = file.read()
+    assert pdf.startswith(b"%PDF")
+    # One thumbnail image per detection
+    assert pdf.count(b"/Subtype /Image") == 2
+
+
+def test_extract_thumbnails(tmp_path, video_path):
+    # Act
+    thumbnails = extract_thumbnails(
+        [(str(video_path), 1, 0), (str(video_path), 2, 30), ("missing.mp4", 3, 0)],
+        tmp_path,
+        height=24,
+    )
+
+    # Assert
+    assert sorted(thumbnails) == [1, 2]
+    assert all(path.exists() for path in thumbnails.values())
+
+
+@pytest.mark.parametrize("report_format", ["CSV", "XML"])
+def test_incremental_report_appends_new_videos(
+    tmp_path, video_path, monkeypatch, report_format
+):
+    # Arrange
+    monkeypatch.setattr(settings, "incremental_report", True)
+    monkeypatch.setattr(settings, "report_format", report_format)
+    other_path = tmp_path / "other.mp4"
+    other_path.write_bytes(video_path.read_bytes())
+    report_path = tmp_path / f"Processing_report.{report_format.lower()}"
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        report_manager = ReportManager(tmp_path, data_manager)
+        data_manager.add_video_data(video_path, video_path.name, None)
+        data_manager.add_detection_data(video_path, [(0, 25)])
+        report_manager.write_report([str(video_path)])
+        first_report = report_path.read_bytes()
+
+        # Act
+        data_manager.add_video_data(other_path, other_path.name, None)
+        data_manager.add_detection_data(other_path, [(5, 10)])
+        report_manager.write_report([str(video_path), str(other_path)])
+        # Nothing new to add
+        report_manager.write_report([str(other_path)])
+
+    # Assert
+    report = report_path.read_bytes()
+    if report_format == "CSV":
+        assert report.startswith(first_report)
+        assert report.count(video_path.name.encode()) == 2
+        assert report.count(other_path.name.encode()) == 2
+    else:
+        root = ElementTree.parse(report_path).getroot()
+        assert [video.get("title") for video in root] == [
+            video_path.name,
+            other_path.name,
+        ]
+
+
+def test_videos_with_the_same_name_are_reported_by_id(
+    tmp_path, video_path, monkeypatch
+):
+    # Arrange
+    monkeypatch.setattr(settings, "report_format", "XML")
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first_path = Path(shutil.copy(video_path, tmp_path / "a" / video_path.name))
+    second_path = Path(shutil.copy(video_path, tmp_path / "b" / video_path.name))
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        for path, ranges in ((first_path, [(0, 25)]), (second_path, [(5, 10)])):
+            data_manager.add_video_data(path, path.name, None)
+            data_manager.add_detection_data(path, ranges)
+
+        # Act
+        ReportManager(tmp_path, data_manager).write_report([str(second_path)])
+
+    # Assert
+    (video,) = ElementTree.parse(tmp_path / "Processing_report.xml").getroot()
+    assert [detection.get("starttime") for detection in video] == ["0:00:00.200000"]
+
+
+def test_incremental_report_is_rebuilt_when_changed(tmp_path, video_path, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(settings, "incremental_report", True)
+    monkeypatch.setattr(settings, "report_format", "XML")
+    report_path = tmp_path / "Processing_report.xml"
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        report_manager = ReportManager(tmp_path, data_manager)
+        data_manager.add_video_data(video_path, video_path.name, None)
+        data_manager.add_detection_data(video_path, [(0, 25)])
+        report_manager.write_report([str(video_path)])
+        report_path.write_text("edited")
+
+        # Act
+        report_manager.write_report([str(video_path)])
+
+    # Assert
+    root = ElementTree.parse(report_path).getroot()
+    assert [video.get("title") for video in root] == [video_path.name]
+
+
+def test_write_parquet_file(tmp_path, video_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    # Arrange
+    monkeypatch.setattr(settings, "report_format", "PARQUET")
+    predictions = [[] for _ in range(50)]
+    predictions[3] = [
+        {
+            "class_id": 1,
+            "conf": 0.5,
+            "bndbox": {"xmin": 1, "ymin": 2, "xmax": 3, "ymax": 4},
+        }
+    ]
+
+    with DataManager(tmp_path / "database.db") as data_manager:
+        data_manager.add_video_data(video_path, video_path.name, None)
+        data_manager.add_detection_data(
+            video_path,
+            [(0, 25), (30, 40)],
+            summarize_predictions([[{"name": "pike", "conf": 0.5}]], 1.0),
+        )
+        FrameDetectionStore(data_manager).add_frame_detections(
+            video_path, [(0, 25)], predictions, (64, 48), {1: "pike"}
+        )
+
+        # Act
+        ReportManager(tmp_path, data_manager).write_report([str(video_path)])
+
+    # Assert
+    ranges = pq.read_table(tmp_path / "Processing_report.parquet").to_pylist()
+    assert [(row["start_ms"], row["end_ms"]) for row in ranges] == [
+        (0, 1000),
+        (1200, 1600),
+    ]
+    (video,) = pq.read_table(tmp_path / "Processing_report_videos.parquet").to_pylist()
+    assert video["length_ms"] == 2000
+    assert video["class_counts"] == [("pike", 1)]
+    (frame,) = pq.read_table(tmp_path / "Processing_report_frames.parquet").to_pylist()
+    assert frame["frame"] == 3
+    assert frame["class_name"] == "pike"
@@ -0,0 +1,45 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from app.detection import detection
+from app.detection.threshold_sweep import sweep_thresholds
+
+
+def make_predictions(confidences):
+    return [[{"conf": conf}] if conf is not None else [] for conf in confidences]
+
+
+def test_filter_predictions():
+    # Arrange
+    predictions = [[{"conf": 0.3}, {"conf": 0.6}], [], None, [{"conf": 0.5}]]
+
+    # Act
+    filtered = detection.filter_predictions(predictions, 0.5)
+
+    # Assert
+    assert filtered == [[{"conf": 0.6}], [], [], [{"conf": 0.5}]]
+    assert detection.frames_with_detections(filtered) == [0, 3]
+
+
+def test_add_buffer_to_ranges_merges_overlaps():
+    assert detection.add_buffer_to_ranges(
+        [(10, 20), (25, 30), (80, 90)], 5, 95, 1, 1
+    ) == [
+        (5, 35),
+        (75, 95),
+    ]
+
+
+def test_sweep_thresholds():
+    # Arrange
+    # 10 FPS, a confident detection at frames 0-9 and a weak one at frames 50-59
+    predictions = make_predictions([0.9] * 10 + [None] * 40 + [0.4] * 10 + [None] * 40)
+
+    # Act
+    results = sweep_thresholds(predictions, [30, 50, 95], 10, 1, 0, 0)
+
+    # Assert
+    assert [
+        (result.threshold, result.frames_with_fish, result.range_count)
+        for result in results
+    ] == [(30, 20, 2), (50, 10, 1), (95, 0, 0)]
+    assert [result.output_seconds for result in results] == [2.0, 1.0, 0.0]
@@ -0,0 +1,44 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from fractions import Fraction
+
+import numpy as np
+
+from app.video_processor.video_index import VideoIndex
+
+
+def create_index():
+    # Variable frame rate: 40 ms between the first frames, then 80 ms
+    return VideoIndex(
+        time_base=Fraction(1, 1000),
+        pts=np.asarray([0, 40, 80, 160, 240, 320], dtype=np.int64),
+        keyframe=np.asarray([True, False, False, True, False, False]),
+        offset=np.arange(6, dtype=np.int64) * 100,
+    )
+
+
+def test_frame_count():
+    assert create_index().frame_count == 6
+
+
+def test_keyframes():
+    assert create_index().keyframes == [0, 3]
+
+
+def test_timestamp_frame_round_trip():
+    index = create_index()
+
+    for frame in range(index.frame_count):
+        assert index.timestamp_to_frame(index.frame_to_timestamp(frame)) == frame
+
+
+def test_timestamp_between_frames_maps_to_earlier_frame():
+    assert create_index().timestamp_to_frame(200) == 3
+
+
+def test_keyframe_timestamp_before():
+    index = create_index()
+
+    assert index.keyframe_timestamp_before(2) == 0
+    assert index.keyframe_timestamp_before(3) == 160
+    assert index.keyframe_timestamp_before(5) == 160